@@ -8,17 +8,25 @@ ArduPilot SITL instance.
 This application also provides the option to introduce random failures to train
 operators for emergency procedures.
 """
+# Imported first so import and startup timings start close to process start
+from modules import startup
+import contextlib
 import os
 import tkinter as tk
 from tkinter import ttk
+from tkinter import messagebox
 import configparser
 from collections import OrderedDict
-import subprocess
-import threading
-from modules import realflight 
 from modules import versioncheck
+from modules import sitl
+from modules import console
+from modules import consoleview
+from modules import eventloop
+from modules import catalog
+from modules import failures
+from modules import supervisor
+from modules import tracing
 from __init__ import __version__
-import webbrowser
 
 print('Starting SITL Launcher...')
 
@@ -28,43 +36,27 @@ class App(tk.Tk):
     for the widgets.
     """
     def __init__(self):
+        startup.profile.mark('imports done')
         super().__init__()
 
+        # Results of the I/O on the event loop, applied on the Tk thread
+        self.bridge = eventloop.UiBridge()
+
         # Create the root window
         self.title('SITL Launcher')
 
-        # Load options in config.ini
-        self.config = configparser.ConfigParser(dict_type=OrderedDict)
-        self.config.read('config\config.ini')
+        with startup.profile.phase('config parse'):
+            self.load_config()
 
-        self.aircraft_list = []
-        self.aircraft_keys = {} # Maps aircraft name to key for folder names
-        self.versions = {}
-        self.airport_list = []
-        self.locations = {}
-        # Loop through config and fill the aircraft and airport information
-        for category in self.config:
-            item = self.config[category]
-            if 'type' in item and item['type'] == 'aircraft':
-                self.aircraft_list.append(item['name'])
-                if item['name'] in self.aircraft_keys:
-                    raise Exception('Duplicate aircraft name: {}'.format(item['name']))
-                self.aircraft_keys[item['name']] = category
-                self.versions[item['name']] = ''.join(
-                    item['versions'].split()).split(',')
-            if 'type' in item and item['type'] == 'airport':
-                self.airport_list.append(item['name'])
-                self.locations[item['name']] = item['location']
-
-        # Sort the lists alphabetically
-        self.aircraft_list.sort()
-        self.airport_list.sort()
-
-        # Create a dictionary to hold the selected options
-        self.selected = self.config['selected']
+        # Create a list to hold the fleet entries: aircraft, version, airport
+        # and number of instances
+        self.fleet_entries = []
 
         # Create the widgets
-        self.create_widgets()
+        with startup.profile.phase('create widgets'):
+            self.create_widgets()
+        # Record when the window is first drawn
+        self.bind('<Map>', self.on_first_paint)
 
         # Bind close handler
         self.protocol('WM_DELETE_WINDOW', self.on_closing)
@@ -75,13 +67,52 @@ class App(tk.Tk):
         # Flag to indicate if we have launched headless
         self.headless = False
 
-        # Create member to hold ArduPilot subprocess
-        self.ardupilot_process = None
-        self.ardupilot_thread = None
+        # Create member to hold the running ArduPilot instances and their
+        # console tabs, keyed by instance number
+        self.fleet = sitl.Fleet()
+        self.tabs = {}
+        # Instances being rebooted, and whether a launch waits for the
+        # previous instances to stop
+        self.rebooting = set()
+        self.launch_pending = False
+        # Set once the window is closing, the frame loops stop then
+        self.closing = False
+
+        # Flush console output in batches at a fixed frame rate
+        self.after(console.FRAME_MS, self.flush_consoles)
+        # Sample the resource usage of the instances less often
+        self.after(int(supervisor.SAMPLE_INTERVAL * 1000),
+                   self.sample_instances)
 
         # Start the event loop
         self.mainloop()
 
+    def load_config(self):
+        """Load options in config.ini and the validated catalog"""
+        self.config = configparser.ConfigParser(dict_type=OrderedDict)
+        self.config.read('config\config.ini')
+
+        # The catalog only lists what is installed, and is read from its
+        # index unless config.ini or the installed files changed
+        self.catalog = catalog.Catalog.load()
+        for problem in self.catalog.problems:
+            print('Not available: {}'.format(problem))
+        self.aircraft_list = self.catalog.aircraft_list
+        self.aircraft_keys = self.catalog.aircraft_keys # Maps aircraft name to key for folder names
+        self.versions = self.catalog.versions
+        self.airport_list = self.catalog.airport_list
+
+        # Create a dictionary to hold the selected options
+        self.selected = self.config['selected']
+        # Replace selections that are no longer available
+        if self.selected.get('aircraft') not in self.aircraft_list:
+            self.selected['aircraft'] = (self.aircraft_list or [''])[0]
+        versions = self.versions.get(self.selected['aircraft'], [])
+        if self.selected.get('version') not in versions:
+            self.selected['version'] = (versions or [''])[0]
+        if self.catalog.location(self.selected.get('airport', '')) is None:
+            self.selected['airport'] = (self.airport_list or [''])[0]
+
     def aircraft_selected(self, _):
         """Update the version combobox when the aircraft is changed"""
         # Get the selected aircraft and version
@@ -100,8 +131,25 @@ class App(tk.Tk):
         self.selected['version'] = self.version_cmb.get()
 
     def airport_selected(self, _):
-        """Update selected when the airport is changed"""
-        self.selected['airport'] = self.airport_cmb.get()
+        """
+        Update selected when an airport is picked or typed in full, going
+        back to the selected airport if the text is not a known airport
+        """
+        airport = self.airport_cmb.get()
+        if self.catalog.location(airport) is not None:
+            self.selected['airport'] = airport
+        self.airport_cmb.set(self.selected['airport'])
+
+    def airport_typed(self, event):
+        """List the airports matching the text typed so far"""
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        self.airport_cmb['values'] = self.catalog.search_airports(
+            self.airport_cmb.get())
+
+    def record_selected(self):
+        """Update selected when telemetry recording is toggled"""
+        self.selected['telemetry'] = 'yes' if self.record_var.get() else 'no'
 
     def create_widgets(self):
         """Create the GUI for the application"""
@@ -114,10 +162,12 @@ class App(tk.Tk):
         aircraft_frame = ttk.LabelFrame(self.controls_frame, text='Aircraft')
         environment_frame = ttk.LabelFrame(self.controls_frame, text='Environment')
         failure_frame = ttk.LabelFrame(self.controls_frame, text='Failure')
+        fleet_frame = ttk.LabelFrame(self.controls_frame, text='Fleet')
         # Give the first column in each frame a fixed width
         aircraft_frame.columnconfigure(0, minsize=110)
         environment_frame.columnconfigure(0, minsize=110)
         failure_frame.columnconfigure(0, minsize=110)
+        fleet_frame.columnconfigure(0, minsize=110)
 
         # Aircraft frame
         # Aircraft selection
@@ -130,7 +180,7 @@ class App(tk.Tk):
         version_label = ttk.Label(aircraft_frame, text='ArduPilot Version:')
         self.version_cmb = ttk.Combobox(
             aircraft_frame,
-            values=self.versions[self.selected['aircraft']],
+            values=self.versions.get(self.selected['aircraft'], []),
             state='readonly')
         self.version_cmb.set(self.selected['version'])
         self.version_cmb.bind('<<ComboboxSelected>>', self.version_selected)
@@ -143,44 +193,100 @@ class App(tk.Tk):
         # Environment frame
         # Airport selection
         airport_label = ttk.Label(environment_frame, text='Airport:')
+        # Typing searches config.ini and the imported airport database
         self.airport_cmb = ttk.Combobox(
-            environment_frame, values=self.airport_list, state='readonly')
+            environment_frame, values=self.catalog.search_airports(''))
         self.airport_cmb.set(self.selected['airport'])
         self.airport_cmb.bind('<<ComboboxSelected>>', self.airport_selected)
+        self.airport_cmb.bind('<Return>', self.airport_selected)
+        self.airport_cmb.bind('<KeyRelease>', self.airport_typed)
         # Weather selection
+        # Telemetry recording of every launched instance
+        record_label = ttk.Label(environment_frame, text='Telemetry:')
+        self.record_var = tk.BooleanVar(
+            value=self.selected.getboolean('telemetry', fallback=False))
+        record_chk = ttk.Checkbutton(
+            environment_frame, text='Record', variable=self.record_var,
+            command=self.record_selected)
 
         # Pack the widgets in the environment frame
         airport_label.grid(row=0, column=0, sticky='e')
         self.airport_cmb.grid(row=0, column=1)
+        record_label.grid(row=1, column=0, sticky='e')
+        record_chk.grid(row=1, column=1, sticky='w')
 
         # Create two buttons: Launch Headless and Launch RealFlight
         headless_but = ttk.Button(self.controls_frame, text='Launch Headless')
         realflight_but = ttk.Button(self.controls_frame, text='Launch RealFlight')
 
-        # Create textbox to display console output as read-only
-        self.console = tk.Text(self.console_frame, wrap='none', state='disabled')
-        # Show both vertical and horizontal scrollbars
-        console_scrollx = ttk.Scrollbar(
-            self.console_frame, orient='horizontal', command=self.console.xview)
-        self.console['xscrollcommand'] = console_scrollx.set
-        console_scrolly = ttk.Scrollbar(
-            self.console_frame, orient='vertical', command=self.console.yview)
-        self.console['yscrollcommand'] = console_scrolly.set
-        # Place the console and scrollbars with grid
-        self.console.grid(row=0, column=0, columnspan=2, sticky='nsew')
-        console_scrolly.grid(row=0, column=2, sticky='ns')
-        console_scrollx.grid(row=1, column=0, columnspan=2, sticky='ew')
-        # Create two buttons: Stop and Reboot
-        stop_but = ttk.Button(self.console_frame, text='Stop')
-        reboot_but = ttk.Button(self.console_frame, text='Reboot')
-        # Handlers
-        stop_but['command'] = self.stop_sitl
-        reboot_but['command'] = self.launch_sitl
-        # Place them on the bottom of the console frame
-        stop_but.grid(row=2, column=0, sticky='sew', ipady=10)
-        reboot_but.grid(row=2, column=1, sticky='sew', ipady=10)
-        self.console_frame.columnconfigure(0, weight=1)
-        self.console_frame.columnconfigure(1, weight=1)
+        # Failure frame
+        # Random failures from a seed, so a scenario can be replayed
+        failures_label = ttk.Label(failure_frame, text='Failures:')
+        self.failures_lst = tk.Listbox(
+            failure_frame, height=len(failures.FAILURES),
+            selectmode='multiple', exportselection=False)
+        for name in failures.FAILURES:
+            self.failures_lst.insert('end', name)
+        failure_count_label = ttk.Label(failure_frame, text='Count:')
+        self.failure_count_spn = ttk.Spinbox(
+            failure_frame, from_=0, to=len(failures.FAILURES), width=5)
+        self.failure_count_spn.set(0)
+        failure_start_label = ttk.Label(failure_frame, text='Start after (s):')
+        self.failure_start_spn = ttk.Spinbox(
+            failure_frame, from_=0, to=3600, increment=10, width=5)
+        self.failure_start_spn.set(60)
+        failure_within_label = ttk.Label(failure_frame, text='Within (s):')
+        self.failure_within_spn = ttk.Spinbox(
+            failure_frame, from_=0, to=3600, increment=10, width=5)
+        self.failure_within_spn.set(300)
+        failure_clear_label = ttk.Label(failure_frame, text='Clear after (s):')
+        self.failure_clear_spn = ttk.Spinbox(
+            failure_frame, from_=0, to=3600, increment=10, width=5)
+        self.failure_clear_spn.set(0)
+        seed_label = ttk.Label(failure_frame, text='Seed:')
+        self.seed_ent = ttk.Entry(failure_frame, width=10)
+        # Pack the widgets in the failure frame
+        failures_label.grid(row=0, column=0, sticky='ne')
+        self.failures_lst.grid(row=0, column=1, sticky='ew')
+        failure_count_label.grid(row=1, column=0, sticky='e')
+        self.failure_count_spn.grid(row=1, column=1, sticky='w')
+        failure_start_label.grid(row=2, column=0, sticky='e')
+        self.failure_start_spn.grid(row=2, column=1, sticky='w')
+        failure_within_label.grid(row=3, column=0, sticky='e')
+        self.failure_within_spn.grid(row=3, column=1, sticky='w')
+        failure_clear_label.grid(row=4, column=0, sticky='e')
+        self.failure_clear_spn.grid(row=4, column=1, sticky='w')
+        seed_label.grid(row=5, column=0, sticky='e')
+        self.seed_ent.grid(row=5, column=1, sticky='w')
+
+        # Fleet frame
+        # Launch several headless instances at once, each with its own
+        # instance number, ports and console tab
+        count_label = ttk.Label(fleet_frame, text='Instances:')
+        self.count_spn = ttk.Spinbox(
+            fleet_frame, from_=1, to=os.cpu_count() or 1, width=5)
+        self.count_spn.set(1)
+        add_but = ttk.Button(fleet_frame, text='Add', command=self.fleet_add)
+        self.fleet_lst = tk.Listbox(fleet_frame, height=4)
+        clear_but = ttk.Button(
+            fleet_frame, text='Clear', command=self.fleet_clear)
+        fleet_but = ttk.Button(
+            fleet_frame, text='Launch Fleet', command=self.launch_fleet)
+        # Pack the widgets in the fleet frame
+        count_label.grid(row=0, column=0, sticky='e')
+        self.count_spn.grid(row=0, column=1, sticky='w')
+        add_but.grid(row=0, column=1, sticky='e')
+        self.fleet_lst.grid(row=1, column=0, columnspan=2, sticky='ew')
+        clear_but.grid(row=2, column=0, sticky='ew')
+        fleet_but.grid(row=2, column=1, sticky='ew')
+
+        # Create a notebook with one console tab per running instance
+        self.console_tabs = ttk.Notebook(self.console_frame)
+        self.console_tabs.grid(row=0, column=0, sticky='nsew')
+        # Create a button to stop every instance
+        stop_all_but = ttk.Button(
+            self.console_frame, text='Stop All', command=self.stop_sitl)
+        stop_all_but.grid(row=1, column=0, sticky='sew', ipady=10)
 
         # Configure the console frame to expand with the window
         self.console_frame.rowconfigure(0, weight=1)
@@ -190,10 +296,11 @@ class App(tk.Tk):
         aircraft_frame.grid(row=0, column=0, columnspan=2, sticky='ew')
         environment_frame.grid(row=1, column=0, columnspan=2, sticky='ew')
         failure_frame.grid(row=2, column=0, columnspan=2, sticky='ew')
+        fleet_frame.grid(row=3, column=0, columnspan=2, sticky='ew')
         # Pack buttons side by side on bottom
-        self.controls_frame.rowconfigure(3, weight=1)
-        headless_but.grid(row=3, column=0, sticky='sew')
-        realflight_but.grid(row=3, column=1, sticky='sew')
+        self.controls_frame.rowconfigure(4, weight=1)
+        headless_but.grid(row=4, column=0, sticky='sew')
+        realflight_but.grid(row=4, column=1, sticky='sew')
 
         # # Create a button that shows the pop-up when clicked
         # button = ttk.Button(self.controls_frame, text="Show Pop-up", command=self.show_popup)
@@ -206,44 +313,341 @@ class App(tk.Tk):
         # Click handlers
         headless_but['command'] = self.launch_headless
         realflight_but['command'] = self.launch_realflight
-        if versioncheck.check_for_updates(__version__, 'loki077', 'SITL-Launcher'):
+
+    def update_checked(self, update_check):
+        """Show the update popup once the background check has finished"""
+        startup.profile.mark('update check')
+        self.write_startup_profile()
+        if update_check.exception() is None and update_check.result():
             self.show_new_version_popup()
 
+    def on_first_paint(self, event):
+        """Record the time to the first drawn window"""
+        if event.widget is not self:
+            return
+        self.unbind('<Map>')
+        startup.profile.mark('first paint')
+        self.write_startup_profile()
+        # Check for updates in the background so a slow or missing network
+        # never delays the window. It starts the event loop, so it waits
+        # until the window is drawn.
+        update_check = versioncheck.check_for_updates_async(
+            __version__, 'loki077', 'SITL-Launcher')
+        update_check.add_done_callback(
+            lambda future: self.bridge.post(self.update_checked, future))
+
+    def write_startup_profile(self):
+        """Write the startup profile once the window and update check are done"""
+        marks = startup.profile.marks
+        if ('first paint' in marks and 'update check' in marks
+                and not startup.profile.written):
+            startup.profile.write()
+
 
     def launch_headless(self):
         """Launch SITL headless"""
         # Set headless flag
         self.headless = True
-        self.launch_sitl()
+        if self.check_available(self.headless):
+            self.launch_sitl()
 
     def launch_realflight(self):
         """Launch SITL in RealFlight"""
         # Clear headless flag
         self.headless = False
 
-        self.launch_sitl()
+        if self.check_available(self.headless):
+            self.launch_sitl()
+
+    def check_available(self, headless):
+        """Check the selected aircraft version is installed for this mode"""
+        if self.catalog.available(
+                self.selected['aircraft'], self.selected['version'], headless):
+            return True
+        messagebox.showerror('SITL Launcher', '{} {} is not installed for {}'.format(
+            self.selected['aircraft'], self.selected['version'],
+            'headless' if headless else 'RealFlight'))
+        return False
 
     def launch_sitl(self):
-        """Launch SITL"""
+        """Launch a single SITL instance with the selected options"""
+        if self.launch_pending:
+            return
+        trace = tracing.LaunchTrace('launch', airport=self.selected['airport'])
+        self.launch_pending = True
+        self.kill_sitl(lambda: self.launch_single(trace), trace)
+
+    def launch_single(self, trace):
+        """Launch a single instance, once the previous ones have stopped"""
+        self.launch_pending = False
+        sitl_instance = self.add_instance(
+            self.selected['aircraft'], self.selected['version'],
+            self.selected['airport'], self.headless)
+        sitl_instance.begin_trace('launch', trace)
+
+        if self.headless:
+            self.start_instances([sitl_instance])
+            return
+
+        # If RealFlight, reset aircraft on the event loop first, and start
+        # SITL once it replied without blocking the window meanwhile
+        async def reset_then_start():
+            try:
+                await self.reset_realflight(sitl_instance, trace)
+            finally:
+                self.bridge.post(self.start_instances, [sitl_instance])
+        eventloop.get_loop().submit(reset_then_start())
+
+    async def reset_realflight(self, sitl_instance, trace=None):
+        """
+        Reset the RealFlight aircraft, reporting failures in the console.
+        Runs on the event loop.
+        """
+        # Not needed for the first window, so imported on first use
+        from modules import realflight
+        phase = trace.phase('realflight reset') if trace is not None \
+            else contextlib.nullcontext()
+        try:
+            with phase:
+                await realflight.reset_aircraft_async()
+        except (OSError, EOFError, realflight.SoapError) as err:
+            sitl_instance.output.put('RealFlight reset failed: {}'.format(err))
+
+    def fleet_add(self):
+        """Add the selected options to the fleet"""
+        if not self.check_available(True):
+            return False
+        try:
+            count = max(1, int(self.count_spn.get()))
+        except ValueError:
+            count = 1
+        entry = (self.selected['aircraft'], self.selected['version'],
+                 self.selected['airport'], count)
+        self.fleet_entries.append(entry)
+        self.fleet_lst.insert('end', '{} {} @ {} x{}'.format(*entry))
+        return True
+
+    def fleet_clear(self):
+        """Remove all entries from the fleet"""
+        self.fleet_entries = []
+        self.fleet_lst.delete(0, 'end')
+
+    def launch_fleet(self):
+        """
+        Launch every fleet entry headless. RealFlight can only drive a single
+        FlightAxis link, so fleet instances always use the built-in model.
+        """
+        if not self.fleet_entries and not self.fleet_add():
+            return
+        if self.launch_pending:
+            return
+        self.launch_pending = True
+        self.kill_sitl(self.launch_fleet_entries)
+
+    def launch_fleet_entries(self):
+        """Launch the fleet entries, once the previous instances have stopped"""
+        self.launch_pending = False
+        instances = []
+        for aircraft, version, airport, count in self.fleet_entries:
+            for _ in range(count):
+                sitl_instance = self.add_instance(
+                    aircraft, version, airport, True)
+                sitl_instance.begin_trace('fleet', tracing.LaunchTrace(
+                    'fleet', airport=airport))
+                instances.append(sitl_instance)
+
+        self.start_instances(instances)
+
+    def add_instance(self, aircraft, version, airport, headless):
+        """Allocate an instance and create its console tab"""
+        sitl_instance = self.fleet.add(
+            self.aircraft_keys[aircraft], version, self.catalog.location(airport),
+            headless, self.record_var.get())
+        tab = ConsoleTab(self, sitl_instance.instance, sitl_instance.output)
+        self.tabs[sitl_instance.instance] = tab
+        self.console_tabs.add(tab, text='{} {} :{}'.format(
+            aircraft, version, sitl_instance.port))
+        return sitl_instance
+
+    def plan_failures(self, instances):
+        """Plan the failures selected in the failure frame"""
+        names = [self.failures_lst.get(i)
+                 for i in self.failures_lst.curselection()]
+        try:
+            count = int(self.failure_count_spn.get())
+            start = float(self.failure_start_spn.get())
+            within = float(self.failure_within_spn.get())
+            duration = float(self.failure_clear_spn.get())
+        except ValueError:
+            count = 0
+        if not names or count <= 0:
+            return
+        # The seed is shown in the console so the scenario can be replayed
+        seed = self.seed_ent.get().strip() or failures.new_seed()
+        for sitl_instance in instances:
+            supported = failures.available(names, sitl_instance.has_file)
+            for name in names:
+                if name not in supported:
+                    sitl_instance.output.put(
+                        'Failure not available on this aircraft: {}'.format(
+                            name))
+            sitl_instance.failures = failures.plan(
+                failures.instance_seed(seed, sitl_instance.instance),
+                supported, count, start, within, duration)
+            sitl_instance.output.put('Failure scenario seed: {}'.format(seed))
+
+    def start_instances(self, instances):
+        """
+        Switch to the console view and start the instances. Instances
+        stopped since they were added are skipped. The working copies are
+        prepared and the processes spawned in the background.
+        """
+        instances = [sitl_instance for sitl_instance in instances
+                     if self.fleet.instances.get(sitl_instance.instance)
+                     is sitl_instance]
+        if not instances:
+            return
         # Switch to console view
         self.enable_console()
 
-        self.kill_sitl()
-
-        # If RealFlight, reset aircraft
-        if not self.headless:
-            realflight.reset_aircraft()
-
-        self.ardupilot_thread = threading.Thread(target=self.run_sitl)
-        self.ardupilot_thread.start()
-
-    def kill_sitl(self):
-        """Kill running SITL thread/process"""
-        if self.ardupilot_thread is not None:
-            if self.ardupilot_process is not None:
-                self.ardupilot_process.kill()
-            self.ardupilot_thread.join()
-            self.ardupilot_thread = None
+        self.plan_failures(instances)
+        for sitl_instance in instances:
+            sitl_instance.output.put('Starting SITL...')
+            sitl_instance.starting = True
+
+        def launch():
+            try:
+                self.fleet.launch(instances)
+            except OSError as err:
+                for sitl_instance in instances:
+                    sitl_instance.output.put(str(err))
+            finally:
+                for sitl_instance in instances:
+                    sitl_instance.starting = False
+        self.in_background(launch, instances)
+
+    def reboot_instance(self, instance):
+        """
+        Restart one instance, leaving the others running. It is stopped on
+        the event loop and started again from restart_instance.
+        """
+        if instance in self.rebooting:
+            return
+        self.rebooting.add(instance)
+        sitl_instance = self.fleet.instances[instance]
+        trace = tracing.LaunchTrace('reboot')
+
+        def stop():
+            with trace.phase('kill'):
+                sitl_instance.stop()
+        self.in_background(
+            stop, [sitl_instance],
+            lambda: self.restart_instance(sitl_instance, trace))
+
+    def restart_instance(self, sitl_instance, trace):
+        """Start a rebooting instance again once it has stopped"""
+        instance = sitl_instance.instance
+        # Closed while it was stopping
+        if self.fleet.instances.get(instance) is not sitl_instance:
+            self.rebooting.discard(instance)
+            return
+        sitl_instance.begin_trace('reboot', trace)
+        self.tabs[instance].clear()
+        sitl_instance.output.put('Starting SITL...')
+        sitl_instance.starting = True
+
+        # If RealFlight, reset aircraft while SITL starts up, it only talks
+        # to RealFlight once its own initialisation is done
+        if not sitl_instance.headless:
+            eventloop.get_loop().submit(
+                self.reset_realflight(sitl_instance, trace))
+
+        def restart():
+            try:
+                # Warm restart, keeping the working directory as it is
+                self.fleet.restart(instance)
+            except OSError as err:
+                sitl_instance.output.put(str(err))
+            finally:
+                sitl_instance.starting = False
+        # Only rebooted again once it has started
+        self.in_background(restart, [sitl_instance],
+                           lambda: self.rebooting.discard(instance))
+
+    def flush_consoles(self):
+        """
+        Apply the results posted by the event loop and move queued output
+        of every instance into its console tab
+        """
+        if self.closing:
+            return
+        # Scheduled first, so an error in one frame does not stop the next
+        self.after(console.FRAME_MS, self.flush_consoles)
+        self.bridge.flush()
+        # A posted callback may have closed the window
+        if self.closing:
+            return
+        for instance, tab in list(self.tabs.items()):
+            sitl_instance = self.fleet.instances[instance]
+            # Show the launch timings once the instance is ready or failed
+            trace = sitl_instance.check_trace()
+            if trace is not None:
+                sitl_instance.output.put(trace.summary())
+            sitl_instance.check_exit()
+            tab.flush()
+
+    def sample_instances(self):
+        """Update the CPU, memory and thread counts of every instance"""
+        if self.closing:
+            return
+        self.after(int(supervisor.SAMPLE_INTERVAL * 1000),
+                   self.sample_instances)
+        for instance, tab in list(self.tabs.items()):
+            tab.resources = self.fleet.instances[instance].sample()
+
+    def in_background(self, func, instances, then=None):
+        """
+        Run a blocking function for some instances in the executor of the
+        event loop, and call then on the Tk thread once it returned. An
+        error is shown in the consoles of the instances.
+        """
+        def finished(future):
+            error = None if future.cancelled() else future.exception()
+            if error is not None:
+                for sitl_instance in instances:
+                    sitl_instance.output.put(
+                        'Background task failed: {!r}'.format(error))
+            if then is not None:
+                self.bridge.post(then)
+        future = eventloop.get_loop().submit_blocking(func)
+        future.add_done_callback(finished)
+        return future
+
+    def stop_instance(self, instance):
+        """Close the tab of one instance and stop it in the background"""
+        instances = self.fleet.detach(instance)
+        self.tabs.pop(instance).destroy()
+        # Return to the controls once nothing is running
+        if not self.tabs:
+            self.enable_control()
+        self.in_background(lambda: self.fleet.close(instances), instances)
+
+    def kill_sitl(self, then=None, trace=None):
+        """
+        Close the tabs of every SITL instance and stop them in the
+        background, calling then once they have all exited
+        """
+        instances = self.fleet.detach_all()
+        for tab in self.tabs.values():
+            tab.destroy()
+        self.tabs = {}
+
+        def close():
+            phase = trace.phase('kill') if trace is not None \
+                else contextlib.nullcontext()
+            with phase:
+                self.fleet.close(instances)
+        self.in_background(close, instances, then)
 
     def stop_sitl(self):
         """Stop SITL"""
@@ -278,58 +682,9 @@ class App(tk.Tk):
         popup.attributes('-topmost', True)  # Bring the pop-up to the front
     
     def open_link(self, event):
+        import webbrowser
         webbrowser.open_new("https://github.com/loki077/SITL-Launcher/releases")
     
-    def run_sitl(self):
-        """Run ArduPlane.exe"""
-        # Clear console
-        self.console['state'] = 'normal'
-        self.console.delete('1.0', 'end')
-        self.console.insert('end', 'Starting SITL...\n')
-        self.console['state'] = 'disabled'
-
-        # Get the name of the ardupilot executable
-        exename = 'ArduPlane_' + self.selected['version'] + '.exe'
-
-        # Get the folder name of the working directory: aircraft_version_type
-        foldername = self.aircraft_keys[self.selected['aircraft']] + '_'
-        foldername += self.selected['version'].lower() + '_'
-        foldername += 'hl' if self.headless else 'rf'
-        # strip whitespace
-        foldername = ''.join(foldername.split())
-
-        # Get the path to the cwd
-        cwd = os.path.join('bin', foldername)
-
-        # Construct command
-        command = [os.path.join('bin', exename)]
-        command += ['--defaults', 'defaults.param']
-        command += ['-M', 'quadplane' if self.headless else 'flightaxis']
-        # Prevent waiting for GCS connection
-        command += ['--uartA', 'tcp:0']
-        # get location from selected airport
-        command += ['-O', self.locations[self.selected['airport']]]
-
-        self.ardupilot_process = subprocess.Popen(command,
-                                                  stdout=subprocess.PIPE,
-                                                  stderr=subprocess.PIPE,
-                                                  cwd=cwd)
-
-        # Poll the process for new output until finished
-        while True:
-            if self.ardupilot_process.poll() is not None:
-                return
-            next_line = self.ardupilot_process.stdout.readline()
-            if next_line:
-                self.update_text(next_line.decode('utf-8').strip())
-
-    def update_text(self, line):
-        """Update the console textbox with the new line"""
-        self.console.config(state='normal')
-        self.console.insert('end', line + '\n')
-        self.console.see('end')
-        self.console.config(state='disabled')
-
     def on_closing(self):
         """Save the config when the window is closed"""
         # Update the config with the selected options
@@ -337,8 +692,120 @@ class App(tk.Tk):
         # Write the config to file
         with open('config\config.ini', 'w', encoding='UTF-8') as configfile:
             self.config.write(configfile)
-        self.destroy()
+        # Only the selection changed, so the catalog index is still valid
+        self.catalog.config_saved()
+        # Stop any running instances with the window hidden, then the I/O
+        # they left behind
+        self.withdraw()
+        self.kill_sitl(self.close_window)
+
+    def close_window(self):
+        """
+        Destroy the window once every instance has stopped. It runs from the
+        frame loop, so the window is destroyed once that frame is done.
+        """
+        self.closing = True
+        eventloop.stop_loop()
+        self.after_idle(self.destroy)
+
+
+class ConsoleTab(ttk.Frame):
+    """
+    A console tab for one SITL instance, with its own Stop and Reboot buttons
+    """
+    # Console filters and the severity or subsystem they show
+    FILTERS = OrderedDict([('All', None), ('Errors', 'error'),
+                           ('Warnings', 'warning'), ('Pre-arm', 'prearm'),
+                           ('EKF', 'ekf'), ('GPS', 'gps'),
+                           ('Scripts', 'script')])
+
+    def __init__(self, app, instance, output):
+        super().__init__(app.console_tabs)
+        self.output = output
+        # Resource usage summary, updated by the app
+        self.resources = ''
+
+        # Console view drawing only the visible part of the stored output
+        self.view = consoleview.VirtualConsole(self, output.store)
+        self.view.grid(row=0, column=0, columnspan=2, sticky='nsew')
+
+        # Filter and search bar
+        search_frame = ttk.Frame(self)
+        self.filter_cmb = ttk.Combobox(
+            search_frame, values=list(self.FILTERS), state='readonly',
+            width=9)
+        self.filter_cmb.set('All')
+        self.filter_cmb.bind('<<ComboboxSelected>>', self.filter_selected)
+        self.search_ent = ttk.Entry(search_frame, width=20)
+        self.search_ent.bind('<Return>', lambda _: self.find())
+        prev_but = ttk.Button(search_frame, text='Prev',
+                              command=lambda: self.find(backwards=True))
+        next_but = ttk.Button(search_frame, text='Next', command=self.find)
+        # Pause the view, or follow new output
+        self.follow_var = tk.BooleanVar(value=True)
+        follow_chk = ttk.Checkbutton(
+            search_frame, text='Follow', variable=self.follow_var,
+            command=self.follow_selected)
+        # Show resource usage, lines/sec and dropped line counters
+        self.stats_label = ttk.Label(search_frame, anchor='e')
+        self.filter_cmb.grid(row=0, column=0)
+        self.search_ent.grid(row=0, column=1)
+        prev_but.grid(row=0, column=2)
+        next_but.grid(row=0, column=3)
+        follow_chk.grid(row=0, column=4)
+        self.stats_label.grid(row=0, column=5, sticky='ew')
+        search_frame.columnconfigure(5, weight=1)
+        search_frame.grid(row=1, column=0, columnspan=2, sticky='ew')
 
+        # Create two buttons: Stop and Reboot
+        stop_but = ttk.Button(self, text='Stop')
+        reboot_but = ttk.Button(self, text='Reboot')
+        # Handlers
+        stop_but['command'] = lambda: app.stop_instance(instance)
+        reboot_but['command'] = lambda: app.reboot_instance(instance)
+        # Place them on the bottom of the tab
+        stop_but.grid(row=2, column=0, sticky='sew', ipady=10)
+        reboot_but.grid(row=2, column=1, sticky='sew', ipady=10)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(0, weight=1)
+
+    def clear(self):
+        """Clear the console"""
+        self.output.clear()
+        self.view.clear()
+
+    def filter_selected(self, _):
+        """Only show the lines of the selected severity or subsystem"""
+        self.view.set_filter(self.FILTERS[self.filter_cmb.get()])
+
+    def follow_selected(self):
+        self.view.follow = self.follow_var.get()
+
+    def find(self, backwards=False):
+        """
+        Jump to the next line containing the search text, or the next line
+        of the selected filter if there is no search text
+        """
+        if not self.view.find(self.search_ent.get(), backwards):
+            self.bell()
+
+    def flush(self):
+        """Move the queued lines into the store and redraw the view"""
+        self.output.drain()
+        stats = self.output.stats()
+        if self.resources:
+            stats = '{} | {}'.format(self.resources, stats)
+        # The session log counts the lines older than the store
+        kind = self.view.model.filter
+        if kind is not None and self.output.log is not None:
+            stats = '{} in session | {}'.format(
+                self.output.log.count(kind), stats)
+        self.stats_label['text'] = stats
+        self.view.refresh()
+        # Scrolling up pauses the view, scrolling to the end follows again
+        if self.follow_var.get() != self.view.follow:
+            self.follow_var.set(self.view.follow)
 
 if __name__ == '__main__':
     App()
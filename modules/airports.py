@@ -0,0 +1,224 @@
+"""
+Airport database for training sites beyond the few airports in config.ini.
+Airports are imported from a CSV dump (OurAirports airports.csv, optionally
+with runways.csv for the heading, or a plain name,lat,lon,alt,heading file)
+into an SQLite table with a lowercase search column, and searched as the
+airport selector is typed in: by prefix of the whole name, then by prefix
+of any word of the name or ident through an FTS5 index, so neither search
+reads the whole table.
+
+The database is only opened on the first search or lookup, so startup does
+not depend on how many airports it holds.
+"""
+
+import csv
+import os
+import re
+import sqlite3
+
+DB_FILE = os.path.join('config', 'airports.sqlite')
+# Results shown in the airport selector
+SEARCH_LIMIT = 50
+# Airport types imported from OurAirports, the rest are heliports, seaplane
+# bases, balloonports and closed airports
+OURAIRPORTS_TYPES = ('large_airport', 'medium_airport', 'small_airport')
+FEET = 0.3048
+# Elevation sanity limits, metres
+MIN_ALT = -500
+MAX_ALT = 9000
+
+SCHEMA = '''
+CREATE TABLE airports (
+    name TEXT PRIMARY KEY,
+    ident TEXT,
+    search TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    alt REAL NOT NULL,
+    heading REAL NOT NULL
+);
+CREATE INDEX airports_search ON airports (search);
+CREATE VIRTUAL TABLE airport_words USING fts5(
+    search, content='airports', content_rowid='rowid');
+'''
+
+
+def parse_location(location):
+    """
+    Get lat, lon, alt and heading from a location string as given to -O,
+    raising ValueError if any of them is missing or out of range
+    """
+    parts = [float(part) for part in location.split(',')]
+    if len(parts) != 4:
+        raise ValueError('expected lat,lon,alt,heading: {}'.format(location))
+    return validate(*parts)
+
+
+def validate(lat, lon, alt, heading):
+    """Check a location is plausible, returns it with the heading in 0-360"""
+    if not -90 <= lat <= 90:
+        raise ValueError('latitude out of range: {}'.format(lat))
+    if not -180 <= lon <= 180:
+        raise ValueError('longitude out of range: {}'.format(lon))
+    if not MIN_ALT <= alt <= MAX_ALT:
+        raise ValueError('altitude out of range: {}'.format(alt))
+    if not -360 <= heading <= 360:
+        raise ValueError('heading out of range: {}'.format(heading))
+    return lat, lon, alt, heading % 360
+
+
+def format_location(lat, lon, alt, heading):
+    return '{:.6f},{:.6f},{:.1f},{:g}'.format(lat, lon, alt, heading)
+
+
+def _runway_headings(path):
+    """Get the heading of the longest open runway of every airport ident"""
+    longest = {}
+    with open(path, 'r', encoding='UTF-8', newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                length = float(row['length_ft'] or 0)
+                heading = float(row['le_heading_degT'])
+            except (KeyError, ValueError):
+                continue
+            if row.get('closed') == '1':
+                continue
+            ident = row['airport_ident']
+            if length > longest.get(ident, (-1, 0))[0]:
+                longest[ident] = (length, heading)
+    return {ident: heading for ident, (_, heading) in longest.items()}
+
+
+def read_csv(path, runways=None):
+    """
+    Yield (name, ident, lat, lon, alt, heading) rows of an OurAirports
+    airports.csv or a plain CSV with name, lat, lon, alt (metres) and
+    heading columns, and a list of the rows that were rejected
+    """
+    headings = _runway_headings(runways) if runways else {}
+    rejected = []
+    rows = []
+    with open(path, 'r', encoding='UTF-8', newline='') as f:
+        reader = csv.DictReader(f)
+        ourairports = 'latitude_deg' in (reader.fieldnames or [])
+        for line, row in enumerate(reader, 2):
+            try:
+                if ourairports:
+                    if row['type'] not in OURAIRPORTS_TYPES:
+                        continue
+                    ident = row['ident']
+                    name = '{} ({})'.format(row['name'], ident)
+                    location = validate(
+                        float(row['latitude_deg']),
+                        float(row['longitude_deg']),
+                        float(row['elevation_ft'] or 0) * FEET,
+                        headings.get(ident, 0))
+                else:
+                    ident = row.get('ident', '')
+                    name = row['name'].strip()
+                    location = validate(
+                        float(row['lat']), float(row['lon']),
+                        float(row['alt']), float(row.get('heading') or 0))
+                if not name:
+                    raise ValueError('no name')
+            except (KeyError, ValueError, TypeError) as err:
+                rejected.append('{}:{}: {}'.format(path, line, err))
+                continue
+            rows.append((name, ident) + location)
+    return rows, rejected
+
+
+def build(rows, db_file=DB_FILE):
+    """
+    Write a new database from (name, ident, lat, lon, alt, heading) rows,
+    replacing the old one only once it is complete. Returns the number of
+    airports, later rows win over earlier ones with the same name.
+    """
+    tmp_file = db_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    connection = sqlite3.connect(tmp_file)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany(
+            'INSERT OR REPLACE INTO airports VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((name, ident, '{} {}'.format(name, ident).lower(),
+              lat, lon, alt, heading)
+             for name, ident, lat, lon, alt, heading in rows))
+        # The word index reads the rows from airports, once they are final
+        connection.execute(
+            "INSERT INTO airport_words (airport_words) VALUES ('rebuild')")
+        connection.commit()
+        count = connection.execute('SELECT COUNT(*) FROM airports').fetchone()[0]
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+    os.replace(tmp_file, db_file)
+    return count
+
+
+class AirportDB:
+    """Lazily opened, read-only view of the airport database"""
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self._connection = None
+
+    @property
+    def available(self):
+        return os.path.isfile(self.db_file)
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                'file:{}?mode=ro'.format(self.db_file), uri=True)
+        return self._connection
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Get the names of airports starting with text, then of those with
+        words of their name or ident starting with the words of text
+        """
+        if not self.available:
+            return []
+        text = text.strip().lower()
+        connection = self._connect()
+        # Both queries are served by an index, the search column index for
+        # the prefix range and the word index for the rest
+        names = [row[0] for row in connection.execute(
+            'SELECT name FROM airports WHERE search >= ? AND search < ? '
+            'ORDER BY search LIMIT ?', (text, text + '\uffff', limit))]
+        words = re.findall(r'\w+', text)
+        if len(names) < limit and words:
+            query = ' '.join('"{}"*'.format(word) for word in words)
+            try:
+                names += [row[0] for row in connection.execute(
+                    'SELECT name FROM airports WHERE rowid IN '
+                    '(SELECT rowid FROM airport_words WHERE airport_words '
+                    'MATCH ?) AND NOT (search >= ? AND search < ?) '
+                    'ORDER BY search LIMIT ?',
+                    (query, text, text + '\uffff', limit - len(names)))]
+            except sqlite3.OperationalError:
+                # A database imported before the word index, import it again
+                # to search by word
+                pass
+        return names
+
+    def location(self, name):
+        """Get the location string of an airport, or None"""
+        if not self.available:
+            return None
+        row = self._connect().execute(
+            'SELECT lat, lon, alt, heading FROM airports WHERE name = ?',
+            (name,)).fetchone()
+        return format_location(*row) if row else None
+
+    def count(self):
+        if not self.available:
+            return 0
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM airports').fetchone()[0]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
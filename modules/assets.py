@@ -0,0 +1,128 @@
+"""
+Content-addressed store of the files of the SITL variant folders. Every
+unique file is kept once under assets/objects by its SHA-256, and each
+variant folder is described by a manifest of relative path to hash in
+assets/manifests/<folder>.json. A working directory is assembled from a
+manifest with hardlinks to the stored files, or copies where the file
+system cannot link, so a new variant sharing its scripts with the others
+adds nothing but its manifest.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+
+ASSETS_DIR = 'assets'
+OBJECTS = 'objects'
+MANIFESTS = 'manifests'
+
+_CHUNK = 2**20
+
+
+def file_hash(path):
+    """Get the SHA-256 of a file as hex"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(digest, assets_dir=ASSETS_DIR):
+    return os.path.join(assets_dir, OBJECTS, digest[:2], digest)
+
+
+def manifest_path(name, assets_dir=ASSETS_DIR):
+    return os.path.join(assets_dir, MANIFESTS, name + '.json')
+
+
+def has_manifest(name, assets_dir=ASSETS_DIR):
+    return os.path.isfile(manifest_path(name, assets_dir))
+
+
+def load_manifest(name, assets_dir=ASSETS_DIR):
+    """Get the relative path to hash mapping of a variant folder"""
+    with open(manifest_path(name, assets_dir), 'r', encoding='UTF-8') as f:
+        return json.load(f)
+
+
+def store(path, assets_dir=ASSETS_DIR):
+    """Add a file to the store, returns its hash"""
+    digest = file_hash(path)
+    target = object_path(digest, assets_dir)
+    if not os.path.isfile(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        # Working directories link to the object, SITL must not change it
+        os.chmod(target, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+    return digest
+
+
+def pack(folder, name, assets_dir=ASSETS_DIR):
+    """Store every file of a folder and write its manifest"""
+    manifest = {}
+    for root, _, names in os.walk(folder):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            # Manifests always use forward slashes
+            rel = os.path.relpath(path, folder).replace(os.sep, '/')
+            manifest[rel] = store(path, assets_dir)
+    path = manifest_path(name, assets_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='UTF-8', newline='\n') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
+    return manifest
+
+
+def _same_file(first, second):
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+
+def assemble(name, dest, assets_dir=ASSETS_DIR):
+    """
+    Put the files of a manifest into dest, as hardlinks to the stored
+    objects or copies if linking fails. Files already linked are left
+    alone, as is anything else in dest. Returns the number of files linked
+    or copied.
+    """
+    changed = 0
+    for rel, digest in load_manifest(name, assets_dir).items():
+        source = object_path(digest, assets_dir)
+        target = os.path.join(dest, *rel.split('/'))
+        if _same_file(source, target):
+            continue
+        if os.path.lexists(target):
+            # Copies made earlier are checked by content
+            if file_hash(target) == digest:
+                continue
+            os.chmod(target, stat.S_IWRITE | stat.S_IREAD)
+            os.remove(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            # Different drive or a file system without hardlinks
+            shutil.copyfile(source, target)
+        changed += 1
+    return changed
+
+
+def unused_objects(assets_dir=ASSETS_DIR):
+    """Get the paths of stored objects no manifest refers to"""
+    used = set()
+    manifests = os.path.join(assets_dir, MANIFESTS)
+    if os.path.isdir(manifests):
+        for file_name in os.listdir(manifests):
+            if file_name.endswith('.json'):
+                used.update(load_manifest(file_name[:-5], assets_dir).values())
+    unused = []
+    for root, _, names in os.walk(os.path.join(assets_dir, OBJECTS)):
+        unused.extend(os.path.join(root, digest) for digest in names
+                      if digest not in used)
+    return sorted(unused)
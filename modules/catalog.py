@@ -0,0 +1,170 @@
+"""
+Catalog of the aircraft, versions and airports in config.ini, validated
+against what is actually installed. An aircraft version is only listed if
+its ArduPlane executable exists, and each of its headless and RealFlight
+modes is only available if it has a bin folder, asset manifest or parameter
+overlay.
+
+The catalog is saved to an index file along with the modification times of
+everything it was built from, so startup only rescans when something
+changed. Airports with an invalid location are left out, and airports
+imported into the airport database are looked up there on demand.
+"""
+
+import configparser
+import json
+import os
+from collections import OrderedDict
+
+from modules import airports as airportdb
+from modules import assets
+from modules import params
+from modules import sitl
+
+CONFIG_FILE = os.path.join('config', 'config.ini')
+INDEX_FILE = os.path.join('config', 'catalog.json')
+INDEX_VERSION = 3
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _sources(config_file, aircraft_keys):
+    """Get the paths the catalog depends on and their modification times"""
+    # Directory mtimes change when files are added to or removed from them
+    paths = [config_file, sitl.BIN_DIR, params.PARAMS_DIR,
+             os.path.join(assets.ASSETS_DIR, assets.MANIFESTS)]
+    paths += [os.path.join(params.PARAMS_DIR, key) for key in aircraft_keys]
+    return {path: _mtime(path) for path in paths}
+
+
+def scan(config_file=CONFIG_FILE):
+    """Build the catalog data from config.ini and the installed files"""
+    config = configparser.ConfigParser(dict_type=OrderedDict)
+    config.read(config_file)
+
+    aircraft = {}
+    airports = {}
+    problems = []
+    # Loop through config and fill the aircraft and airport information
+    for category in config:
+        item = config[category]
+        if item.get('type') == 'aircraft':
+            if item['name'] in aircraft:
+                raise Exception('Duplicate aircraft name: {}'.format(item['name']))
+            modes = {}
+            for version in ''.join(item['versions'].split()).split(','):
+                exe = os.path.join(sitl.BIN_DIR, sitl.exe_name(version))
+                if not os.path.isfile(exe):
+                    problems.append('{} {}: missing {}'.format(
+                        item['name'], version, exe))
+                    continue
+                available = []
+                for headless in (True, False):
+                    name = sitl.folder_name(category, version, headless)
+                    folder = os.path.join(sitl.BIN_DIR, name)
+                    overlay = os.path.join(
+                        params.PARAMS_DIR, category,
+                        params.layer_names(version, headless)[-1])
+                    if (os.path.isdir(folder) or os.path.isfile(overlay)
+                            or assets.has_manifest(name)):
+                        available.append('hl' if headless else 'rf')
+                    else:
+                        problems.append('{} {}: missing {} and {}'.format(
+                            item['name'], version, folder, overlay))
+                if available:
+                    modes[version] = available
+            aircraft[item['name']] = {'key': category, 'modes': modes}
+        elif item.get('type') == 'airport':
+            try:
+                airportdb.parse_location(item['location'])
+            except (KeyError, ValueError) as err:
+                problems.append('{}: {}'.format(item['name'], err))
+                continue
+            airports[item['name']] = item['location']
+
+    return {
+        'version': INDEX_VERSION,
+        'aircraft': aircraft,
+        'airports': airports,
+        'problems': problems,
+        'sources': _sources(config_file, [
+            entry['key'] for entry in aircraft.values()]),
+    }
+
+
+class Catalog:
+    """The validated aircraft and airports, see load"""
+    def __init__(self, data, config_file=CONFIG_FILE, index_file=INDEX_FILE):
+        self.data = data
+        self.config_file = config_file
+        self.index_file = index_file
+
+        aircraft = data['aircraft']
+        # Only list aircraft with at least one usable version
+        self.aircraft_list = sorted(
+            name for name, entry in aircraft.items() if entry['modes'])
+        self.aircraft_keys = {
+            name: entry['key'] for name, entry in aircraft.items()}
+        self.versions = {
+            name: list(entry['modes']) for name, entry in aircraft.items()}
+        self.airport_list = sorted(data['airports'])
+        self.locations = dict(data['airports'])
+        self.problems = data['problems']
+        # Imported airports, searched as the airport selector is typed in
+        self.airport_db = airportdb.AirportDB()
+
+    @classmethod
+    def load(cls, config_file=CONFIG_FILE, index_file=INDEX_FILE):
+        """Read the index if it is up to date, otherwise rescan and save it"""
+        try:
+            with open(index_file, 'r', encoding='UTF-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and all(
+                    _mtime(path) == mtime
+                    for path, mtime in data['sources'].items()):
+                return cls(data, config_file, index_file)
+        except (OSError, ValueError, KeyError):
+            pass
+        catalog = cls(scan(config_file), config_file, index_file)
+        catalog.save()
+        return catalog
+
+    def save(self):
+        """Write the index"""
+        try:
+            with open(self.index_file, 'w', encoding='UTF-8') as f:
+                json.dump(self.data, f, indent=1)
+        except OSError as err:
+            print('Unable to write catalog index: {}'.format(err))
+
+    def config_saved(self):
+        """
+        Record a new config.ini modification time after the launcher itself
+        saved it, which only changes the selected options
+        """
+        self.data['sources'][self.config_file] = _mtime(self.config_file)
+        self.save()
+
+    def location(self, airport):
+        """Get the location of a config.ini or imported airport, or None"""
+        if airport in self.locations:
+            return self.locations[airport]
+        return self.airport_db.location(airport)
+
+    def search_airports(self, text):
+        """Get the config.ini airports containing text, then imported ones"""
+        needle = text.strip().lower()
+        names = [name for name in self.airport_list if needle in name.lower()]
+        return names + [name for name in self.airport_db.search(text)
+                        if name not in self.locations]
+
+    def available(self, aircraft, version, headless):
+        """True if the aircraft version can be launched in this mode"""
+        entry = self.data['aircraft'].get(aircraft)
+        return (entry is not None and
+                ('hl' if headless else 'rf') in entry['modes'].get(version, []))
@@ -0,0 +1,205 @@
+"""
+Output pipeline between SITL processes and the console view. Reader tasks
+on the event loop drain stdout and stderr into a bounded queue, and the GUI
+flushes the queue in batches from the Tk thread. Each line is classified as it is
+drained, and the most recent lines are kept in a fixed size LineStore for
+the console view.
+"""
+
+import collections
+import concurrent.futures
+import re
+import threading
+import time
+
+from modules import eventloop
+from modules import sitllog
+
+# The console view only draws the visible lines, so this only costs memory
+MAX_LINES = 100000
+# Console refresh rate, frames per second
+FRAME_RATE = 20
+FRAME_MS = 1000 // FRAME_RATE
+
+
+class LineStore:
+    """
+    Ring buffer of the last capacity lines and their (severity, subsystem).
+    Lines are numbered from the first line ever added, so a number keeps
+    pointing at the same line while older lines are dropped. Adding a line
+    costs the same however many were added before.
+    """
+    def __init__(self, capacity=MAX_LINES):
+        self.capacity = capacity
+        self._lines = [None] * capacity
+        self._kinds = [None] * capacity
+        # Number of lines ever added, and the number of the oldest kept
+        self.total = 0
+        self.first = 0
+
+    def __len__(self):
+        return self.total - self.first
+
+    def extend(self, lines, kinds):
+        """Add lines, dropping the oldest ones that no longer fit"""
+        skipped = len(lines) - self.capacity
+        if skipped > 0:
+            lines = lines[skipped:]
+            kinds = kinds[skipped:]
+            self.total += skipped
+        done = 0
+        while done < len(lines):
+            # Copy in at most two slices, up to the end of the ring and then
+            # from its start
+            slot = self.total % self.capacity
+            count = min(len(lines) - done, self.capacity - slot)
+            self._lines[slot:slot + count] = lines[done:done + count]
+            self._kinds[slot:slot + count] = kinds[done:done + count]
+            done += count
+            self.total += count
+        self.first = max(self.first, self.total - self.capacity)
+
+    def __getitem__(self, number):
+        """Get the line and kind of a line number"""
+        if not self.first <= number < self.total:
+            raise IndexError(number)
+        slot = number % self.capacity
+        return self._lines[slot], self._kinds[slot]
+
+    def clear(self):
+        """Forget every line, numbering carries on"""
+        self.first = self.total
+
+
+class OutputPipeline:
+    """
+    Collect output lines from a process on reader tasks and hand them to
+    the GUI in batches. Keeps the last max_lines lines in a LineStore, with
+    counters of lines received and dropped. At most max_lines lines wait
+    for the GUI, older ones are dropped if it falls behind.
+    """
+    def __init__(self, max_lines=MAX_LINES):
+        # Lines waiting for drain, the oldest fall out once it is full
+        self.queue = collections.deque(maxlen=max_lines)
+        self._queue_lock = threading.Lock()
+        self._queue_dropped = 0
+        self.store = LineStore(max_lines)
+        self.max_lines = max_lines
+        self.readers = []
+
+        # Watched patterns and the perf_counter time they were first seen
+        self.watches = []
+        self.seen = {}
+        self._watch_lock = threading.Lock()
+
+        # Session log every drained line is written to, if any
+        self.log = None
+
+        self.received = 0
+        self.dropped = 0
+        self.rate = 0.0
+        self._rate_count = 0
+        self._rate_time = time.monotonic()
+
+    def attach(self, process):
+        """
+        Start draining stdout and stderr of a process concurrently, on the
+        event loop it was spawned on
+        """
+        self.readers = [process.event_loop.submit(self._read(stream))
+                        for stream in (process.stdout, process.stderr)]
+
+    def join(self, timeout=None):
+        """
+        Wait for the reader tasks to drain the pipes to the end. Returns
+        False if they did not finish within timeout seconds, which happens
+        when a child of the process still holds the pipes open.
+        """
+        concurrent.futures.wait(self.readers, timeout)
+        drained = self.drained
+        self.readers = []
+        return drained
+
+    @property
+    def drained(self):
+        """True once every reader task reached the end of its pipe"""
+        return all(reader.done() for reader in self.readers)
+
+    def watch(self, name, pattern=None):
+        """
+        Record in seen[name] when the first line matching pattern arrives,
+        or the first line at all if pattern is None
+        """
+        with self._watch_lock:
+            self.seen.pop(name, None)
+            self.watches.append(
+                (name, re.compile(pattern) if pattern else None))
+
+    def put(self, line):
+        """Add a line from any thread"""
+        with self._queue_lock:
+            if len(self.queue) == self.queue.maxlen:
+                self._queue_dropped += 1
+            self.queue.append(line)
+
+    def clear(self):
+        """Discard all buffered lines"""
+        self.drain()
+        self.store.clear()
+
+    def drain(self):
+        """
+        Take every queued line, store it in the ring buffer and return the
+        batch. Lines that would not fit in the ring buffer are dropped, and
+        so are those that fell out of the queue before they were drained.
+        """
+        with self._queue_lock:
+            batch = list(self.queue)
+            self.queue.clear()
+            queue_dropped = self._queue_dropped
+            self._queue_dropped = 0
+
+        # Lines that fell out of the queue never reach the log
+        self.received += queue_dropped + len(batch)
+        self.dropped += queue_dropped
+        self._rate_count += queue_dropped + len(batch)
+        # The log gets every line, even those dropped from the store
+        if self.log is not None:
+            kinds = self.log.write(batch)
+        else:
+            kinds = [sitllog.classify(line) for line in batch]
+        overflow = len(self.store) + len(batch) - self.max_lines
+        if overflow > 0:
+            self.dropped += overflow
+        self.store.extend(batch, kinds)
+
+        # Update lines/sec about once a second
+        now = time.monotonic()
+        if now - self._rate_time >= 1.0:
+            self.rate = self._rate_count / (now - self._rate_time)
+            self._rate_count = 0
+            self._rate_time = now
+        return batch
+
+    def stats(self):
+        """Get a one-line summary of the counters"""
+        return '{:.0f} lines/s, {} lines, {} dropped'.format(
+            self.rate, self.received, self.dropped)
+
+    def _check_watches(self, line):
+        """Record the watched patterns matched by a line"""
+        now = time.perf_counter()
+        with self._watch_lock:
+            for watch in list(self.watches):
+                name, pattern = watch
+                if pattern is None or pattern.search(line):
+                    self.seen[name] = now
+                    self.watches.remove(watch)
+
+    async def _read(self, stream):
+        """Queue every line of a stream until it is closed"""
+        async for next_line in eventloop.read_lines(stream):
+            line = next_line.decode('utf-8', 'replace').rstrip()
+            if self.watches:
+                self._check_watches(line)
+            self.put(line)
@@ -0,0 +1,274 @@
+"""
+Virtualized console view. The output of an instance lives in the LineStore
+of its pipeline, and the view only ever holds the lines that fit on screen,
+so drawing costs the same after a million lines as after ten. ConsoleModel
+keeps track of the scroll position, filter and search without Tk, and
+VirtualConsole draws it into a Text widget with its own scrollbar.
+"""
+
+import tkinter as tk
+from array import array
+from bisect import bisect_left
+from tkinter import font
+from tkinter import ttk
+
+# Filtered line numbers before the oldest stored line are only trimmed once
+# there are this many, to not shift the array on every batch
+TRIM_ROWS = 10000
+# Lines scrolled per mouse wheel notch
+WHEEL_LINES = 3
+
+
+class ConsoleModel:
+    """
+    The rows shown by the console, either every stored line or the line
+    numbers of one severity or subsystem, and the position in them. While
+    following the tail the view always shows the last rows, otherwise top
+    holds the number of the first line shown so it stays put when old lines
+    are dropped from the store.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.filter = None
+        self.rows = array('Q')
+        self._scanned = 0
+        self.follow = True
+        self.top = 0
+        # Number of the line found by the last search
+        self.match = None
+
+    def update(self):
+        """Add the new lines of the store to the filtered rows"""
+        if self.filter is None:
+            return
+        start = max(self._scanned, self.store.first)
+        for number in range(start, self.store.total):
+            if self.filter in self.store[number][1]:
+                self.rows.append(number)
+        self._scanned = self.store.total
+        first = bisect_left(self.rows, self.store.first)
+        if first >= TRIM_ROWS:
+            del self.rows[:first]
+
+    def set_filter(self, kind):
+        """Show only the lines of a severity or subsystem, or all if None"""
+        self.filter = kind
+        self.rows = array('Q')
+        self._scanned = 0
+        self.update()
+
+    def _offset(self):
+        # Rows before the oldest stored line are no longer shown
+        if self.filter is None:
+            return self.store.first
+        return bisect_left(self.rows, self.store.first)
+
+    def row_count(self):
+        if self.filter is None:
+            return len(self.store)
+        return len(self.rows) - self._offset()
+
+    def number(self, row):
+        """Get the line number of a row"""
+        if self.filter is None:
+            return self.store.first + row
+        return self.rows[self._offset() + row]
+
+    def row(self, number):
+        """Get the first row at or after a line number"""
+        if self.filter is None:
+            return max(0, number - self.store.first)
+        return bisect_left(self.rows, number) - self._offset()
+
+    def top_row(self, visible):
+        """Get the first row shown, with visible rows on screen"""
+        last = max(0, self.row_count() - visible)
+        if self.follow:
+            return last
+        return min(max(0, self.row(self.top)), last)
+
+    def window(self, visible):
+        """Get the first row shown and the (number, line, kind) shown"""
+        top = self.top_row(visible)
+        end = min(self.row_count(), top + visible)
+        shown = []
+        for row in range(top, end):
+            number = self.number(row)
+            line, kind = self.store[number]
+            shown.append((number, line, kind))
+        return top, shown
+
+    def scroll_to(self, row, visible):
+        """Show row at the top, following the tail once at the end"""
+        count = self.row_count()
+        row = min(max(0, row), max(0, count - visible))
+        self.follow = row >= count - visible
+        if count:
+            self.top = self.number(row)
+
+    def scroll(self, rows, visible):
+        self.scroll_to(self.top_row(visible) + rows, visible)
+
+    def find(self, text, visible, backwards=False):
+        """
+        Find the next or previous row containing text, starting after the
+        last match or from the top of the view, and scroll it into the
+        middle of the view. Without text, step to the next row of the
+        filter. Returns False if there is no such row.
+        """
+        count = self.row_count()
+        if not count or (not text and self.filter is None):
+            return False
+        if self.match is not None and self.match >= self.store.first:
+            start = self.row(self.match)
+        else:
+            start = self.top_row(visible)
+        step = -1 if backwards else 1
+        needle = text.lower()
+        row = start + step
+        while 0 <= row < count:
+            number = self.number(row)
+            if needle in self.store[number][0].lower():
+                self.match = number
+                self.scroll_to(row - visible // 2, visible)
+                # A match at the very end should not start following again
+                self.follow = False
+                return True
+            row += step
+        return False
+
+
+class VirtualConsole(ttk.Frame):
+    """
+    A read-only console drawing only the visible lines of a LineStore, with
+    scrollbars, mouse wheel and Page Up/Down/Home/End scrolling. Lines are
+    tagged 'line' and with their severity and subsystem for styling.
+    """
+    def __init__(self, parent, store):
+        super().__init__(parent)
+        self.model = ConsoleModel(store)
+        self._drawn = None
+
+        self.text = tk.Text(self, wrap='none', state='disabled')
+        self.text.tag_configure('error', foreground='red')
+        self.text.tag_configure('warning', foreground='dark orange')
+        self.text.tag_configure('match', background='yellow')
+        self.line_height = font.Font(font=self.text['font']).metrics(
+            'linespace')
+        # The scrollbar follows the rows of the model, not the widget
+        self.scrolly = ttk.Scrollbar(self, orient='vertical',
+                                     command=self.yview)
+        scrollx = ttk.Scrollbar(self, orient='horizontal',
+                                command=self.text.xview)
+        self.text['xscrollcommand'] = scrollx.set
+        self.text.grid(row=0, column=0, sticky='nsew')
+        self.scrolly.grid(row=0, column=1, sticky='ns')
+        scrollx.grid(row=1, column=0, sticky='ew')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.text.bind('<Configure>', lambda _: self.redraw())
+        self.text.bind('<MouseWheel>', self.on_wheel)
+        self.text.bind('<Button-4>', lambda _: self.scroll(-WHEEL_LINES))
+        self.text.bind('<Button-5>', lambda _: self.scroll(WHEEL_LINES))
+        self.text.bind('<Prior>', lambda _: self.scroll(-self.visible()))
+        self.text.bind('<Next>', lambda _: self.scroll(self.visible()))
+        self.text.bind('<Home>', lambda _: self.scroll_to(0))
+        self.text.bind('<End>', lambda _: self.scroll_to(
+            self.model.row_count()))
+
+    @property
+    def follow(self):
+        return self.model.follow
+
+    @follow.setter
+    def follow(self, follow):
+        if follow:
+            self.model.follow = True
+        else:
+            self.model.scroll_to(self.model.top_row(self.visible()),
+                                 self.visible())
+            self.model.follow = False
+        self.redraw()
+
+    def visible(self):
+        """Number of whole lines that fit in the widget"""
+        return max(1, self.text.winfo_height() // self.line_height)
+
+    def on_wheel(self, event):
+        # Windows and macOS give multiples of 120 per notch
+        self.scroll(-WHEEL_LINES * event.delta // 120)
+        return 'break'
+
+    def scroll(self, rows):
+        self.model.scroll(rows, self.visible())
+        self.redraw()
+        return 'break'
+
+    def scroll_to(self, row):
+        self.model.scroll_to(row, self.visible())
+        self.redraw()
+        return 'break'
+
+    def yview(self, *args):
+        """Scrollbar command"""
+        visible = self.visible()
+        if args[0] == 'moveto':
+            self.model.scroll_to(
+                int(float(args[1]) * self.model.row_count()), visible)
+        elif args[0] == 'scroll':
+            rows = int(args[1]) * (visible if args[2] == 'pages' else 1)
+            self.model.scroll(rows, visible)
+        self.redraw()
+
+    def set_filter(self, kind):
+        self.model.set_filter(kind)
+        self.model.follow = True
+        self.redraw()
+
+    def find(self, text, backwards=False):
+        found = self.model.find(text, self.visible(), backwards)
+        self.redraw()
+        return found
+
+    def clear(self):
+        self.model.store.clear()
+        self.model.set_filter(self.model.filter)
+        self.model.match = None
+        self.model.follow = True
+        self.redraw()
+
+    def refresh(self):
+        """Pick up new lines, and redraw if what is shown changed"""
+        self.model.update()
+        top, shown = self.model.window(self.visible() + 1)
+        drawn = (top, self.model.row_count(), shown[0][0] if shown else None,
+                 shown[-1][0] if shown else None, self.model.match)
+        if drawn != self._drawn:
+            self._draw(top, shown)
+
+    def redraw(self):
+        top, shown = self.model.window(self.visible() + 1)
+        self._draw(top, shown)
+
+    def _draw(self, top, shown):
+        """Replace the widget contents with the shown lines"""
+        count = self.model.row_count()
+        self._drawn = (top, count, shown[0][0] if shown else None,
+                       shown[-1][0] if shown else None, self.model.match)
+        chunks = []
+        for number, line, kind in shown:
+            tags = ('line',) + tuple(name for name in kind if name)
+            if number == self.model.match:
+                tags += ('match',)
+            chunks += [line + '\n', tags]
+        self.text.config(state='normal')
+        self.text.delete('1.0', 'end')
+        if chunks:
+            self.text.insert('1.0', *chunks)
+        self.text.config(state='disabled')
+        if count:
+            visible = self.visible()
+            self.scrolly.set(top / count, min(1.0, (top + visible) / count))
+        else:
+            self.scrolly.set(0, 1)
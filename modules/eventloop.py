@@ -0,0 +1,268 @@
+"""
+The launcher's I/O event loop. One asyncio loop runs on a single background
+thread beside Tk and does all the waiting: the stdout and stderr pipes of
+every ArduPlane process, the MAVLink links of the telemetry taps, failure
+injectors and parameter checks, FlightAxis SOAP calls and the update check.
+A new instance or connection adds a task to the loop, not threads.
+
+Tk must only be used from its own thread, so results go back to it through
+a UiBridge, whose callbacks the GUI runs in a batch on every frame.
+"""
+
+import collections
+import subprocess
+import threading
+import traceback
+
+# asyncio is slow to import and not needed for the first window, so it is
+# imported when the loop starts
+asyncio = None
+
+# Longest line read from a process pipe at once, longer lines are split
+LINE_LIMIT = 2**20
+
+
+class EventLoop:
+    """An asyncio loop running forever on its own daemon thread"""
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def start(self):
+        global asyncio
+        import asyncio
+        self._thread = threading.Thread(target=self._run, name='event loop',
+                                        daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # Let cancelled tasks run their cleanup before closing
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    def stop(self, timeout=5.0):
+        """Cancel every task and stop the loop"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def in_loop(self):
+        """True when called from the loop thread"""
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """Run a coroutine on the loop, returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result"""
+        if self.in_loop:
+            raise RuntimeError('EventLoop.run called from the loop thread')
+        return self.submit(coro).result(timeout)
+
+    def call(self, callback, *args):
+        """Call a function on the loop thread"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def submit_blocking(self, func, *args, **kwargs):
+        """
+        Run a blocking function in the executor of the loop, for libraries
+        without asyncio support. Returns a concurrent Future.
+        """
+        return self.submit(asyncio.to_thread(func, *args, **kwargs))
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_loop():
+    """Get the event loop shared by the whole process, started on first use"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EventLoop().start()
+        return _shared
+
+
+def stop_loop():
+    """Stop the shared event loop, if it was started"""
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.stop()
+            _shared = None
+
+
+class UiBridge:
+    """
+    Callbacks posted from any thread, run by the GUI thread in batches.
+    Posting never blocks, and nothing touches Tk until flush is called.
+    """
+    def __init__(self):
+        self._pending = collections.deque()
+
+    def post(self, callback, *args):
+        self._pending.append((callback, args))
+
+    def flush(self):
+        """Run the callbacks posted so far, returns how many ran"""
+        count = len(self._pending)
+        for _ in range(count):
+            callback, args = self._pending.popleft()
+            callback(*args)
+        return count
+
+
+class LoopTask:
+    """
+    A long running coroutine on the shared loop that can be stopped from
+    any thread. Subclasses implement run and use sleep, which returns True
+    once a stop was requested. done is set when run has returned and its
+    cleanup is finished.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.event_loop = None
+        self._stop_requested = False
+        self._stopping = None
+
+    def start(self, event_loop=None):
+        self.event_loop = event_loop or get_loop()
+        self.event_loop.submit(self._main())
+
+    def stop(self, timeout=2.0):
+        """Ask run to finish and wait up to timeout seconds for it"""
+        if self.event_loop is None:
+            return
+        self.event_loop.call(self._request_stop)
+        self.done.wait(timeout)
+
+    @property
+    def stopping(self):
+        return self._stop_requested
+
+    def _request_stop(self):
+        self._stop_requested = True
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _main(self):
+        self._stopping = asyncio.Event()
+        if self._stop_requested:
+            self._stopping.set()
+        try:
+            await self.run()
+        except Exception:
+            # Report it like an uncaught exception on a thread would be
+            traceback.print_exc()
+        finally:
+            self.done.set()
+
+    async def sleep(self, seconds=None):
+        """Wait seconds, or until stopped. Returns True if stopped."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop_requested
+
+    async def run(self):
+        raise NotImplementedError
+
+
+class LoopProcess:
+    """
+    An asyncio subprocess with the parts of the Popen interface the
+    launcher uses, so it can be polled, waited for and stopped from any
+    thread. stdout and stderr are asyncio StreamReaders for the loop.
+    """
+    def __init__(self, event_loop, process, args):
+        self.event_loop = event_loop
+        self.process = process
+        self.args = args
+        self.pid = process.pid
+        self.stdout = process.stdout
+        self.stderr = process.stderr
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def poll(self):
+        return self.process.returncode
+
+    def wait(self, timeout=None):
+        """Wait for the process to exit, raising TimeoutExpired like Popen"""
+        if self.process.returncode is not None:
+            return self.process.returncode
+        try:
+            return self.event_loop.run(
+                asyncio.wait_for(self.process.wait(), timeout))
+        except asyncio.TimeoutError:
+            raise subprocess.TimeoutExpired(self.args, timeout) from None
+
+    def _signal(self, method):
+        try:
+            method()
+        except ProcessLookupError:
+            # Already exited
+            pass
+
+    def terminate(self):
+        self.event_loop.call(self._signal, self.process.terminate)
+
+    def kill(self):
+        self.event_loop.call(self._signal, self.process.kill)
+
+
+def spawn(args, cwd=None, event_loop=None):
+    """
+    Start a process on the event loop with its stdout and stderr piped.
+    Raises OSError like Popen if it cannot be started.
+    """
+    event_loop = event_loop or get_loop()
+    process = event_loop.run(asyncio.create_subprocess_exec(
+        *args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd,
+        limit=LINE_LIMIT))
+    return LoopProcess(event_loop, process, args)
+
+
+async def read_lines(stream):
+    """
+    Yield the lines of a StreamReader until it is closed. A line longer
+    than the limit of the reader comes in pieces rather than being lost.
+    """
+    split = False
+    while True:
+        try:
+            line = await stream.readuntil(b'\n')
+        except asyncio.IncompleteReadError as err:
+            # The last line, without a newline
+            line = err.partial
+        except asyncio.LimitOverrunError as err:
+            # Too long, the data is still buffered so take it as a piece
+            yield await stream.read(err.consumed)
+            split = True
+            continue
+        if not line:
+            return
+        # The newline ending a line that was split is not a line of its own
+        if not (split and line == b'\n'):
+            yield line
+        split = False
@@ -0,0 +1,194 @@
+"""
+Failure injection for emergency procedure training. A scenario is planned
+from a seed, so the same seed always gives the same failures at the same
+times, and is played onto a running SITL instance by an Injector which sets
+SIM_* parameters over MAVLink.
+
+Every instance has its own Injector task on the event loop and its own
+MAVLink connection, so a slow link never delays the failures of other
+instances. Event times are
+absolute offsets from the start of the scenario, so a late event does not
+push back the ones after it.
+"""
+
+import random
+import struct
+import time
+from collections import OrderedDict
+
+from modules import eventloop
+
+# Parameters set by each failure. A callable gets the current value and
+# returns the failed one.
+FAILURES = OrderedDict([
+    ('GPS loss', {'SIM_GPS_DISABLE': 1}),
+    ('Engine failure', {'SIM_ENGINE_FAIL': 4, 'SIM_ENGINE_MUL': 0}),
+    ('Engine overheat', {'SIM_EFI_CHT_INC': 60}),
+    ('Airspeed sensor failure', {'SIM_ARSPD_FAIL': 1}),
+    ('Battery failure', {'SIM_BATT_VOLTAGE': lambda value: value * 0.7}),
+])
+
+# Files a SITL folder must have for a failure to exist, the parameters of
+# the engine overheat are added by the script of aircraft with an EFI engine
+REQUIRES = {
+    'Engine overheat': 'scripts/efi_sitl.lua',
+}
+
+# Seconds to wait for the vehicle to reply to a parameter request
+PARAM_TIMEOUT = 2.0
+# Seconds between checks of the event the injector waits for
+AFTER_INTERVAL = 0.5
+
+
+class FailureError(Exception):
+    """A failure could not be applied"""
+
+
+def new_seed():
+    """Get a random seed that is short enough to note down"""
+    return str(random.SystemRandom().randrange(100000, 1000000))
+
+
+def instance_seed(seed, instance):
+    """Get the seed of one instance, so a fleet gets different scenarios"""
+    return '{}/{}'.format(seed, instance)
+
+
+def available(names, has_file):
+    """
+    Get the failures of names an aircraft supports. has_file is called with
+    a path relative to its SITL folder and returns True if it is there.
+    """
+    return [name for name in names
+            if name not in REQUIRES or has_file(REQUIRES[name])]
+
+
+def plan(seed, failures, count, start, within, duration=0):
+    """
+    Pick count different failures and when they happen, between start and
+    start + within seconds. Failures are cleared after duration seconds, or
+    kept until the instance stops if duration is 0. Returns a sorted list of
+    (offset, action, failure) events, where action is 'inject' or 'clear'.
+    """
+    rng = random.Random(seed)
+    events = []
+    for name in rng.sample(list(failures), min(count, len(failures))):
+        offset = start + rng.uniform(0, within)
+        events.append((offset, 'inject', name))
+        if duration:
+            events.append((offset + duration, 'clear', name))
+    return sorted(events)
+
+
+class Injector(eventloop.LoopTask):
+    """
+    Play a planned scenario onto the MAVLink port of one instance. Failures
+    still active when it is stopped are cleared, so they are not left in
+    the eeprom of the next run. log is called from the event loop thread.
+    If after is given, an Event, the injector only connects once it is set,
+    leaving the port to whatever uses it first.
+    """
+    def __init__(self, port, events, log=print, host='127.0.0.1', after=None):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.events = events
+        self.log = log
+        self.after = after
+        self.start_time = None
+        # Failure name to the original values of its parameters
+        self.active = OrderedDict()
+        self._connection = None
+
+    def start(self, event_loop=None):
+        """Start the scenario clock and the injector task"""
+        self.start_time = time.monotonic()
+        super().start(event_loop)
+
+    def stop(self, timeout=PARAM_TIMEOUT * 2):
+        """Stop the scenario and clear the active failures"""
+        super().stop(timeout)
+
+    async def _param(self, name, value=None):
+        """Set a parameter if value is given, and return its value"""
+        connection = self._connection
+        if value is None:
+            connection.mav.param_request_read_send(
+                *connection.target, name.encode(), -1)
+        else:
+            connection.mav.param_set_send(
+                *connection.target, name.encode(), value,
+                connection.dialect.MAV_PARAM_TYPE_REAL32)
+        deadline = time.monotonic() + PARAM_TIMEOUT
+        while time.monotonic() < deadline:
+            msg = await connection.recv_match(
+                type='PARAM_VALUE', timeout=deadline - time.monotonic())
+            if msg is None or msg.param_id != name:
+                continue
+            # A vehicle that refused the value replies with the one it kept
+            if value is not None and (struct.pack('<f', msg.param_value) !=
+                                      struct.pack('<f', value)):
+                raise FailureError('{} not set, still {}'.format(
+                    name, msg.param_value))
+            return msg.param_value
+        raise FailureError('No reply for {}'.format(name))
+
+    async def _inject(self, name):
+        originals = {param: await self._param(param)
+                     for param in FAILURES[name]}
+        self.active[name] = originals
+        for param, value in FAILURES[name].items():
+            if callable(value):
+                value = value(originals[param])
+            await self._param(param, value)
+
+    async def _clear(self, name):
+        originals = self.active.pop(name, {})
+        for param, value in originals.items():
+            await self._param(param, value)
+
+    async def run(self):
+        try:
+            if self.after is not None:
+                while not self.after.is_set():
+                    if await self.sleep(AFTER_INTERVAL):
+                        return
+            # imported on first use
+            from modules import mavio
+            self._connection = await mavio.connect(
+                self.host, self.port, self, PARAM_TIMEOUT)
+            if self._connection is None:
+                return
+            for offset, action, name in self.events:
+                deadline = self.start_time + offset
+                if await self.sleep(max(0, deadline - time.monotonic())):
+                    break
+                late = time.monotonic() - deadline
+                try:
+                    if action == 'inject':
+                        await self._inject(name)
+                    else:
+                        await self._clear(name)
+                except FailureError as err:
+                    self.log('Failure {} {}: {}'.format(action, name, err))
+                    continue
+                self.log('Failure {}: {} at +{:.1f}s ({:.0f} ms late)'.format(
+                    'injected' if action == 'inject' else 'cleared', name,
+                    offset, late * 1000))
+            # Keep the failures until the instance is stopped
+            await self.sleep()
+        except (OSError, ImportError) as err:
+            self.log('Failure injection stopped: {}'.format(err))
+        finally:
+            await self._restore()
+
+    async def _restore(self):
+        if self._connection is None:
+            return
+        try:
+            for name in list(self.active):
+                await self._clear(name)
+        except (OSError, FailureError) as err:
+            self.log('Unable to clear failures: {}'.format(err))
+        self._connection.close()
+        self._connection = None
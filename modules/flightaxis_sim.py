@@ -0,0 +1,246 @@
+"""
+A local stand-in for the RealFlight FlightAxis SOAP interface. It answers
+RestoreOriginalControllerDevice, InjectUAVControllerInterface, ExchangeData
+and ResetAircraft like RealFlight does, with a simple flight model behind
+ExchangeData, so the RealFlight module can be exercised and benchmarked
+without RealFlight.
+
+Run it on the RealFlight port with:
+    python -m modules.flightaxis_sim
+"""
+
+import math
+import socketserver
+import threading
+import time
+
+from modules import realflight
+
+REPLY_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/" xmlns:SOAP-ENC="http://schemas.xmlsoap.org/soap/encoding/" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<SOAP-ENV:Body>
+"""
+REPLY_TAIL = """</SOAP-ENV:Body>
+</SOAP-ENV:Envelope>"""
+
+FAULT = """<SOAP-ENV:Fault>
+<faultcode>SOAP-ENV:Server</faultcode>
+<faultstring>{}</faultstring>
+</SOAP-ENV:Fault>
+"""
+
+# Tags of the aircraft state, in the order RealFlight sends them
+STATE_TAGS = (
+    'm-airspeed-MPS', 'm-altitudeASL-MTR', 'm-altitudeAGL-MTR',
+    'm-groundspeed-MPS', 'm-pitchRate-DEGpSEC', 'm-rollRate-DEGpSEC',
+    'm-yawRate-DEGpSEC', 'm-azimuth-DEG', 'm-inclination-DEG', 'm-roll-DEG',
+    'm-orientationQuaternion-X', 'm-orientationQuaternion-Y',
+    'm-orientationQuaternion-Z', 'm-orientationQuaternion-W',
+    'm-aircraftPositionX-MTR', 'm-aircraftPositionY-MTR',
+    'm-velocityWorldU-MPS', 'm-velocityWorldV-MPS', 'm-velocityWorldW-MPS',
+    'm-velocityBodyU-MPS', 'm-velocityBodyV-MPS', 'm-velocityBodyW-MPS',
+    'm-accelerationWorldAX-MPS2', 'm-accelerationWorldAY-MPS2',
+    'm-accelerationWorldAZ-MPS2', 'm-accelerationBodyAX-MPS2',
+    'm-accelerationBodyAY-MPS2', 'm-accelerationBodyAZ-MPS2',
+    'm-windX-MPS', 'm-windY-MPS', 'm-windZ-MPS', 'm-propRPM',
+    'm-heliMainRotorRPM', 'm-batteryVoltage-VOLTS',
+    'm-batteryCurrentDraw-AMPS', 'm-batteryRemainingCapacity-MAH',
+    'm-fuelRemaining-OZ', 'm-currentPhysicsTime-SEC',
+    'm-currentPhysicsSpeedMultiplier',
+)
+
+# Starting altitude of the aircraft on the runway
+GROUND_ASL = 454.0
+
+
+class FlightModel:
+    """
+    A very simple aircraft: channel 1 rolls, channel 2 pitches, channel 3 is
+    throttle. Good enough to return changing, plausible state.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Put the aircraft back on the runway"""
+        self.state = dict.fromkeys(STATE_TAGS, 0.0)
+        self.state['m-altitudeASL-MTR'] = GROUND_ASL
+        self.state['m-batteryVoltage-VOLTS'] = 50.4
+        self.state['m-batteryRemainingCapacity-MAH'] = 22000.0
+        self.state['m-fuelRemaining-OZ'] = 100.0
+        self.state['m-currentPhysicsSpeedMultiplier'] = 1.0
+        self.state['m-orientationQuaternion-W'] = 1.0
+        self.last_update = time.perf_counter()
+
+    def update(self, servos):
+        """Advance the model to the current time with the given servos"""
+        now = time.perf_counter()
+        dt = now - self.last_update
+        self.last_update = now
+        state = self.state
+
+        roll_cmd, pitch_cmd, throttle = (list(servos) + [0.0] * 3)[:3]
+        roll = (roll_cmd - 0.5) * 60.0
+        pitch = (pitch_cmd - 0.5) * 30.0
+        airspeed = throttle * 25.0
+        # Coordinated turn
+        yaw_rate = 0.0
+        if airspeed > 1.0:
+            yaw_rate = math.degrees(
+                9.81 * math.tan(math.radians(roll)) / airspeed)
+        climb = airspeed * math.sin(math.radians(pitch))
+        agl = max(0.0, state['m-altitudeAGL-MTR'] + climb * dt)
+        if agl == 0.0:
+            climb = 0.0
+        yaw = (state['m-azimuth-DEG'] + yaw_rate * dt) % 360.0
+        heading = math.radians(yaw)
+
+        inv_dt = 1.0 / dt if dt > 0 else 0.0
+        state['m-rollRate-DEGpSEC'] = (roll - state['m-roll-DEG']) * inv_dt
+        state['m-pitchRate-DEGpSEC'] = \
+            (pitch - state['m-inclination-DEG']) * inv_dt
+        state['m-yawRate-DEGpSEC'] = yaw_rate
+        state['m-roll-DEG'] = roll
+        state['m-inclination-DEG'] = pitch
+        state['m-azimuth-DEG'] = yaw
+        state['m-airspeed-MPS'] = airspeed
+        state['m-groundspeed-MPS'] = airspeed
+        state['m-velocityWorldU-MPS'] = airspeed * math.cos(heading)
+        state['m-velocityWorldV-MPS'] = airspeed * math.sin(heading)
+        state['m-velocityWorldW-MPS'] = -climb
+        state['m-velocityBodyU-MPS'] = airspeed
+        state['m-aircraftPositionX-MTR'] += \
+            state['m-velocityWorldU-MPS'] * dt
+        state['m-aircraftPositionY-MTR'] += \
+            state['m-velocityWorldV-MPS'] * dt
+        state['m-altitudeAGL-MTR'] = agl
+        state['m-altitudeASL-MTR'] = GROUND_ASL + agl
+        state['m-propRPM'] = throttle * 8000.0
+        state['m-batteryCurrentDraw-AMPS'] = throttle * 60.0
+        state['m-currentPhysicsTime-SEC'] += dt
+
+    def reply(self):
+        """Get the ReturnData body for the current state"""
+        items = ''.join('<{0}>{1:.6f}</{0}>\n'.format(tag, value)
+                        for tag, value in self.state.items())
+        return ('<ReturnData>\n<m-aircraftState>\n' + items +
+                '<m-isLocked>false</m-isLocked>\n'
+                '<m-anEngineIsRunning>true</m-anEngineIsRunning>\n'
+                '<m-isTouchingGround>{}</m-isTouchingGround>\n'
+                '<m-flightAxisControllerIsActive>true'
+                '</m-flightAxisControllerIsActive>\n'
+                '</m-aircraftState>\n<m-notifications>\n'
+                '<m-resetButtonHasBeenPressed>false'
+                '</m-resetButtonHasBeenPressed>\n'
+                '</m-notifications>\n</ReturnData>\n').format(
+                    'true' if self.state['m-altitudeAGL-MTR'] == 0.0
+                    else 'false')
+
+
+class FlightAxisHandler(socketserver.StreamRequestHandler):
+    """Serve SOAP requests on one keep-alive connection"""
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            # Read headers, the client may end lines with \n or \r\n
+            headers = {}
+            line = self.rfile.readline()
+            if not line:
+                return
+            while True:
+                line = self.rfile.readline()
+                if not line or not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = self.rfile.read(int(headers.get('content-length', 0)))
+            action = headers.get('soapaction', '').strip("'\"")
+
+            status, reply = self.server.dispatch(action, body)
+            reply = (REPLY_HEAD + reply + REPLY_TAIL).encode('utf-8')
+            self.wfile.write(
+                'HTTP/1.1 {}\r\nContent-Type: text/xml; charset="UTF-8"\r\n'
+                'Content-Length: {}\r\n\r\n'.format(
+                    status, len(reply)).encode('latin-1') + reply)
+            if self.server.close_after_reply:
+                return
+
+
+class FlightAxisServer(socketserver.ThreadingTCPServer):
+    """
+    Stand-in FlightAxis server. Port 0 picks a free port, see address. Set
+    close_after_reply to close the connection after every reply.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host=realflight.CONTROLLER_IP,
+                 port=realflight.CONTROLLER_PORT, close_after_reply=False):
+        super().__init__((host, port), FlightAxisHandler)
+        self.close_after_reply = close_after_reply
+        self.model = FlightModel()
+        self.injected = False
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    @property
+    def address(self):
+        """The (host, port) the server is listening on"""
+        return self.server_address
+
+    def start(self):
+        """Serve on a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, action, body):
+        """Handle one SOAP action, returning the HTTP status and reply"""
+        with self.lock:
+            if action == 'RestoreOriginalControllerDevice':
+                self.injected = False
+                return '200 OK', '<RestoreOriginalControllerDeviceResponse/>\n'
+            if action == 'InjectUAVControllerInterface':
+                self.injected = True
+                return '200 OK', '<InjectUAVControllerInterfaceResponse/>\n'
+            if action == 'ResetAircraft':
+                self.model.reset()
+                return '200 OK', '<ResetAircraftResponse/>\n'
+            if action == 'ExchangeData':
+                if not self.injected:
+                    return ('500 Internal Server Error', FAULT.format(
+                        'Controller interface has not been injected'))
+                values = body.split(b'<item>')[1:]
+                servos = [float(value.split(b'<', 1)[0]) for value in values]
+                self.model.update(servos)
+                return '200 OK', self.model.reply()
+        return ('500 Internal Server Error',
+                FAULT.format('Unknown action: {}'.format(action)))
+
+
+def main():
+    server = FlightAxisServer()
+    print('FlightAxis stand-in listening on {}:{}'.format(*server.address))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('Interrupted')
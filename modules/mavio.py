@@ -0,0 +1,125 @@
+"""
+MAVLink over asyncio streams, for the tasks on the event loop. pymavlink is
+only used to encode and decode: bytes read from the StreamReader are parsed
+into messages, and messages are sent by writing to the StreamWriter, so a
+link waiting for a vehicle never holds a thread.
+
+pymavlink is slow to import and only needed once an instance is up, so the
+tasks using this module import it on first use.
+"""
+
+import asyncio
+import collections
+import time
+
+from pymavlink.dialects.v20 import ardupilotmega
+
+# Bytes read from the socket at a time
+READ_SIZE = 65536
+# System and component ids of the launcher, those of a ground station
+SOURCE_SYSTEM = 255
+SOURCE_COMPONENT = 0
+# Seconds between connection attempts while SITL is starting
+RETRY_INTERVAL = 0.5
+
+
+class MavlinkStream:
+    """
+    A MAVLink connection to a TCP port. mav is the pymavlink encoder, whose
+    *_send methods write to the connection, and dialect its message module.
+    """
+    def __init__(self, reader, writer, dialect):
+        self.reader = reader
+        self.writer = writer
+        self.dialect = dialect
+        # System and component of the vehicle, once connect saw its heartbeat
+        self.target = None
+        self.mav = dialect.MAVLink(self, srcSystem=SOURCE_SYSTEM,
+                                   srcComponent=SOURCE_COMPONENT)
+        self.mav.robust_parsing = True
+        self._pending = collections.deque()
+
+    @classmethod
+    async def open(cls, host, port):
+        """Connect to a port, raises OSError if nothing is listening"""
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, ardupilotmega)
+
+    def write(self, data):
+        """Called by mav for every message sent"""
+        self.writer.write(data)
+
+    async def recv(self, timeout=None):
+        """
+        Get the next message, or None if none arrived within timeout
+        seconds. Raises ConnectionError once the vehicle closed the link.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._pending:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            try:
+                data = await asyncio.wait_for(self.reader.read(READ_SIZE),
+                                              remaining)
+            except asyncio.TimeoutError:
+                return None
+            if not data:
+                raise ConnectionError('Connection closed by the vehicle')
+            now = time.time()
+            for msg in self.mav.parse_buffer(data) or ():
+                if msg.get_type() == 'BAD_DATA':
+                    continue
+                msg._timestamp = now
+                self._pending.append(msg)
+        return self._pending.popleft()
+
+    async def recv_match(self, type=None, timeout=None):
+        """
+        Get the next message of a type, or of one of a list of types, or
+        None if none arrived within timeout seconds
+        """
+        types = [type] if isinstance(type, str) else type
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            msg = await self.recv(remaining)
+            if msg is None:
+                return None
+            if types is None or msg.get_type() in types:
+                return msg
+
+    async def wait_heartbeat(self, timeout=None):
+        return await self.recv_match('HEARTBEAT', timeout)
+
+    def close(self):
+        self.writer.close()
+
+
+async def connect(host, port, task, heartbeat_timeout=None):
+    """
+    Connect to a port, trying again every RETRY_INTERVAL seconds until it
+    accepts or task, a LoopTask, is stopped. With heartbeat_timeout, a
+    connection that gets no HEARTBEAT within that many seconds is closed and
+    tried again, and target is set from the heartbeat. Returns None if the
+    task was stopped first.
+    """
+    while not task.stopping:
+        try:
+            connection = await MavlinkStream.open(host, port)
+        except OSError:
+            await task.sleep(RETRY_INTERVAL)
+            continue
+        if heartbeat_timeout is None:
+            return connection
+        heartbeat = await connection.wait_heartbeat(heartbeat_timeout)
+        if heartbeat is not None:
+            connection.target = (heartbeat.get_srcSystem(),
+                                 heartbeat.get_srcComponent())
+            return connection
+        connection.close()
+    return None
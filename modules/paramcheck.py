@@ -0,0 +1,180 @@
+"""
+Post-boot parameter check. Once an instance is up, its whole parameter
+table is fetched over MAVLink with one PARAM_REQUEST_LIST, the indices the
+stream missed are requested again by index all at once, and the values are
+compared with the defaults.param it was started with. Values that differ,
+such as @READONLY values a version does not accept, are reported in the
+console of the instance as soon as the table arrived. Parameters it does
+not have are asked for again by name a few seconds later, as scripts add
+theirs after boot, and those still missing are reported then.
+
+The check runs as a task on the event loop. It shares the failure
+injection port, and runs first: the injector waits for done before
+connecting.
+"""
+
+import os
+import time
+
+from modules import eventloop
+from modules import params
+
+# Seconds allowed to fetch the whole table
+FETCH_TIMEOUT = 10.0
+# Seconds without a PARAM_VALUE before the missing indices are requested
+STALL_TIMEOUT = 0.3
+# Times the missing indices are requested again
+RETRIES = 3
+HEARTBEAT_TIMEOUT = 2.0
+# Seconds to wait before asking again for parameters the vehicle did not
+# have, as scripts only add theirs a few seconds after boot
+RECHECK_DELAY = 5.0
+# Mismatches listed in the console, the rest are only counted
+MAX_REPORTED = 30
+
+
+async def fetch_params(connection, target, timeout=FETCH_TIMEOUT, stop=None):
+    """
+    Get every parameter of a vehicle as a dictionary of name to value, and
+    the list of indices that never arrived. stop is a callable returning
+    True once the fetch should give up.
+    """
+    connection.mav.param_request_list_send(*target)
+    values = {}
+    indices = set()
+    count = None
+    retries = 0
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if stop is not None and stop():
+            break
+        msg = await connection.recv_match(type='PARAM_VALUE',
+                                          timeout=STALL_TIMEOUT)
+        if msg is not None:
+            values[msg.param_id] = msg.param_value
+            # Values sent because a parameter changed have no index
+            if msg.param_index < msg.param_count:
+                indices.add(msg.param_index)
+            # The count grows when scripts add their parameters
+            count = msg.param_count
+            if len(indices) >= count:
+                break
+            continue
+        # The stream stalled, ask again for whatever is missing
+        if retries >= RETRIES:
+            break
+        retries += 1
+        if count is None:
+            connection.mav.param_request_list_send(*target)
+            continue
+        for index in range(count):
+            if index not in indices:
+                connection.mav.param_request_read_send(*target, b'', index)
+    missing = [] if count is None else [
+        index for index in range(count) if index not in indices]
+    return values, missing
+
+
+async def fetch_named(connection, target, names, timeout=FETCH_TIMEOUT, stop=None):
+    """Request parameters by name all at once, get those that exist"""
+    for name in names:
+        connection.mav.param_request_read_send(*target, name.encode(), -1)
+    wanted = set(names)
+    values = {}
+    deadline = time.monotonic() + timeout
+    # A vehicle does not reply for names it does not have, so give up once
+    # replies stop coming
+    while wanted and time.monotonic() < deadline:
+        if stop is not None and stop():
+            break
+        msg = await connection.recv_match(type='PARAM_VALUE',
+                                          timeout=STALL_TIMEOUT * 3)
+        if msg is None:
+            break
+        if msg.param_id in wanted:
+            wanted.discard(msg.param_id)
+            values[msg.param_id] = msg.param_value
+    return values
+
+
+class Verifier(eventloop.LoopTask):
+    """
+    Check the parameters of one instance against its defaults file on the
+    event loop. log is called from the loop thread. done is set once the
+    check finished or gave up, and the port is free again.
+    """
+    def __init__(self, port, defaults_path, log=print, host='127.0.0.1'):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.defaults_path = defaults_path
+        self.log = log
+        self.result = None
+
+    async def run(self):
+        connection = None
+        try:
+            if not os.path.isfile(self.defaults_path):
+                return
+            expected = params.load(self.defaults_path)
+            # imported on first use
+            from modules import mavio
+            connection = await mavio.connect(
+                self.host, self.port, self, HEARTBEAT_TIMEOUT)
+            if connection is None:
+                return
+            target = connection.target
+            start = time.monotonic()
+            values, lost = await fetch_params(
+                connection, target, stop=lambda: self.stopping)
+            if self.stopping:
+                return
+            self.result = params.mismatches(expected, values)
+            differ, missing = self.result
+            self._report_differ(differ)
+            self.log('Parameter check: {} received{} in {:.1f} s, {} differ, '
+                     '{} missing{}'.format(
+                         len(values),
+                         ', {} lost'.format(len(lost)) if lost else '',
+                         time.monotonic() - start, len(differ), len(missing),
+                         ', checking again in {:.0f} s'.format(RECHECK_DELAY)
+                         if missing else ''))
+            # Only the names still missing are asked for again
+            if not missing or await self.sleep(RECHECK_DELAY):
+                return
+            found = await fetch_named(connection, target, missing,
+                                      stop=lambda: self.stopping)
+            if self.stopping:
+                return
+            values.update(found)
+            self.result = params.mismatches(expected, values)
+            self._report_differ([item for item in self.result[0]
+                                 if item[0] in found])
+            self._report_missing(self.result[1])
+            self.log('Parameter check: {} of {} missing found on recheck, '
+                     '{} differ, {} missing'.format(
+                         len(found), len(missing), len(self.result[0]),
+                         len(self.result[1])))
+        except (OSError, ImportError) as err:
+            self.log('Parameter check stopped: {}'.format(err))
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def _report_differ(self, differ):
+        for name, expected, actual, readonly in differ[:MAX_REPORTED]:
+            self.log('Parameter mismatch: {} is {}, defaults.param has {}{}'.format(
+                name, params.format_value(actual),
+                params.format_value(expected),
+                ' (@READONLY)' if readonly else ''))
+        if len(differ) > MAX_REPORTED:
+            self.log('Parameter check: {} more not listed'.format(
+                len(differ) - MAX_REPORTED))
+
+    def _report_missing(self, missing):
+        for name in missing[:MAX_REPORTED]:
+            self.log('Parameter mismatch: {} is not in this version'.format(
+                name))
+        if len(missing) > MAX_REPORTED:
+            self.log('Parameter check: {} more not listed'.format(
+                len(missing) - MAX_REPORTED))
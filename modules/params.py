@@ -0,0 +1,420 @@
+"""
+Parameter file engine. Parameter files are parsed once into an ordered index
+that keeps the flags of every line (such as @READONLY). The defaults of an
+aircraft variant are composed from layered overlays in params/<aircraft>/:
+
+    base.param              shared by every version and mode
+    <hl|rf>.param           shared by every version in headless/RealFlight
+    <version>.param         shared by both modes of a version
+    <version>_<hl|rf>.param specific to one variant
+
+Later layers override earlier ones. Every variant has its own layer, which
+may only hold comments; the shared layers are skipped if missing. The
+composed file is only written to a working directory when its content hash
+changes.
+"""
+
+import fnmatch
+import hashlib
+import os
+import re
+import struct
+
+PARAMS_DIR = 'params'
+DEFAULTS_FILE = 'defaults.param'
+
+# Parameters always published, and parameters never published, when
+# extracting non-default parameters
+INCLUDE_PARAMS = ['Q_ENABLE', 'Q_FRAME*', 'AFS_*']
+EXCLUDE_PARAMS = ['AHRS_TRIM_?',
+                  '*GND_PRESS',
+                  'COMPASS_EXTERN*',
+                  'COMPASS_DEC',
+                  'COMPASS_DIA*',
+                  'COMPASS_ODI*',
+                  '*_ABS_PRESS',
+                  'SR?_*',
+                  'STAT_*',
+                  'SYS_NUM_RESETS',
+                  '*_DEV_ID',
+                  '*_DEVID', ]
+# Compass and accel calibrations, not published for physical aircraft
+CALIBRATION_PARAMS = ['COMPASS_OFS*', 'INS_*OFFS_?', 'INS_*SCAL_?']
+# Parameters never taken from a file as values, as pymavlink's mavparm does
+EXCLUDE_LOAD = ['ARSPD_OFFSET',
+                'CMD_INDEX',
+                'CMD_TOTAL',
+                'FENCE_TOTAL',
+                'FORMAT_VERSION',
+                'GND_ABS_PRESS',
+                'GND_TEMP',
+                'LOG_LASTFILE',
+                'MIS_TOTAL',
+                'SYSID_SW_MREV',
+                'SYS_NUM_RESETS', ]
+
+
+class Param:
+    """A parameter value as written in the file, and its flags"""
+    __slots__ = ('value', 'flags')
+
+    def __init__(self, value, flags=()):
+        self.value = value
+        self.flags = tuple(flags)
+
+    def __eq__(self, other):
+        return (isinstance(other, Param) and self.flags == other.flags
+                and _same_value(self.value, other.value))
+
+    def __repr__(self):
+        return 'Param({!r}, {!r})'.format(self.value, self.flags)
+
+    @property
+    def readonly(self):
+        """True if the parameter is flagged @READONLY"""
+        return '@READONLY' in self.flags
+
+    def as_float(self):
+        """The value as a number, hexadecimal values included"""
+        try:
+            return float(self.value)
+        except ValueError:
+            return float(int(self.value, 0))
+
+
+def _same_value(first, second):
+    """Compare two values as numbers if possible, so 1.0 equals 1"""
+    if first == second:
+        return True
+    try:
+        return float(first) == float(second)
+    except ValueError:
+        return False
+
+
+class ParamFile:
+    """
+    An ordered index of parameter name to Param, with the comment lines at
+    the top of the file.
+    """
+    def __init__(self, params=None, comments=None):
+        self.params = dict(params or {})
+        self.comments = list(comments or [])
+
+    def __contains__(self, name):
+        return name in self.params
+
+    def __getitem__(self, name):
+        return self.params[name]
+
+    def __iter__(self):
+        return iter(self.params)
+
+    def __len__(self):
+        return len(self.params)
+
+    def items(self):
+        return self.params.items()
+
+    def copy(self):
+        return ParamFile(self.params, self.comments)
+
+    def update(self, other):
+        """Overlay another file on this one"""
+        self.params.update(other.params)
+
+    def render(self):
+        """Get the file content, parameters sorted by name"""
+        lines = ['# ' + comment for comment in self.comments]
+        for name in sorted(self.params):
+            param = self.params[name]
+            lines.append(' '.join(
+                ('{},{}'.format(name, param.value),) + param.flags))
+        return '\n'.join(lines) + '\n'
+
+
+def parse_text(text):
+    """
+    Parse parameter file content. Accepts NAME,VALUE and NAME VALUE lines,
+    each optionally followed by @FLAGS and a # comment, and the tab
+    separated lines of QGroundControl .params files.
+    """
+    params = {}
+    comments = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            # Only keep the header comments
+            if not params:
+                comments.append(line[1:].strip())
+            continue
+        line = line.split('#', 1)[0].strip()
+        fields = line.split('\t')
+        if len(fields) >= 4 and fields[0].isdigit() and fields[1].isdigit():
+            # Vehicle id, component id, name, value and type
+            params[fields[2].strip()] = Param(fields[3].strip())
+            continue
+        fields = line.replace(',', ' ').split()
+        if len(fields) < 2:
+            continue
+        params[fields[0]] = Param(fields[1], fields[2:])
+    return ParamFile(params, comments)
+
+
+# Parsed files by path, with the mtime and size they were parsed at
+_cache = {}
+
+
+def load(path):
+    """Parse a parameter file, reusing the last parse if it is unchanged"""
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'r', encoding='UTF-8') as f:
+        param_file = parse_text(f.read())
+    _cache[path] = (key, param_file)
+    return param_file
+
+
+def layer_names(version, headless):
+    """Get the overlay file names of a variant, in the order applied"""
+    version = ''.join(version.lower().split())
+    mode = 'hl' if headless else 'rf'
+    return ['base.param', mode + '.param', version + '.param',
+            '{}_{}.param'.format(version, mode)]
+
+
+def has_overlays(aircraft_key, params_dir=PARAMS_DIR):
+    """True if the aircraft defaults are built from overlays"""
+    return os.path.isdir(os.path.join(params_dir, aircraft_key))
+
+
+def compose(aircraft_key, version, headless, params_dir=PARAMS_DIR):
+    """
+    Compose the defaults of a variant from its overlays. Raises
+    FileNotFoundError if the variant has no layer of its own.
+    """
+    names = layer_names(version, headless)
+    variant_path = os.path.join(params_dir, aircraft_key, names[-1])
+    if not os.path.isfile(variant_path):
+        raise FileNotFoundError('Missing parameter overlay: {}'.format(
+            variant_path))
+
+    composed = ParamFile()
+    used = []
+    for name in names:
+        path = os.path.join(params_dir, aircraft_key, name)
+        if os.path.isfile(path):
+            composed.update(load(path))
+            used.append(name)
+    # Keep the description of the variant
+    composed.comments = load(variant_path).comments + [
+        'Generated from {}/{}: {}'.format(
+            params_dir, aircraft_key, ', '.join(used))]
+    return composed
+
+
+def content_hash(content):
+    """Hash of parameter file content"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def materialize(aircraft_key, version, headless, dest_dir,
+                params_dir=PARAMS_DIR):
+    """
+    Write the composed defaults of a variant to dest_dir, only if the
+    content changed. Returns True if the file was written.
+    """
+    content = compose(aircraft_key, version, headless, params_dir).render()
+    path = os.path.join(dest_dir, DEFAULTS_FILE)
+    if _file_hash(path) == content_hash(content):
+        return False
+    os.makedirs(dest_dir, exist_ok=True)
+    with open(path, 'w', encoding='UTF-8', newline='\n') as f:
+        f.write(content)
+    return True
+
+
+def override(path, overrides):
+    """
+    Set parameters of a defaults file to new values, keeping their flags.
+    overrides maps name to value. Only writes the file if it changed,
+    returns True if it was written.
+    """
+    param_file = load(path).copy() if os.path.isfile(path) else ParamFile()
+    for name, value in overrides.items():
+        flags = param_file[name].flags if name in param_file else ()
+        param_file.params[name] = Param(format_value(value), flags)
+    param_file.comments = param_file.comments + [
+        'Overridden: {}'.format(', '.join(sorted(overrides)))]
+    content = param_file.render()
+    if _file_hash(path) == content_hash(content):
+        return False
+    with open(path, 'w', encoding='UTF-8', newline='\n') as f:
+        f.write(content)
+    return True
+
+
+def factor(variants):
+    """
+    Split the parameter files of one aircraft into overlays. variants maps
+    (version, headless) to a ParamFile. Returns a dictionary of overlay file
+    name to ParamFile. Shared layers are left out when empty, variant layers
+    are always returned. Composing the overlays gives back every variant.
+    """
+    def common(files):
+        files = list(files)
+        shared = dict(files[0].items())
+        for param_file in files[1:]:
+            shared = {name: param for name, param in shared.items()
+                      if param_file.params.get(name) == param}
+        return shared
+
+    def without(shared, *layers):
+        return {name: param for name, param in shared.items()
+                if not any(name in layer for layer in layers)}
+
+    # Every shared layer only holds values found in all the variants it is
+    # applied to, so layers never disagree about a value
+    base = common(variants.values())
+    layers = {'base.param': ParamFile(base)}
+
+    mode_layers = {}
+    for headless in {mode for _, mode in variants}:
+        mode_layers[headless] = without(common(
+            param_file for (_, mode), param_file in variants.items()
+            if mode == headless), base)
+        layers[layer_names('', headless)[1]] = ParamFile(
+            mode_layers[headless])
+
+    variant_layers = {}
+    for version in {ver for ver, _ in variants}:
+        version_layer = without(common(
+            param_file for (ver, _), param_file in variants.items()
+            if ver == version), base)
+        layers[layer_names(version, True)[2]] = ParamFile(version_layer)
+
+        for (ver, headless), target in variants.items():
+            if ver != version:
+                continue
+            variant_layers[layer_names(version, headless)[3]] = ParamFile(
+                without(target.params, base, mode_layers[headless],
+                        version_layer),
+                target.comments)
+
+    layers = {name: layer for name, layer in layers.items() if len(layer)}
+    layers.update(variant_layers)
+    return layers
+
+
+def compile_patterns(patterns):
+    """
+    Compile a list of glob patterns into one matcher. Returns a function
+    that is True if a name matches any of the patterns.
+    """
+    if not patterns:
+        return lambda name: False
+    regex = re.compile('|'.join(
+        '(?:{})'.format(fnmatch.translate(pattern)) for pattern in patterns))
+    return lambda name: regex.match(name) is not None
+
+
+def format_value(value):
+    """Format a number without trailing zeros, so 27.000 becomes 27"""
+    text = str(float(value))
+    if '.' in text and 'e' not in text:
+        text = text.rstrip('0').rstrip('.')
+    return text
+
+
+def as_values(param_file, skip=EXCLUDE_LOAD):
+    """
+    Get a dictionary of name to float value of a ParamFile, leaving out the
+    names in skip and values that are not numbers
+    """
+    values = {}
+    for name, param in param_file.items():
+        if name in skip:
+            continue
+        try:
+            values[name] = param.as_float()
+        except ValueError:
+            continue
+    return values
+
+
+def non_defaults(defaults, values, include=None, exclude=None):
+    """
+    Find the parameters of values that differ from defaults, both
+    dictionaries of name to float. include and exclude are compiled
+    matchers, by default built from INCLUDE_PARAMS and EXCLUDE_PARAMS, with
+    CALIBRATION_PARAMS excluded for physical aircraft. Returns a list of
+    (name, value) and a list of names missing from defaults.
+    """
+    if include is None:
+        include = compile_patterns(INCLUDE_PARAMS)
+    if exclude is None:
+        patterns = list(EXCLUDE_PARAMS)
+        if 'SIM_OPOS_LAT' not in values:
+            patterns += CALIBRATION_PARAMS
+        exclude = compile_patterns(patterns)
+
+    changed = []
+    missing = []
+    for name, value in values.items():
+        included = include(name)
+        if not included and exclude(name):
+            continue
+        if name not in defaults:
+            missing.append(name)
+            continue
+        if defaults[name] == value and not included:
+            continue
+        changed.append((name, value))
+    return changed, missing
+
+
+def _float32(value):
+    """Round a value the way MAVLink sends it"""
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def mismatches(expected, actual, include=None, exclude=None):
+    """
+    Check the values a vehicle reports against a parameter file, with the
+    same include and exclude rules as non_defaults. expected is a ParamFile,
+    actual a dictionary of name to float as received over MAVLink. Returns
+    a list of (name, expected, actual, readonly) for values that differ and
+    a list of names the vehicle does not have.
+    """
+    if include is None:
+        include = compile_patterns(INCLUDE_PARAMS)
+    if exclude is None:
+        exclude = compile_patterns(EXCLUDE_PARAMS)
+
+    differ = []
+    missing = []
+    for name, param in expected.items():
+        if not include(name) and exclude(name):
+            continue
+        try:
+            value = param.as_float()
+        except ValueError:
+            continue
+        if name not in actual:
+            missing.append(name)
+        elif _float32(value) != _float32(actual[name]):
+            differ.append((name, value, actual[name], param.readonly))
+    return differ, missing
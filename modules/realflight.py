@@ -3,90 +3,527 @@ A collection of tools for launching RealFlight 9.5, and for editing start-up
 and airport files to configure the simulator for use with the SITL Launcher.
 """
 
+import asyncio
+import re
 import socket
 import time
+from array import array
 
 CONTROLLER_IP = '127.0.0.1'
 CONTROLLER_PORT = 18083
+# Seconds to wait for RealFlight to connect or reply
+TIMEOUT = 2.0
 
 DEFAULT_SERVOS = [0]*12
+NUM_CHANNELS = 12
 
+# Channel values are sent with a fixed width so the message length never
+# changes: one pre-encoded string per step of 1/CHANNEL_STEPS
+CHANNEL_STEPS = 10000
+CHANNEL_VALUES = [b'%.4f' % (step / CHANNEL_STEPS)
+                  for step in range(CHANNEL_STEPS + 1)]
+CHANNEL_WIDTH = len(CHANNEL_VALUES[0])
 
-def reset_aircraft():
-    """
-    Initialize SOAP connection to RealFlight, send default servo values,
-    and reset aircraft position.
-    """
-    # Call a restore first. This allows us to connect after the aircraft is
-    # changed in RealFlight
-    _soap_request_start("RestoreOriginalControllerDevice", """<?xml version='1.0' encoding='UTF-8'?>
+RESTORE_BODY = """<?xml version='1.0' encoding='UTF-8'?>
 <soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
 <soap:Body>
 <RestoreOriginalControllerDevice><a>1</a><b>2</b></RestoreOriginalControllerDevice>
 </soap:Body>
-</soap:Envelope>""")
-    # Pause 1 second
-    time.sleep(0.1)
-    # Inject controller interface
-    _soap_request_start("InjectUAVControllerInterface", """<?xml version='1.0' encoding='UTF-8'?>
+</soap:Envelope>"""
+
+INJECT_BODY = """<?xml version='1.0' encoding='UTF-8'?>
 <soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
 <soap:Body>
 <InjectUAVControllerInterface><a>1</a><b>2</b></InjectUAVControllerInterface>
 </soap:Body>
-</soap:Envelope>""")
-    # Pause 1 second
-    time.sleep(0.1)
+</soap:Envelope>"""
 
+RESET_BODY = """<?xml version='1.0' encoding='UTF-8'?>
+<soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
+<soap:Body>
+<ResetAircraft><a>1</a><b>2</b></ResetAircraft>
+</soap:Body>
+</soap:Envelope>"""
 
-    # Send default servo values
-    _soap_request_start("ExchangeData", f"""<?xml version='1.0' encoding='UTF-8'?><soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
+
+class SoapError(Exception):
+    """RealFlight replied with an HTTP error or a SOAP fault"""
+    def __init__(self, action, status, message):
+        super().__init__('{} rejected ({}): {}'.format(action, status, message))
+        self.action = action
+        self.status = status
+        self.message = message
+
+
+class SoapResponse:
+    """A parsed HTTP reply from RealFlight. The body is decoded on demand"""
+    def __init__(self, status, reason, headers, raw):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.raw = raw
+
+    @property
+    def body(self):
+        """The reply body as text"""
+        return self.raw.decode('utf-8', 'replace')
+
+    @property
+    def fault(self):
+        """The SOAP fault string, or None if the call succeeded"""
+        if '<faultstring>' in self.body:
+            start = self.body.index('<faultstring>') + len('<faultstring>')
+            return self.body[start:self.body.find('</faultstring>', start)]
+        if 'Fault>' in self.body:
+            return 'SOAP fault'
+        return None
+
+    @property
+    def ok(self):
+        """True if RealFlight accepted the call"""
+        return self.status == 200 and self.fault is None
+
+
+class FlightAxisClient:
+    """
+    SOAP client for the RealFlight FlightAxis interface. Holds one keep-alive
+    connection, reconnects when RealFlight closes it, and reads every reply
+    before the next call is made.
+    """
+    def __init__(self, host=CONTROLLER_IP, port=CONTROLLER_PORT,
+                 timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self._buffer = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def connect(self):
+        """Open the connection if it is not already open"""
+        if self.sock is None:
+            self.sock = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._buffer = b''
+
+    def close(self):
+        """Close the connection"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, action, body, check=True):
+        """
+        Send one SOAP action and return the parsed reply. A stale keep-alive
+        connection is reopened and the call retried once. If check is set,
+        SoapError is raised when RealFlight rejects the call.
+        """
+        return self.call(action, encode_request(action, body), check)
+
+    def call(self, action, req, check=True):
+        """Send an already encoded SOAP request, see request"""
+        response = self.send(req)
+        if check and not response.ok:
+            raise SoapError(action, response.status,
+                            response.fault or response.reason)
+        return response
+
+    def send(self, req):
+        """Send an encoded request and read its reply"""
+        for attempt in range(2):
+            reused = self.sock is not None
+            self.connect()
+            try:
+                self.sock.sendall(req)
+                response = self._read_response()
+            except (ConnectionError, EOFError):
+                self.close()
+                # Only retry if the failure was on a reused connection
+                if attempt or not reused:
+                    raise
+                continue
+            except OSError:
+                self.close()
+                raise
+            if response.headers.get('connection', '').lower() == 'close':
+                self.close()
+            return response
+
+    def _read_until(self, marker):
+        """Read from the socket until marker is in the buffer"""
+        while marker not in self._buffer:
+            self._recv()
+        head, self._buffer = self._buffer.split(marker, 1)
+        return head
+
+    def _read_exact(self, length):
+        """Read exactly length bytes"""
+        while len(self._buffer) < length:
+            self._recv()
+        data, self._buffer = self._buffer[:length], self._buffer[length:]
+        return data
+
+    def _recv(self):
+        """Append the next chunk from the socket to the buffer"""
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise EOFError('RealFlight closed the connection')
+        self._buffer += chunk
+
+    def _read_response(self):
+        """Read and parse one HTTP response"""
+        status, reason, headers = parse_head(self._read_until(b'\r\n\r\n'))
+        if 'content-length' in headers:
+            body = self._read_exact(int(headers['content-length']))
+        else:
+            # No length given, the body ends when the connection closes
+            body = self._buffer
+            try:
+                while True:
+                    self._recv()
+            except EOFError:
+                body = self._buffer
+            self._buffer = b''
+            headers['connection'] = 'close'
+        return SoapResponse(status, reason, headers, body)
+
+
+class AsyncFlightAxisClient:
+    """
+    FlightAxisClient for the event loop, on asyncio streams. The calls are
+    the same and are awaited, so waiting for RealFlight holds no thread.
+    """
+    def __init__(self, host=CONTROLLER_IP, port=CONTROLLER_PORT,
+                 timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    async def connect(self):
+        """Open the connection if it is not already open"""
+        if self.writer is None:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    self.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError('RealFlight did not accept the '
+                                   'connection') from None
+
+    def close(self):
+        """Close the connection"""
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, action, body, check=True):
+        """Send one SOAP action and return the parsed reply"""
+        return await self.call(action, encode_request(action, body), check)
+
+    async def call(self, action, req, check=True):
+        """Send an already encoded SOAP request, see request"""
+        response = await self.send(req)
+        if check and not response.ok:
+            raise SoapError(action, response.status,
+                            response.fault or response.reason)
+        return response
+
+    async def send(self, req):
+        """Send an encoded request and read its reply"""
+        for attempt in range(2):
+            reused = self.writer is not None
+            await self.connect()
+            try:
+                self.writer.write(req)
+                response = await asyncio.wait_for(self._exchange(),
+                                                  self.timeout)
+            except (ConnectionError, EOFError):
+                self.close()
+                # Only retry if the failure was on a reused connection
+                if attempt or not reused:
+                    raise
+                continue
+            except asyncio.TimeoutError:
+                self.close()
+                raise TimeoutError('RealFlight did not reply') from None
+            except OSError:
+                self.close()
+                raise
+            if response.headers.get('connection', '').lower() == 'close':
+                self.close()
+            return response
+
+    async def _exchange(self):
+        """
+        Wait for the request to be sent, so the write buffer never grows
+        while RealFlight stalls, and read the reply
+        """
+        await self.writer.drain()
+        return await self._read_response()
+
+    async def _read_response(self):
+        """Read and parse one HTTP response"""
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status, reason, headers = parse_head(head[:-4])
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(
+                int(headers['content-length']))
+        else:
+            # No length given, the body ends when the connection closes
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        return SoapResponse(status, reason, headers, body)
+
+
+def parse_head(head):
+    """Get the status, reason and lowercase headers of an HTTP reply head"""
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    parts = status_line.split(' ', 2)
+    status = int(parts[1])
+    reason = parts[2] if len(parts) > 2 else ''
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, reason, headers
+
+
+def encode_request(action, body):
+    """Encode a SOAP action as an HTTP request"""
+    pkt = body.encode('utf-8')
+    return f"""POST / HTTP/1.1
+soapaction: '{action}'
+content-length: {len(pkt)}
+content-type: text/xml;charset='UTF-8'
+Connection: Keep-Alive
+
+""".encode('utf-8') + pkt
+
+
+class ExchangeDataTemplate:
+    """
+    A pre-encoded ExchangeData request. Channel values are written into fixed
+    offsets of the request, so sending a servo vector needs no string
+    formatting or encoding.
+    """
+    def __init__(self, channels=NUM_CHANNELS):
+        placeholder = '#' * CHANNEL_WIDTH
+        items = ''.join('<item>{}</item>\n'.format(placeholder)
+                        for _ in range(channels))
+        body = f"""<?xml version='1.0' encoding='UTF-8'?><soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
 <soap:Body>
 <ExchangeData>
 <pControlInputs>
-<m-selectedChannels>4095</m-selectedChannels>
+<m-selectedChannels>{(1 << channels) - 1}</m-selectedChannels>
 <m-channelValues-0to1>
-<item>{DEFAULT_SERVOS[0]}</item>
-<item>{DEFAULT_SERVOS[1]}</item>
-<item>{DEFAULT_SERVOS[2]}</item>
-<item>{DEFAULT_SERVOS[3]}</item>
-<item>{DEFAULT_SERVOS[4]}</item>
-<item>{DEFAULT_SERVOS[5]}</item>
-<item>{DEFAULT_SERVOS[6]}</item>
-<item>{DEFAULT_SERVOS[7]}</item>
-<item>{DEFAULT_SERVOS[8]}</item>
-<item>{DEFAULT_SERVOS[9]}</item>
-<item>{DEFAULT_SERVOS[10]}</item>
-<item>{DEFAULT_SERVOS[11]}</item>
-</m-channelValues-0to1>
+{items}</m-channelValues-0to1>
 </pControlInputs>
 </ExchangeData>
 </soap:Body>
-</soap:Envelope>""")
-    # Pause 1 second
-    time.sleep(0.1)
+</soap:Envelope>"""
+        self.buffer = bytearray(encode_request('ExchangeData', body))
+        # Find where each channel value goes
+        self.offsets = []
+        start = 0
+        for _ in range(channels):
+            start = self.buffer.index(placeholder.encode('ascii'), start)
+            self.offsets.append(start)
+            start += CHANNEL_WIDTH
+
+    def encode(self, servos):
+        """Write servo values in the range 0 to 1 into the request"""
+        buffer = self.buffer
+        for offset, servo in zip(self.offsets, servos):
+            step = int(servo * CHANNEL_STEPS + 0.5)
+            if step < 0:
+                step = 0
+            elif step > CHANNEL_STEPS:
+                step = CHANNEL_STEPS
+            buffer[offset:offset + CHANNEL_WIDTH] = CHANNEL_VALUES[step]
+        return buffer
+
+
+class FlightAxisState:
+    """
+    Aircraft state returned by ExchangeData. Positions are in metres, angles
+    in degrees, rates in degrees per second and velocities in m/s.
+    """
+    # Slot name and the FlightAxis tag it is read from
+    FIELDS = (
+        ('time', 'm-currentPhysicsTime-SEC'),
+        ('x', 'm-aircraftPositionX-MTR'),
+        ('y', 'm-aircraftPositionY-MTR'),
+        ('alt_asl', 'm-altitudeASL-MTR'),
+        ('alt_agl', 'm-altitudeAGL-MTR'),
+        ('roll', 'm-roll-DEG'),
+        ('pitch', 'm-inclination-DEG'),
+        ('yaw', 'm-azimuth-DEG'),
+        ('roll_rate', 'm-rollRate-DEGpSEC'),
+        ('pitch_rate', 'm-pitchRate-DEGpSEC'),
+        ('yaw_rate', 'm-yawRate-DEGpSEC'),
+        ('vel_u', 'm-velocityWorldU-MPS'),
+        ('vel_v', 'm-velocityWorldV-MPS'),
+        ('vel_w', 'm-velocityWorldW-MPS'),
+        ('airspeed', 'm-airspeed-MPS'),
+    )
+    __slots__ = tuple(name for name, _ in FIELDS)
+
+    # Match every <m-tag>value</m-tag> element of the reply
+    PATTERN = re.compile(rb'<(m-[^>]+)>([^<]*)</')
+    TAGS = {tag.encode('ascii'): name for name, tag in FIELDS}
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0.0)
+
+    @classmethod
+    def parse(cls, raw):
+        """Parse the raw body of an ExchangeData reply"""
+        state = cls()
+        tags = cls.TAGS
+        for tag, value in cls.PATTERN.findall(raw):
+            name = tags.get(tag)
+            if name is not None:
+                setattr(state, name, float(value))
+        return state
+
+    def __repr__(self):
+        return 'FlightAxisState({})'.format(', '.join(
+            '{}={:g}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+
+class LoopStats:
+    """Loop rate and per-message round trip latency of a stream"""
+    def __init__(self, window=1000):
+        # Latencies of the most recent messages, in seconds
+        self.latencies = array('d', [0.0] * window)
+        self.window = window
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def add(self, latency):
+        """Record the latency of one message"""
+        self.latencies[self.count % self.window] = latency
+        self.count += 1
+
+    @property
+    def rate(self):
+        """Messages per second since the stream started"""
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def percentile(self, percent):
+        """Latency percentile over the recent messages, in seconds"""
+        recent = sorted(self.latencies[:min(self.count, self.window)])
+        if not recent:
+            return 0.0
+        return recent[min(len(recent) - 1, int(len(recent) * percent / 100))]
 
+    def summary(self):
+        """Get a one-line summary of the stream"""
+        return '{} msgs, {:.0f} Hz, p50 {:.2f} ms, p99 {:.2f} ms'.format(
+            self.count, self.rate, self.percentile(50) * 1000,
+            self.percentile(99) * 1000)
+
+
+class ExchangeDataStream:
+    """
+    Stream servo vectors to RealFlight and read back the aircraft state, for
+    driving RealFlight from Python scripts and tests.
+    """
+    def __init__(self, client=None, channels=NUM_CHANNELS, window=1000):
+        self.client = client if client is not None else FlightAxisClient()
+        self.template = ExchangeDataTemplate(channels)
+        self.stats = LoopStats(window)
+
+    def exchange(self, servos):
+        """Send one servo vector and return the aircraft state"""
+        sent = time.perf_counter()
+        response = self.client.send(self.template.encode(servos))
+        self.stats.add(time.perf_counter() - sent)
+        if response.status != 200:
+            raise SoapError('ExchangeData', response.status, response.reason)
+        return FlightAxisState.parse(response.raw)
+
+    def run(self, servos, rate=400, duration=None, callback=None):
+        """
+        Exchange data at a fixed rate. servos is a function of the elapsed
+        time returning the servo vector, and callback is called with every
+        state. Deadlines are absolute, so a late message does not shift the
+        ones after it. Runs until duration has elapsed or callback returns
+        False.
+        """
+        period = 1.0 / rate
+        start = time.perf_counter()
+        deadline = start
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if duration is not None and elapsed >= duration:
+                return
+            state = self.exchange(servos(elapsed))
+            if callback is not None and callback(state) is False:
+                return
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                # Fell behind by more than a message, skip the missed slots
+                deadline = time.perf_counter()
+
+
+def reset_aircraft(client=None):
+    """
+    Initialize SOAP connection to RealFlight, send default servo values,
+    and reset aircraft position. Each step waits for RealFlight to reply to
+    the previous one. Raises SoapError if RealFlight rejects a step.
+    """
+    if client is None:
+        with FlightAxisClient() as client:
+            return reset_aircraft(client)
+
+    # Call a restore first. This allows us to connect after the aircraft is
+    # changed in RealFlight. There may be nothing to restore, so the reply is
+    # not checked
+    client.request('RestoreOriginalControllerDevice', RESTORE_BODY,
+                   check=False)
+    # Inject controller interface
+    client.request('InjectUAVControllerInterface', INJECT_BODY)
+    # Send default servo values
+    client.call('ExchangeData', ExchangeDataTemplate().encode(DEFAULT_SERVOS))
     # Reset aircraft position
-    _soap_request_start("ResetAircraft", """<?xml version='1.0' encoding='UTF-8'?>
-<soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/' xmlns:xsd='http://www.w3.org/2001/XMLSchema' xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance'>
-<soap:Body>
-<ResetAircraft><a>1</a><b>2</b></ResetAircraft>
-</soap:Body>
-</soap:Envelope>""")
+    return client.request('ResetAircraft', RESET_BODY)
 
 
-def _soap_request_start(action, pkt):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.connect((CONTROLLER_IP, CONTROLLER_PORT))
+async def reset_aircraft_async(client=None):
+    """reset_aircraft on the event loop, with an AsyncFlightAxisClient"""
+    if client is None:
+        async with AsyncFlightAxisClient() as client:
+            return await reset_aircraft_async(client)
 
-        req = f"""POST / HTTP/1.1
-soapaction: '{action}'
-content-length: {len(pkt)}
-content-type: text/xml;charset='UTF-8'
-Connection: Keep-Alive
+    await client.request('RestoreOriginalControllerDevice', RESTORE_BODY,
+                         check=False)
+    await client.request('InjectUAVControllerInterface', INJECT_BODY)
+    await client.call('ExchangeData',
+                      ExchangeDataTemplate().encode(DEFAULT_SERVOS))
+    return await client.request('ResetAircraft', RESET_BODY)
 
-{pkt}"""
-        sock.send(req.encode('utf-8'))
-        return True
 
 if __name__ == '__main__':
-    reset_aircraft()
\ No newline at end of file
+    reset_aircraft()
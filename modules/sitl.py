@@ -0,0 +1,476 @@
+"""
+Tools for building and running ArduPlane SITL instances. Every instance gets
+its own instance number (-I), its own TCP ports and a private working copy of
+its bin folder, so several instances can run side by side on one machine.
+"""
+
+import contextlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import assets
+from modules import console
+from modules import eventloop
+from modules import failures
+from modules import paramcheck
+from modules import params
+from modules import sitllog
+from modules import supervisor
+from modules import telemetry
+from modules import terrain
+from modules import tracing
+
+BIN_DIR = 'bin'
+RUN_DIR = 'run'
+# What SITL keeps in its working directory from one run to the next: the
+# eeprom with the saved parameters and the dataflash logs
+STORAGE = ('eeprom.bin', 'logs')
+
+# SITL offsets every port by 10 for each instance number
+BASE_PORT = 5760
+PORT_STRIDE = 10
+
+# SITL output marking the EKF started, and using GPS so the vehicle can arm
+EKF_PATTERN = r'EKF\d? IMU\d initiali[sz]ed'
+READY_PATTERN = r'is using GPS'
+
+
+def exe_name(version):
+    """Get the name of the ArduPlane executable for a version"""
+    return 'ArduPlane_' + version + '.exe'
+
+
+def folder_name(aircraft_key, version, headless):
+    """Get the folder name of a variant: aircraft_version_type"""
+    foldername = aircraft_key + '_'
+    foldername += version.lower() + '_'
+    foldername += 'hl' if headless else 'rf'
+    # strip whitespace
+    return ''.join(foldername.split())
+
+
+def uart_port(instance):
+    """Get the uartA TCP port of an instance"""
+    return BASE_PORT + PORT_STRIDE * instance
+
+
+def telemetry_port(instance):
+    """
+    Get the uartC TCP port of an instance, a second MAVLink port left free
+    for the ground station on uartA
+    """
+    return uart_port(instance) + 2
+
+
+def control_port(instance):
+    """Get the uartD TCP port of an instance, used for failure injection"""
+    return uart_port(instance) + 3
+
+
+def build_command(version, location, headless, instance=0, speedup=None):
+    """Construct the ArduPlane command line for one instance"""
+    command = [os.path.abspath(os.path.join(BIN_DIR, exe_name(version)))]
+    command += ['-I', str(instance)]
+    command += ['--defaults', 'defaults.param']
+    command += ['-M', 'quadplane' if headless else 'flightaxis']
+    # Prevent waiting for GCS connection
+    command += ['--uartA', 'tcp:0']
+    command += ['-O', location]
+    if speedup is not None:
+        command += ['--speedup', str(speedup)]
+    return command
+
+
+class SitlInstance:
+    """
+    A single ArduPlane process with its own instance number and working
+    directory. Output lines are collected in the output pipeline.
+    """
+    def __init__(self, instance, aircraft_key, version, location, headless,
+                 run_dir=RUN_DIR, speedup=None, record_telemetry=False,
+                 session_log=False, param_overrides=None, verify_params=False):
+        self.instance = instance
+        self.aircraft_key = aircraft_key
+        self.version = version
+        self.location = location
+        self.headless = headless
+        self.speedup = speedup
+        # Record MAVLink telemetry of every run into its own folder
+        self.record_telemetry = record_telemetry
+        # Keep a classified log of the output of the whole session
+        self.session_log = session_log
+        # Parameter name to value set on top of the composed defaults
+        self.param_overrides = dict(param_overrides or {})
+        # Check the parameters of every boot against its defaults.param
+        self.verify_params = verify_params
+        self.verifier = None
+        self.tap = None
+        # Planned failure events, played again on every restart
+        self.failures = None
+        self.injector = None
+        # Terrain tiles are staged from and harvested into the shared cache
+        self.terrain = terrain.TerrainCache()
+        self.output = console.OutputPipeline()
+        # Trace of the current launch, if it is being traced
+        self.trace = None
+
+        self.folder = folder_name(aircraft_key, version, headless)
+        self.port = uart_port(instance)
+        # Keep a private copy per variant and instance number, so eeprom and
+        # logs are not shared between instances running at the same time
+        self.cwd = os.path.join(run_dir, '{}_i{}'.format(self.folder, instance))
+
+        self.process = None
+        self.monitor = None
+        # Set once the exit code of the current process is in the output
+        self.exit_reported = True
+        # Command and source state of the last prepare, so a warm restart can
+        # skip refreshing a working copy that is already up to date
+        self.command = None
+        self._prepared_state = None
+        # Set from when a launch is requested until it is done, so the
+        # instance does not look exited while it is prepared
+        self.starting = False
+        # Set by close, an instance is never started again after it. The
+        # lock keeps prepare, start and stop of one instance apart, as they
+        # run in the background.
+        self.closed = False
+        self._lock = threading.RLock()
+
+    @property
+    def running(self):
+        """True while the ArduPlane process is alive"""
+        return self.process is not None and self.process.poll() is None
+
+    def has_file(self, path):
+        """
+        True if the SITL folder has a file, path is relative to it and uses
+        / as separator. Works before the working copy is prepared.
+        """
+        if os.path.isfile(os.path.join(BIN_DIR, self.folder, *path.split('/'))):
+            return True
+        return (assets.has_manifest(self.folder)
+                and path in assets.load_manifest(self.folder))
+
+    def _source_state(self):
+        """Get the paths, sizes and mtimes of everything prepare copies"""
+        paths = [os.path.join(params.PARAMS_DIR, self.aircraft_key, name)
+                 for name in params.layer_names(self.version, self.headless)]
+        for root, _, names in os.walk(os.path.join(BIN_DIR, self.folder)):
+            paths.extend(os.path.join(root, name) for name in names)
+        # Stored objects never change, only the manifest can
+        paths.append(assets.manifest_path(self.folder))
+        state = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                state.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((path, None, None))
+        return state
+
+    def clear_storage(self):
+        """
+        Delete the eeprom and logs earlier runs left in the working copy, so
+        the next start begins with the parameters of its defaults file
+        """
+        with self._lock:
+            for name in STORAGE:
+                path = os.path.join(self.cwd, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+    def prepare(self, warm=False):
+        """
+        Refresh the private working copy from the bin folder or the asset
+        store, and write the defaults composed from the parameter overlays,
+        with any overrides applied, if they changed. A warm prepare does
+        nothing if the sources did not change since the last one.
+        """
+        with self._lock, self._phase('prepare'):
+            if self.closed:
+                return
+            state = self._source_state()
+            if (warm and state == self._prepared_state
+                    and os.path.isdir(self.cwd)):
+                return
+            source = os.path.join(BIN_DIR, self.folder)
+            overlays = params.has_overlays(self.aircraft_key)
+            if os.path.isdir(source):
+                # Files from bin are overwritten, anything SITL created is kept
+                shutil.copytree(source, self.cwd, dirs_exist_ok=True)
+            elif assets.has_manifest(self.folder):
+                os.makedirs(self.cwd, exist_ok=True)
+                assets.assemble(self.folder, self.cwd)
+            elif not overlays:
+                raise FileNotFoundError(
+                    'Missing SITL folder: {}'.format(source))
+            if overlays:
+                params.materialize(
+                    self.aircraft_key, self.version, self.headless, self.cwd)
+            if self.param_overrides:
+                params.override(os.path.join(self.cwd, params.DEFAULTS_FILE),
+                                self.param_overrides)
+            _, missing = self.terrain.stage(self.location, self.cwd)
+            if missing and os.path.isdir(self.terrain.cache_dir):
+                self.output.put('Terrain not cached: {}'.format(
+                    ', '.join(missing)))
+            self.command = build_command(self.version, self.location,
+                                         self.headless, self.instance,
+                                         self.speedup)
+            self._prepared_state = state
+
+    def start(self):
+        """
+        Start the process, with the tasks reading its output and any
+        MAVLink tasks on the event loop. Does nothing once closed.
+        """
+        with self._lock:
+            if not self.closed:
+                self._start()
+
+    def _start(self):
+        self._kill()
+        command = self.command or build_command(
+            self.version, self.location, self.headless, self.instance,
+            self.speedup)
+        if self.trace is not None:
+            self.output.watch('first output')
+            self.output.watch('ekf', EKF_PATTERN)
+            self.output.watch('ready', READY_PATTERN)
+        with self._phase('spawn'):
+            self.process = eventloop.spawn(command, cwd=self.cwd)
+        self.output.attach(self.process)
+        self.monitor = supervisor.ResourceMonitor(self.process.pid)
+        if self.session_log and self.output.log is None:
+            self.output.log = sitllog.SessionLog(
+                '{}_i{}'.format(self.folder, self.instance))
+        if self.record_telemetry:
+            self.tap = telemetry.TelemetryTap(
+                telemetry_port(self.instance), telemetry.recording_dir(
+                    '{}_i{}'.format(self.folder, self.instance)))
+            self.tap.start()
+            self.output.put('Recording telemetry to {}'.format(self.tap.path))
+        if self.verify_params:
+            self.verifier = paramcheck.Verifier(
+                control_port(self.instance),
+                os.path.join(self.cwd, params.DEFAULTS_FILE), self.output.put)
+            self.verifier.start()
+        if self.failures:
+            self.injector = failures.Injector(
+                control_port(self.instance), self.failures, self.output.put,
+                after=self.verifier.done if self.verifier else None)
+            self.injector.start()
+        self.exit_reported = False
+
+    def begin_trace(self, kind, trace=None):
+        """Trace the next launch, continuing trace if given"""
+        if trace is None:
+            trace = tracing.LaunchTrace(kind)
+        trace.info.update(aircraft=self.aircraft_key, version=self.version,
+                          location=self.location, headless=self.headless,
+                          instance=self.instance)
+        self.trace = trace
+        return trace
+
+    def check_trace(self):
+        """
+        Add the events seen in the output to the trace. Once the instance is
+        ready, has exited or timed out, the trace is written to the metrics
+        file and returned, otherwise None is returned.
+        """
+        trace = self.trace
+        if trace is None or self.starting:
+            return None
+        for name in ('first output', 'ekf', 'ready'):
+            if name in self.output.seen and not trace.has(name):
+                trace.event(name, self.output.seen[name])
+        if trace.has('ready'):
+            status = 'ready'
+        elif not self.running:
+            status = 'exited'
+        elif trace.elapsed() > tracing.READY_TIMEOUT:
+            status = 'timeout'
+        else:
+            return None
+        self.trace = None
+        trace.info['status'] = status
+        trace.finish()
+        return trace
+
+    def close(self):
+        """
+        Stop the process, end the session log and keep the terrain the run
+        completed in the cache. The console is gone by then, so errors go
+        to the session log.
+        """
+        with self._lock:
+            self.closed = True
+            try:
+                self.stop()
+            except Exception as err:
+                self.output.put('Unable to stop SITL: {!r}'.format(err))
+        try:
+            if self.terrain.harvest(self.cwd):
+                self.terrain.evict(keep=terrain.location_tiles(self.location))
+        except OSError as err:
+            self.output.put('Unable to cache terrain: {}'.format(err))
+        if self.output.log is not None:
+            # The lines nobody displayed yet still belong in the log
+            self.output.drain()
+            self.output.log.close()
+            self.output.log = None
+
+    def check_exit(self):
+        """
+        Put the exit code in the output once the process has exited and its
+        pipes are drained, so it follows the last lines it printed
+        """
+        if (self.exit_reported or self.running
+                or not self.output.drained):
+            return
+        self.exit_reported = True
+        self.output.put('SITL exited with code {}'.format(
+            self.process.returncode))
+
+    def sample(self):
+        """Sample the resource usage, returns a summary or ''"""
+        if self.monitor is None or not self.running:
+            return ''
+        self.monitor.update()
+        return self.monitor.summary()
+
+    def _kill(self):
+        """Stop the process gracefully and drain what it printed"""
+        # Clear the failures while the vehicle can still be told to
+        if self.injector is not None:
+            self.injector.stop()
+            self.injector = None
+        if self.verifier is not None:
+            self.verifier.stop()
+            self.verifier = None
+        if self.tap is not None:
+            self.tap.stop()
+            self.tap = None
+        if self.process is None:
+            return
+        returncode = supervisor.stop_process(self.process)
+        if not self.output.join(supervisor.DRAIN_TIMEOUT):
+            self.output.put('Output still open after exit, not waiting')
+        self.monitor = None
+        if not self.exit_reported:
+            self.exit_reported = True
+            self.output.put('SITL stopped with code {}'.format(returncode))
+
+    def _phase(self, name):
+        """Time a phase of the current trace, if there is one"""
+        if self.trace is None:
+            return contextlib.nullcontext()
+        return self.trace.phase(name)
+
+    def stop(self):
+        """Stop the process and wait for the reader tasks"""
+        with self._lock:
+            self._kill()
+            # Stopped before it was ready, still worth recording
+            if self.trace is not None:
+                self.trace.info['status'] = 'stopped'
+                self.trace.finish()
+                self.trace = None
+
+
+class Fleet:
+    """
+    A set of SITL instances keyed by instance number. Instance numbers are
+    allocated from the lowest free number, and stopping one instance never
+    touches the others.
+    """
+    def __init__(self):
+        self.instances = {}
+        # Numbers of instances taken out but still stopping, so their ports
+        # are not handed out again yet
+        self.closing = set()
+
+    def allocate(self):
+        """Get the lowest instance number not in use"""
+        instance = 0
+        while instance in self.instances or instance in self.closing:
+            instance += 1
+        return instance
+
+    def add(self, aircraft_key, version, location, headless,
+            record_telemetry=False):
+        """Create an instance with a free instance number"""
+        sitl = SitlInstance(self.allocate(), aircraft_key, version, location,
+                            headless, record_telemetry=record_telemetry,
+                            session_log=True, verify_params=True)
+        self.instances[sitl.instance] = sitl
+        return sitl
+
+    def launch(self, instances):
+        """
+        Prepare the working copies in parallel on all cores, then start
+        every instance
+        """
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            # Raise the first copy error before anything is started
+            list(pool.map(SitlInstance.prepare, instances))
+        for sitl in instances:
+            sitl.start()
+
+    def restart(self, instance, warm=True):
+        """
+        Restart one instance, leaving the others running. A warm restart
+        keeps the working directory, with its eeprom, logs and terrain, and
+        only refreshes it if the bin folder or overlays changed.
+        """
+        sitl = self.instances.get(instance)
+        # Stopped meanwhile
+        if sitl is None:
+            return
+        sitl.prepare(warm)
+        sitl.start()
+
+    def detach(self, instance):
+        """
+        Take one instance out of the fleet without stopping it, its number
+        stays reserved until close. Returns a list of the instance, empty
+        if there is no such instance.
+        """
+        sitl = self.instances.pop(instance, None)
+        if sitl is None:
+            return []
+        self.closing.add(instance)
+        return [sitl]
+
+    def detach_all(self):
+        """Take every instance out of the fleet, see detach"""
+        instances = list(self.instances.values())
+        self.instances = {}
+        self.closing.update(sitl.instance for sitl in instances)
+        return instances
+
+    def close(self, instances):
+        """
+        Stop detached instances, waiting for them to exit concurrently, and
+        free their instance numbers
+        """
+        try:
+            if instances:
+                with ThreadPoolExecutor(max_workers=len(instances)) as pool:
+                    list(pool.map(SitlInstance.close, instances))
+        finally:
+            self.closing.difference_update(
+                sitl.instance for sitl in instances)
+
+    def remove(self, instance):
+        """Stop one instance and free its instance number"""
+        self.close(self.detach(instance))
+
+    def remove_all(self):
+        """Stop every instance, waiting for them to exit concurrently"""
+        self.close(self.detach_all())
@@ -0,0 +1,185 @@
+"""
+Session logs of SITL output. Every line is classified as it arrives, by
+severity and by subsystem (pre-arm checks, EKF, GPS and the Lua scripts in
+bin/*/scripts), then appended to size-limited log segments with one buffered
+write per batch. An index of the line numbers of every classified line is
+kept in memory and saved next to the segments, so a whole session can be
+filtered without reading it back.
+"""
+
+import json
+import os
+import re
+import time
+from array import array
+from bisect import bisect_left
+
+SESSIONS_DIR = os.path.join('logs', 'sessions')
+# Start a new segment once the current one is this large
+SEGMENT_BYTES = 8 * 2**20
+# Oldest segments are deleted beyond this many
+MAX_SEGMENTS = 10
+WRITE_BUFFER = 2**20
+
+SEVERITIES = ('error', 'warning')
+SUBSYSTEMS = ('prearm', 'ekf', 'gps', 'script')
+
+# Checked in order and the first pattern found anywhere in the line wins, so
+# a pre-arm check about the GPS is a pre-arm message and the EKF starting to
+# use the GPS is an EKF message
+_SUBSYSTEM_PATTERNS = [(name, re.compile(pattern)) for name, pattern in [
+    ('prearm', r'\bPreArm\b|\bArm(ing)?:'),
+    ('ekf', r'\bEKF\d?\b|\bAHRS\b'),
+    ('gps', r'\bGPS\d?\b'),
+    ('script', r'\bLua\b|\bscripts?[:/]|^EFI: |\bVTOL Info\b|\bQASSIST\b'
+               r'|^Internal Error: '),
+]]
+_SEVERITY_PATTERNS = [(name, re.compile(pattern)) for name, pattern in [
+    ('error', r'\b(?:[Ee]rror|ERROR|[Ff]ail(?:ed|ure|safe)?|FAIL|[Pp]anic'
+              r'|PANIC|[Cc]rash(?:ed)?|Traceback)\b'),
+    ('warning', r'\b(?:[Ww]arning|WARNING|[Ll]ost|[Tt]imeout|[Bb]ad'
+                r'|[Mm]ismatch)\b|^PreArm:'),
+]]
+
+# Most lines match nothing, and this cheap search of the literal parts of the
+# patterns above rules them out without running the full patterns
+_CANDIDATE_RE = re.compile(
+    r'PreArm|Arm|EKF|AHRS|GPS|Lua|script|EFI|VTOL|QASSIST|Internal|rror|ERROR'
+    r'|ail|FAIL|anic|PANIC|rash|Traceback|arning|WARNING|ost|imeout|ad\b'
+    r'|ismatch')
+
+
+def classify(line):
+    """Get the severity and subsystem of a line, either may be None"""
+    if not _CANDIDATE_RE.search(line):
+        return None, None
+    return _first(_SEVERITY_PATTERNS, line), _first(_SUBSYSTEM_PATTERNS, line)
+
+
+def _first(patterns, line):
+    """Get the name of the first pattern found in a line, or None"""
+    for name, pattern in patterns:
+        if pattern.search(line):
+            return name
+    return None
+
+
+class SessionLog:
+    """
+    Append-only log of one session, split into numbered segments of about
+    segment_bytes each. Call write with each batch of lines and close at the
+    end of the session.
+    """
+    def __init__(self, name, directory=SESSIONS_DIR,
+                 segment_bytes=SEGMENT_BYTES, max_segments=MAX_SEGMENTS):
+        os.makedirs(directory, exist_ok=True)
+        self.base = os.path.join(directory, '{}_{}'.format(
+            time.strftime('%Y%m%d-%H%M%S'), name))
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        # Number of the next line in the session
+        self.line_count = 0
+        # Segment number, first line and line count of each kept segment
+        self.segments = []
+        # Line numbers of every line with a severity or subsystem
+        self.index = {kind: array('L') for kind in SEVERITIES + SUBSYSTEMS}
+        self.file = None
+        self._size = 0
+        self._open_segment(0)
+
+    def segment_path(self, number):
+        return '{}.{:03d}.log'.format(self.base, number)
+
+    @property
+    def index_path(self):
+        return self.base + '.index.json'
+
+    def _open_segment(self, number):
+        self.file = open(self.segment_path(number), 'w', encoding='UTF-8',
+                         newline='\n', buffering=WRITE_BUFFER)
+        self.segments.append([number, self.line_count, 0])
+        self._size = 0
+
+    def _rotate(self):
+        self.file.close()
+        self._open_segment(self.segments[-1][0] + 1)
+        if len(self.segments) > self.max_segments:
+            number, _, _ = self.segments.pop(0)
+            try:
+                os.remove(self.segment_path(number))
+            except OSError:
+                pass
+            # Forget the lines that are no longer on disk
+            first = self.segments[0][1]
+            for lines in self.index.values():
+                del lines[:bisect_left(lines, first)]
+        self.save_index()
+
+    def write(self, lines):
+        """
+        Classify and append a batch of lines with a single write. Returns
+        the (severity, subsystem) of every line.
+        """
+        if not lines or self.file is None:
+            return [classify(line) for line in lines]
+        kinds = []
+        for number, line in enumerate(lines, self.line_count):
+            kind = classify(line)
+            for name in kind:
+                if name is not None:
+                    self.index[name].append(number)
+            kinds.append(kind)
+        text = '\n'.join(lines) + '\n'
+        self.file.write(text)
+        self.line_count += len(lines)
+        self.segments[-1][2] += len(lines)
+        self._size += len(text)
+        if self._size >= self.segment_bytes:
+            self._rotate()
+        return kinds
+
+    def count(self, kind):
+        """Number of lines of a severity or subsystem in the session"""
+        return len(self.index[kind])
+
+    def read(self, numbers):
+        """Read lines of the session by line number, from the segments"""
+        wanted = sorted(set(numbers))
+        if self.file is not None:
+            self.file.flush()
+        found = {}
+        for number, first, count in self.segments:
+            in_segment = {n for n in wanted if first <= n < first + count}
+            if not in_segment:
+                continue
+            last = max(in_segment)
+            with open(self.segment_path(number), 'r', encoding='UTF-8') as f:
+                for line_number, line in enumerate(f, first):
+                    if line_number in in_segment:
+                        found[line_number] = line.rstrip('\n')
+                    if line_number >= last:
+                        break
+        return [found[n] for n in wanted if n in found]
+
+    def save_index(self):
+        """Write the segments and line index next to the log"""
+        data = {
+            'lines': self.line_count,
+            'segments': [{'file': os.path.basename(self.segment_path(number)),
+                          'first_line': first, 'lines': count}
+                         for number, first, count in self.segments],
+            'index': {kind: lines.tolist()
+                      for kind, lines in self.index.items()},
+        }
+        try:
+            with open(self.index_path, 'w', encoding='UTF-8') as f:
+                json.dump(data, f)
+        except OSError as err:
+            print('Unable to write session index: {}'.format(err))
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.save_index()
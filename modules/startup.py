@@ -0,0 +1,114 @@
+"""
+Startup instrumentation for the SITL Launcher. Start the launcher with
+--profile-startup, or set SITL_LAUNCHER_PROFILE=1, to time every import and
+startup phase and write them to a report once the window has been drawn.
+
+This module should be imported first so its start time is close to process
+start.
+"""
+
+import builtins
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+START = time.perf_counter()
+ENABLED = ('--profile-startup' in sys.argv or
+           os.environ.get('SITL_LAUNCHER_PROFILE') == '1')
+REPORT_FILE = 'startup_profile.json'
+
+
+class StartupProfile:
+    """
+    Records import and phase timings relative to START. All methods do
+    nothing when the profile is disabled.
+    """
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.imports = []
+        self.phases = []
+        self.marks = {}
+        self._import = None
+        self._depth = 0
+        self.written = False
+        if enabled:
+            self._hook_imports()
+
+    def _hook_imports(self):
+        """Time every import of a module not yet loaded"""
+        self._import = builtins.__import__
+
+        def timed_import(name, *args, **kwargs):
+            if name in sys.modules:
+                return self._import(name, *args, **kwargs)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return self._import(name, *args, **kwargs)
+            finally:
+                self._depth -= 1
+                # Only keep imports made directly by our code, nested ones
+                # are included in their parent's time
+                if self._depth == 0:
+                    self.imports.append(
+                        (name, time.perf_counter() - start))
+
+        builtins.__import__ = timed_import
+
+    def unhook(self):
+        """Stop timing imports"""
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with block as a named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.phases.append(
+                    (name, start - START, time.perf_counter() - start))
+
+    def mark(self, name):
+        """Record the time since START of a one-off event"""
+        if self.enabled and name not in self.marks:
+            self.marks[name] = time.perf_counter() - START
+
+    def report(self):
+        """Get the timings as a dictionary, times in milliseconds"""
+        return {
+            'imports': [
+                {'module': name, 'ms': round(duration * 1000, 2)}
+                for name, duration in sorted(
+                    self.imports, key=lambda item: -item[1])],
+            'phases': [
+                {'phase': name, 'start_ms': round(start * 1000, 2),
+                 'ms': round(duration * 1000, 2)}
+                for name, start, duration in self.phases],
+            'marks_ms': {
+                name: round(offset * 1000, 2)
+                for name, offset in self.marks.items()},
+        }
+
+    def write(self, path=REPORT_FILE):
+        """Write the report and print a summary"""
+        if not self.enabled:
+            return
+        self.unhook()
+        report = self.report()
+        with open(path, 'w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=2)
+        self.written = True
+        print('Startup profile written to {}'.format(path))
+        for phase in report['phases']:
+            print('  {:<20} {:>8.1f} ms'.format(phase['phase'], phase['ms']))
+        for name, offset in report['marks_ms'].items():
+            print('  {:<20} {:>8.1f} ms after start'.format(name, offset))
+
+
+profile = StartupProfile()
@@ -0,0 +1,88 @@
+"""
+Supervision of SITL processes: a graceful stop that escalates to a kill,
+and periodic CPU, memory and thread count samples of each process so
+runaway or stuck instances stand out on shared machines.
+
+Resource samples need psutil. Without it, stopping still works and the
+samples are simply not available.
+"""
+
+import subprocess
+
+# psutil is only needed once a process is running, so it is imported on
+# first use rather than slowing down startup
+psutil = None
+
+# Seconds to wait for a process to exit after asking it to, before killing it
+STOP_TIMEOUT = 3.0
+# Seconds to wait for the reader tasks to drain the pipes after exit
+DRAIN_TIMEOUT = 2.0
+# Seconds between resource samples
+SAMPLE_INTERVAL = 1.0
+
+
+def stop_process(process, timeout=STOP_TIMEOUT):
+    """
+    Ask a process to terminate, then kill it if it is still running after
+    timeout seconds. Works with Popen and eventloop processes alike.
+    Returns the exit code.
+    """
+    if process.poll() is not None:
+        return process.returncode
+    # On Windows terminate is the same as kill, there is no gentler signal
+    process.terminate()
+    try:
+        return process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return process.wait()
+
+
+class ResourceMonitor:
+    """
+    Sample CPU%, resident memory and thread count of a process. CPU% is
+    averaged between samples, so the first sample only starts the
+    measurement.
+    """
+    def __init__(self, pid):
+        global psutil
+        self.sample = None
+        self._process = None
+        if psutil is None:
+            try:
+                import psutil
+            except ImportError:
+                return
+        try:
+            self._process = psutil.Process(pid)
+            self._process.cpu_percent(None)
+        except psutil.Error:
+            self._process = None
+
+    @property
+    def available(self):
+        return self._process is not None
+
+    def update(self):
+        """Take a new sample, returns None once the process is gone"""
+        if self._process is None:
+            return None
+        try:
+            with self._process.oneshot():
+                self.sample = {
+                    'cpu': self._process.cpu_percent(None),
+                    'rss': self._process.memory_info().rss,
+                    'threads': self._process.num_threads(),
+                }
+        except psutil.Error:
+            self._process = None
+            self.sample = None
+        return self.sample
+
+    def summary(self):
+        """Get a one-line summary of the last sample"""
+        if self.sample is None:
+            return ''
+        return 'CPU {:.0f}%, {:.0f} MB, {} threads'.format(
+            self.sample['cpu'], self.sample['rss'] / 2**20,
+            self.sample['threads'])
@@ -0,0 +1,252 @@
+"""
+MAVLink telemetry tap. A TelemetryTap connects to the spare MAVLink port of
+a SITL instance as a task on the event loop, decodes a selected set of messages
+and records their fields into preallocated array columns. Full buffers are
+flushed in bulk as raw native float64 rows, one file per message
+type, so a recording can be memory-mapped and queried by TelemetryLog
+without parsing anything.
+
+A recording is a folder with an index.json describing the columns of each
+message and a <MESSAGE>.bin file of rows. The first column of every row is
+the time the message was received, in seconds since the epoch.
+"""
+
+import json
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from modules import eventloop
+
+TELEMETRY_DIR = 'telemetry'
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+
+# Messages and fields recorded by default
+DEFAULT_MESSAGES = {
+    'ATTITUDE': ['roll', 'pitch', 'yaw', 'rollspeed', 'pitchspeed',
+                 'yawspeed'],
+    'GLOBAL_POSITION_INT': ['lat', 'lon', 'alt', 'relative_alt', 'vx', 'vy',
+                            'vz', 'hdg'],
+    'VFR_HUD': ['airspeed', 'groundspeed', 'alt', 'climb', 'throttle'],
+    'SYS_STATUS': ['voltage_battery', 'current_battery', 'battery_remaining'],
+    'HEARTBEAT': ['custom_mode', 'base_mode', 'system_status'],
+}
+# Rows buffered per message before they are written in one go
+BUFFER_ROWS = 4096
+# Message rate requested from the vehicle, Hz
+STREAM_RATE = 10
+
+
+def recording_dir(name, root=TELEMETRY_DIR):
+    """Get a new recording folder for an instance"""
+    return os.path.join(root, '{}_{}'.format(
+        time.strftime('%Y%m%d-%H%M%S'), name))
+
+
+class ColumnBuffer:
+    """
+    Preallocated columns of one message type. Rows are appended in place
+    and written out as a block when the buffer is full.
+    """
+    def __init__(self, fields, path, rows=BUFFER_ROWS):
+        self.fields = list(fields)
+        self.columns = [array('d', bytes(8 * rows))
+                        for _ in range(len(self.fields) + 1)]
+        self.capacity = rows
+        self.count = 0
+        self.written = 0
+        self.file = open(path, 'wb')
+
+    def append(self, timestamp, msg):
+        """Add a row, flushing first if the buffer is full"""
+        if self.count == self.capacity:
+            self.flush()
+        row = self.count
+        self.columns[0][row] = timestamp
+        for column, field in zip(self.columns[1:], self.fields):
+            value = getattr(msg, field, None)
+            column[row] = float('nan') if value is None else value
+        self.count += 1
+
+    def flush(self):
+        """Interleave the buffered columns into rows and write them"""
+        if not self.count:
+            return
+        width = len(self.columns)
+        rows = array('d', bytes(8 * width * self.count))
+        for offset, column in enumerate(self.columns):
+            rows[offset::width] = column[:self.count]
+        rows.tofile(self.file)
+        self.file.flush()
+        self.written += self.count
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class TelemetryTap(eventloop.LoopTask):
+    """
+    Record MAVLink messages from a TCP port into a recording folder. The
+    connection is retried until SITL opens the port, and the recording is
+    closed when stop is called or the connection is lost.
+    """
+    def __init__(self, port, path, messages=None, host='127.0.0.1',
+                 rate=STREAM_RATE):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.address = 'tcp:{}:{}'.format(host, port)
+        self.path = path
+        self.messages = dict(messages or DEFAULT_MESSAGES)
+        self.rate = rate
+        self.error = None
+
+    def start(self, event_loop=None):
+        """Start recording on the event loop"""
+        os.makedirs(self.path, exist_ok=True)
+        super().start(event_loop)
+
+    def stop(self, timeout=2.0):
+        """Stop recording and write what is left in the buffers"""
+        super().stop(timeout)
+
+    async def run(self):
+        buffers = {name: ColumnBuffer(fields,
+                                      os.path.join(self.path, name + '.bin'))
+                   for name, fields in self.messages.items()}
+        # Written up front too, so a crashed session can still be read
+        self._write_index(buffers)
+        connection = None
+        try:
+            # imported on first use
+            from modules import mavio
+            connection = await mavio.connect(self.host, self.port, self)
+            if connection is None:
+                return
+            requested = False
+            while not self.stopping:
+                msg = await connection.recv(timeout=0.2)
+                if msg is None:
+                    continue
+                name = msg.get_type()
+                if name == 'HEARTBEAT' and not requested:
+                    # Ask for every stream, SITL sends nothing on a spare
+                    # port until asked
+                    connection.mav.request_data_stream_send(
+                        msg.get_srcSystem(), msg.get_srcComponent(),
+                        0, self.rate, 1)
+                    requested = True
+                buffer = buffers.get(name)
+                if buffer is not None:
+                    buffer.append(msg._timestamp, msg)
+        except (OSError, ImportError) as err:
+            self.error = err
+        finally:
+            if connection is not None:
+                connection.close()
+            for buffer in buffers.values():
+                buffer.close()
+            self._write_index(buffers)
+
+    def _write_index(self, buffers):
+        index = {
+            'version': FORMAT_VERSION,
+            'address': self.address,
+            'messages': {name: {'fields': ['time'] + buffer.fields,
+                                'rows': buffer.written}
+                         for name, buffer in buffers.items()},
+        }
+        with open(os.path.join(self.path, INDEX_FILE), 'w',
+                  encoding='UTF-8') as f:
+            json.dump(index, f, indent=1)
+
+
+class _Column:
+    """A read-only strided view of one column of a memory-mapped file"""
+    def __init__(self, values, offset, width):
+        self.values = values
+        self.offset = offset
+        self.width = width
+
+    def __len__(self):
+        return len(self.values) // self.width
+
+    def __getitem__(self, row):
+        return self.values[row * self.width + self.offset]
+
+
+class TelemetryLog:
+    """
+    Read access to a recording. Message files are memory-mapped on first
+    use, and time slices are found by binary search on the time column.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), 'r', encoding='UTF-8') as f:
+            self.index = json.load(f)
+        if self.index.get('version') != FORMAT_VERSION:
+            raise ValueError('Unsupported telemetry format in {}'.format(path))
+        self._views = {}
+        self._maps = []
+
+    @property
+    def messages(self):
+        return sorted(self.index['messages'])
+
+    def fields(self, message):
+        return self.index['messages'][message]['fields']
+
+    def rows(self, message):
+        """Get every row of a message as a flat float64 view"""
+        view = self._views.get(message)
+        if view is None:
+            path = os.path.join(self.path, message + '.bin')
+            width = len(self.fields(message))
+            # Ignore a partly written last row
+            size = os.path.getsize(path) // (8 * width) * 8 * width
+            if not size:
+                view = memoryview(array('d'))
+            else:
+                with open(path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), size,
+                                       access=mmap.ACCESS_READ)
+                self._maps.append(mapped)
+                view = memoryview(mapped).cast('d')
+            self._views[message] = view
+        return view
+
+    def slice(self, message, start=None, end=None):
+        """Get the first and last row numbers between two times"""
+        width = len(self.fields(message))
+        times = _Column(self.rows(message), 0, width)
+        first = 0 if start is None else bisect_left(times, start)
+        last = len(times) if end is None else bisect_right(times, end)
+        return first, last
+
+    def column(self, message, field, start=None, end=None):
+        """Get the values of a field between two times as an array"""
+        fields = self.fields(message)
+        width = len(fields)
+        first, last = self.slice(message, start, end)
+        offset = fields.index(field)
+        return array('d', self.rows(message)[
+            first * width + offset:last * width:width])
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,208 @@
+"""
+Shared cache of ArduPilot terrain tiles. SITL reads terrain from the
+terrain folder of its working directory, one <N|S>dd<E|W>ddd.DAT file per
+degree of latitude and longitude, and fills in missing blocks as a ground
+station sends them. Tiles are kept once in cache/terrain, read-only, and
+every working copy gets the tiles around its airport before launch, so the
+first launch of another aircraft or instance at the same site starts warm.
+
+ArduPilot opens its tiles for writing, so working copies get their own
+copies rather than links. Tiles a run completed are taken back into the
+cache when the instance closes. The cache is bounded in size, evicting
+the tiles used least recently first.
+
+Only terrain is shared. The eeprom and dataflash logs hold the state of
+one vehicle, so they stay in the private working copy of each instance.
+"""
+
+import math
+import os
+import re
+import shutil
+import stat
+import tempfile
+
+CACHE_DIR = os.path.join('cache', 'terrain')
+# Terrain folder in the SITL working directory
+TERRAIN_DIR = 'terrain'
+# Cache size limit, bytes
+MAX_BYTES = 2 * 2**30
+# Tiles are staged for the airport and everything within this many degrees
+MARGIN = 0.25
+# Tiles are made of 2 kB blocks
+BLOCK_SIZE = 2048
+
+_TILE_RE = re.compile(r'^[NS]\d{2}[EW]\d{3}\.DAT$')
+
+
+def tile_name(lat, lon):
+    """Get the name of the tile holding a point, as ArduPilot names it"""
+    lat = math.floor(lat)
+    lon = math.floor(lon)
+    return '{}{:02d}{}{:03d}.DAT'.format(
+        'S' if lat < 0 else 'N', abs(lat), 'W' if lon < 0 else 'E', abs(lon))
+
+
+def is_tile(name):
+    return _TILE_RE.match(name) is not None
+
+
+def tiles_around(lat, lon, margin=MARGIN):
+    """Get the names of the tiles within margin degrees of a point"""
+    names = set()
+    for lat_step in (-margin, 0, margin):
+        for lon_step in (-margin, 0, margin):
+            names.add(tile_name(max(-90, min(89.999, lat + lat_step)),
+                                (lon + lon_step + 180) % 360 - 180))
+    return sorted(names)
+
+
+def location_tiles(location, margin=MARGIN):
+    """Get the tiles around a lat,lon,alt,heading location string"""
+    lat, lon = (float(part) for part in location.split(',')[:2])
+    return tiles_around(lat, lon, margin)
+
+
+def _same_file(first, second):
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+
+def _replace(source, target, read_only):
+    """
+    Copy source over target through a temporary file, so instances closing
+    at the same time never see a partly written tile
+    """
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    os.close(handle)
+    try:
+        shutil.copyfile(source, tmp)
+        if read_only:
+            os.chmod(tmp, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        if os.path.exists(target):
+            os.chmod(target, stat.S_IWRITE | stat.S_IREAD)
+        os.replace(tmp, target)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+class TerrainCache:
+    """
+    The tiles in a cache folder. The modification time of a cached tile is
+    the last time it was staged, which orders eviction.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def tiles(self):
+        """Get the name, size and last use of every cached tile"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        tiles = []
+        for name in os.listdir(self.cache_dir):
+            if not is_tile(name):
+                continue
+            info = os.stat(self.path(name))
+            tiles.append((name, info.st_size, info.st_mtime))
+        return tiles
+
+    def usage(self):
+        """Get the number of tiles and bytes cached"""
+        tiles = self.tiles()
+        return len(tiles), sum(size for _, size, _ in tiles)
+
+    def add(self, path):
+        """
+        Put a tile into the cache, unless the cached one is at least as
+        complete. Returns True if it was added.
+        """
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        if not is_tile(name) or not size or size % BLOCK_SIZE:
+            return False
+        target = self.path(name)
+        if _same_file(path, target):
+            return False
+        # Blocks are only ever added to a tile, so a larger one knows more
+        if os.path.isfile(target) and os.path.getsize(target) >= size:
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        _replace(path, target, read_only=True)
+        return True
+
+    def add_folder(self, folder, names=None):
+        """Add the tiles of a folder, or only those named. Returns the count."""
+        if not os.path.isdir(folder):
+            return 0
+        added = 0
+        for name in os.listdir(folder):
+            if is_tile(name) and (names is None or name in names):
+                added += self.add(os.path.join(folder, name))
+        return added
+
+    def harvest(self, work_dir):
+        """Take the tiles a run completed back from its working directory"""
+        return self.add_folder(os.path.join(work_dir, TERRAIN_DIR))
+
+    def stage(self, location, work_dir):
+        """
+        Give a working directory the cached tiles around a location, after
+        taking back the tiles it completed. Tiles of other sites are removed
+        so working copies do not pile up terrain. Returns the names of the
+        tiles staged and of those not in the cache.
+        """
+        self.harvest(work_dir)
+        wanted = location_tiles(location)
+        terrain_dir = os.path.join(work_dir, TERRAIN_DIR)
+        if os.path.isdir(terrain_dir):
+            for name in os.listdir(terrain_dir):
+                if is_tile(name) and name not in wanted:
+                    os.remove(os.path.join(terrain_dir, name))
+
+        staged = []
+        missing = []
+        for name in wanted:
+            source = self.path(name)
+            if not os.path.isfile(source):
+                missing.append(name)
+                continue
+            target = os.path.join(terrain_dir, name)
+            if not (os.path.isfile(target) and
+                    os.path.getsize(target) >= os.path.getsize(source)):
+                os.makedirs(terrain_dir, exist_ok=True)
+                _replace(source, target, read_only=False)
+            # Record the use for eviction
+            os.utime(source)
+            staged.append(name)
+        return staged, missing
+
+    def evict(self, max_bytes=None, keep=()):
+        """
+        Remove the least recently used tiles until the cache fits in
+        max_bytes, never removing those in keep. Returns the names removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        tiles = sorted(self.tiles(), key=lambda tile: tile[2])
+        total = sum(size for _, size, _ in tiles)
+        removed = []
+        for name, size, _ in tiles:
+            if total <= max_bytes:
+                break
+            if name in keep:
+                continue
+            path = self.path(name)
+            try:
+                os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(name)
+        return removed
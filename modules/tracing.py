@@ -0,0 +1,84 @@
+"""
+Launch tracing. A LaunchTrace timestamps each phase of a launch or reboot,
+from stopping the previous instance to the EKF using GPS, shows a compact
+breakdown in the console and appends the timings to a JSON-lines metrics
+file so regressions between ArduPilot versions or parameter sets show up.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+METRICS_FILE = os.path.join('logs', 'launch_metrics.jsonl')
+# Give up waiting for readiness after this many seconds
+READY_TIMEOUT = 300
+
+
+class LaunchTrace:
+    """
+    Phase timings of one launch. Phases are either timed blocks (kill,
+    reset, prepare, spawn) or events (first output, ekf, ready), all
+    recorded as offsets from the start of the trace.
+    """
+    def __init__(self, kind, **info):
+        self.kind = kind
+        self.info = info
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        # Phase name, start offset and duration (None for events)
+        self.phases = []
+        self.finished = False
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                (name, start - self.start, time.perf_counter() - start))
+
+    def event(self, name, when=None):
+        """Record an event, at perf_counter time when or now"""
+        if when is None:
+            when = time.perf_counter()
+        self.phases.append((name, when - self.start, None))
+
+    def elapsed(self):
+        """Seconds since the trace started"""
+        return time.perf_counter() - self.start
+
+    def has(self, name):
+        return any(phase[0] == name for phase in self.phases)
+
+    def summary(self):
+        """Get a one-line breakdown of the phases"""
+        parts = []
+        for name, offset, duration in self.phases:
+            if duration is None:
+                parts.append('{} @{:.2f}s'.format(name, offset))
+            else:
+                parts.append('{} {:.2f}s'.format(name, duration))
+        return '[{}] {}'.format(self.kind, ' | '.join(parts))
+
+    def record(self):
+        """Get the trace as a dictionary"""
+        return dict(self.info, kind=self.kind, time=self.wall_start,
+                    phases=[{'phase': name, 'offset': round(offset, 4),
+                             'duration': None if duration is None
+                             else round(duration, 4)}
+                            for name, offset, duration in self.phases])
+
+    def finish(self, path=METRICS_FILE):
+        """Append the trace to the metrics file, only once"""
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='UTF-8') as f:
+                f.write(json.dumps(self.record()) + '\n')
+        except OSError as err:
+            print('Unable to write launch metrics: {}'.format(err))
@@ -1,22 +1,86 @@
-import requests
-from packaging import version
+import json
+import os
+import time
 
-def check_for_updates(current_version, repo_owner, repo_name):
+from modules import eventloop
+
+# requests and packaging are slow to import and only needed by the check,
+# which runs in the background, so they are imported on first use
+
+# Give up on the GitHub API after this many seconds
+TIMEOUT = 5
+# Reuse a cached result for this many seconds before asking GitHub again
+CACHE_TTL = 6 * 60 * 60
+CACHE_FILE = os.path.join('config', 'update_cache.json')
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='UTF-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_file, cache):
+    try:
+        with open(cache_file, 'w', encoding='UTF-8') as f:
+            json.dump(cache, f)
+    except OSError as err:
+        print(f"Unable to write update cache: {err}")
+
+
+def fetch_latest_version(repo_owner, repo_name, timeout=TIMEOUT,
+                         cache_file=CACHE_FILE, cache_ttl=CACHE_TTL):
+    """
+    Get the tag of the latest release. A cached result is used while it is
+    younger than cache_ttl, after that GitHub is asked with If-None-Match so
+    an unchanged release costs no rate limit. If GitHub cannot be reached
+    the stale cached tag is returned, or None if nothing was cached.
+    """
     api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/releases/latest"
-    
+
+    cache = _load_cache(cache_file)
+    if cache.get('url') != api_url:
+        cache = {'url': api_url}
+    if time.time() - cache.get('checked', 0) < cache_ttl and 'tag_name' in cache:
+        return cache['tag_name']
+
+    import requests
+    headers = {}
+    if 'etag' in cache and 'tag_name' in cache:
+        headers['If-None-Match'] = cache['etag']
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as err:
+        response = requests.get(api_url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+            cache['tag_name'] = response.json().get("tag_name", "")
+            cache['etag'] = response.headers.get('ETag', '')
+    except (requests.exceptions.RequestException, ValueError) as err:
         print(f"Error: {err}")
+        # Not marked as checked, so GitHub is asked again next time
+        return cache.get('tag_name')
+
+    cache['checked'] = time.time()
+    _save_cache(cache_file, cache)
+    return cache['tag_name']
+
+
+def check_for_updates(current_version, repo_owner, repo_name, **kwargs):
+    from packaging import version
+
+    latest_version_str = fetch_latest_version(repo_owner, repo_name, **kwargs)
+    if latest_version_str is None:
         return None
-    
-    release_data = response.json()
-    latest_version_str = release_data.get("tag_name", "").lstrip("vV-")
+    latest_version_str = latest_version_str.lstrip("vV-")
     print(latest_version_str)
 
     if latest_version_str:
-        latest_version = version.parse(latest_version_str)
+        try:
+            latest_version = version.parse(latest_version_str)
+        except version.InvalidVersion:
+            print(f"Unable to parse the latest version: {latest_version_str}")
+            return False
         current_version = version.parse(current_version)
 
         if latest_version > current_version:
@@ -30,6 +94,16 @@ def check_for_updates(current_version, repo_owner, repo_name):
         return False
 
 
+def check_for_updates_async(current_version, repo_owner, repo_name, **kwargs):
+    """
+    Run check_for_updates from the event loop. requests blocks, so it runs
+    in the default executor of the loop. Returns a concurrent Future holding
+    its result, which is None if the check failed.
+    """
+    return eventloop.get_loop().submit_blocking(
+        check_for_updates, current_version, repo_owner, repo_name, **kwargs)
+
+
 def main ():
     # Example usage:
     current_version = "0.0.0"  # Replace this with your current version
@@ -41,4 +115,4 @@ if __name__ == '__main__':
     try:
         main()
     except KeyboardInterrupt:
-        print('Interrupted')
\ No newline at end of file
+        print('Interrupted')
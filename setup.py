@@ -29,7 +29,7 @@ build_exe_options = {
                     "requests",
                     "packaging",
                     "webbrowser"],
-    "include_files": ["bin", "config", "icons"],  # Add this line
+    "include_files": ["bin", "config", "icons", "params", "assets"],  # Add this line
 }
 
 with open("README.md", "r", encoding = "utf-8") as fh:
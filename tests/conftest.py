@@ -0,0 +1,116 @@
+"""
+Make the launcher modules and the tools importable from the tests, and
+the fakes shared between them
+"""
+
+import collections
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+
+class FakeClock:
+    """
+    A perf_counter that moves on by tick on every call, or by what a test
+    adds to now, standing in for the time module of a benchmark
+    """
+    def __init__(self, tick=0.001):
+        self.now = 0.0
+        self.tick = tick
+
+    def perf_counter(self):
+        self.now += self.tick
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A FakeClock in place of time.perf_counter of the SOAP benchmark"""
+    from modules import realflight
+    import bench_realflight
+    fake = FakeClock()
+    monkeypatch.setattr(realflight, 'time', fake)
+    monkeypatch.setattr(bench_realflight, 'time', fake)
+    return fake
+
+
+class FakeLink:
+    """
+    A MavlinkStream stand-in wired to a simulated vehicle with a parameter
+    table. Messages sent to it are answered at once, and recv_match gives
+    None rather than waiting once no reply is left. Indices in drop are
+    left out of the first PARAM_REQUEST_LIST stream and those in lost are
+    never sent, names in refuse keep their value when set.
+    """
+    def __init__(self, params, drop=(), lost=(), refuse=()):
+        from modules import mavio
+        self.dialect = mavio.ardupilotmega
+        self.mav = self.dialect.MAVLink(self, srcSystem=255)
+        self.target = (1, 1)
+        self.params = dict(params)
+        self.names = list(params)
+        self.drop = set(drop)
+        self.lost = set(lost)
+        self.refuse = set(refuse)
+        # Every message the vehicle received
+        self.received = []
+        self._vehicle = self.dialect.MAVLink(None, srcSystem=1,
+                                             srcComponent=1)
+        self._parser = self.dialect.MAVLink(None)
+        self._replies = collections.deque()
+        self._listed = False
+
+    def write(self, data):
+        for msg in self._parser.parse_buffer(data) or ():
+            self.received.append(msg)
+            kind = msg.get_type()
+            if kind == 'PARAM_REQUEST_LIST':
+                for index in range(len(self.names)):
+                    if not (index in self.drop and not self._listed):
+                        self._send(index)
+                self._listed = True
+            elif kind == 'PARAM_REQUEST_READ':
+                if msg.param_index >= 0:
+                    self._send(msg.param_index)
+                elif msg.param_id in self.params:
+                    self._send(self.names.index(msg.param_id))
+            elif kind == 'PARAM_SET' and msg.param_id in self.params:
+                if msg.param_id not in self.refuse:
+                    self.params[msg.param_id] = msg.param_value
+                self._send(self.names.index(msg.param_id))
+
+    def _send(self, index):
+        if index in self.lost:
+            return
+        name = self.names[index]
+        packed = self._vehicle.param_value_encode(
+            name.encode(), self.params[name], 9, len(self.names),
+            index).pack(self._vehicle)
+        # Decoded again, so the fields look as they do off the wire
+        self._replies.extend(self._parser.parse_buffer(packed))
+
+    async def recv_match(self, type=None, timeout=None):
+        types = [type] if isinstance(type, str) else type
+        while self._replies:
+            msg = self._replies.popleft()
+            if types is None or msg.get_type() in types:
+                return msg
+        return None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_link():
+    """The FakeLink class, to make links to a simulated vehicle"""
+    return FakeLink
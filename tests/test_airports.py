@@ -0,0 +1,53 @@
+"""Searching the imported airport database"""
+
+import sqlite3
+
+from modules import airports
+
+ROWS = [
+    ('London Heathrow (EGLL)', 'EGLL', 51.47, -0.46, 25, 270),
+    ('London Gatwick (EGKK)', 'EGKK', 51.15, -0.18, 62, 80),
+    ('Heath Field (K00001)', 'K00001', 40.0, -80.0, 300, 0),
+]
+
+
+def make_db(tmp_path, rows=ROWS):
+    db_file = str(tmp_path / 'airports.sqlite')
+    airports.build(rows, db_file)
+    return airports.AirportDB(db_file)
+
+
+def test_prefix_matches_come_first(tmp_path):
+    db = make_db(tmp_path)
+    assert db.search('heath') == ['Heath Field (K00001)',
+                                  'London Heathrow (EGLL)']
+
+
+def test_words_of_name_and_ident(tmp_path):
+    db = make_db(tmp_path)
+    assert db.search('gat') == ['London Gatwick (EGKK)']
+    assert db.search('egll') == ['London Heathrow (EGLL)']
+    assert db.search('lon gat') == ['London Gatwick (EGKK)']
+    assert db.search('"') == []
+
+
+def test_search_does_not_scan_the_table(tmp_path):
+    db = make_db(tmp_path)
+    db.search('gat')
+    connection = db._connect()
+    plan = connection.execute(
+        'EXPLAIN QUERY PLAN SELECT name FROM airports WHERE rowid IN '
+        '(SELECT rowid FROM airport_words WHERE airport_words MATCH ?) '
+        'AND NOT (search >= ? AND search < ?) ORDER BY search LIMIT ?',
+        ('"gat"*', 'gat', 'gat￿', 50)).fetchall()
+    assert not any(row[-1].startswith('SCAN airports') for row in plan)
+
+
+def test_database_without_word_index(tmp_path):
+    db = make_db(tmp_path)
+    connection = sqlite3.connect(db.db_file)
+    connection.execute('DROP TABLE airport_words')
+    connection.close()
+    assert db.search('london') == ['London Gatwick (EGKK)',
+                                   'London Heathrow (EGLL)']
+    assert db.search('gat') == []
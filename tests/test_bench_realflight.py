@@ -0,0 +1,19 @@
+"""The SOAP benchmark against the local FlightAxis stand-in"""
+
+import bench_realflight
+
+MESSAGES = 200
+# Seconds of the fake clock the reset phase takes
+RESET_TIME = 100.0
+
+
+def test_rate_excludes_resets(monkeypatch, clock):
+    def slow_reset(client, count):
+        clock.now += RESET_TIME
+        return RESET_TIME / count
+    monkeypatch.setattr(bench_realflight, 'bench_reset', slow_reset)
+    result = bench_realflight.run(MESSAGES, resets=1)
+    assert result['messages'] == MESSAGES
+    assert result['reset_ms'] == RESET_TIME * 1000
+    # Counting the reset phase would cap the rate below MESSAGES / RESET_TIME
+    assert result['messages_per_sec'] > 2 * MESSAGES / RESET_TIME
@@ -0,0 +1,28 @@
+"""Metrics of the benchmark suite"""
+
+import argparse
+
+import bench_realflight
+import bench_suite
+
+MESSAGES = 200
+# Seconds of the fake clock each reset sequence takes
+RESET_TIME = 10.0
+
+
+def test_exchange_rate_does_not_depend_on_resets(monkeypatch, clock):
+    def slow_reset(client, count):
+        clock.now += RESET_TIME * count
+        return RESET_TIME
+    monkeypatch.setattr(bench_realflight, 'bench_reset', slow_reset)
+    rates = []
+    for resets in (1, 50):
+        result = bench_suite.bench_soap(
+            argparse.Namespace(messages=MESSAGES, resets=resets))
+        assert 'messages_per_sec' not in result
+        rates.append(result['exchange_per_sec'])
+    assert bench_suite.direction('exchange_per_sec') == 1
+    # The exchanges read the clock the same number of times either way
+    assert rates[0] == rates[1]
+    # 50 resets would cap a rate that counted them below this
+    assert min(rates) > 2 * MESSAGES / (RESET_TIME * 50)
@@ -0,0 +1,30 @@
+"""The output pipeline between SITL processes and the console view"""
+
+from modules import console
+
+
+def test_queue_is_bounded():
+    output = console.OutputPipeline(max_lines=10)
+    for number in range(25):
+        output.put(str(number))
+    assert len(output.queue) == 10
+
+
+def test_lines_dropped_from_the_queue_are_counted():
+    output = console.OutputPipeline(max_lines=10)
+    for number in range(25):
+        output.put(str(number))
+    assert output.drain() == [str(number) for number in range(15, 25)]
+    assert output.received == 25
+    assert output.dropped == 15
+    assert output.stats().endswith(' lines/s, 25 lines, 15 dropped')
+
+
+def test_nothing_dropped_while_drained_in_time():
+    output = console.OutputPipeline(max_lines=10)
+    for number in range(8):
+        output.put(str(number))
+    output.drain()
+    assert output.received == 8
+    assert output.dropped == 0
+    assert output.store[7][0] == '7'
@@ -0,0 +1,51 @@
+"""The event loop and the helpers running on it"""
+
+from modules import eventloop
+
+
+def read_all(data, limit):
+    """Feed data to a StreamReader and get what read_lines yields"""
+    async def read():
+        reader = eventloop.asyncio.StreamReader(limit=limit)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [line async for line in eventloop.read_lines(reader)]
+    return eventloop.get_loop().run(read(), timeout=5)
+
+
+def test_lines():
+    assert read_all(b'one\ntwo\nlast', 16) == [b'one\n', b'two\n', b'last']
+
+
+def test_long_line_is_kept():
+    lines = read_all(b'A' * 40 + b'\nshort\n', 16)
+    assert lines[-1] == b'short\n'
+    assert b''.join(lines[:-1]).rstrip(b'\n') == b'A' * 40
+    assert b'\n' not in lines
+
+
+def test_long_line_without_newline():
+    lines = read_all(b'B' * 40, 16)
+    assert b''.join(lines) == b'B' * 40
+
+
+def test_line_split_while_arriving():
+    async def read():
+        reader = eventloop.asyncio.StreamReader(limit=16)
+        lines = []
+
+        async def collect():
+            async for line in eventloop.read_lines(reader):
+                lines.append(line)
+        task = eventloop.asyncio.ensure_future(collect())
+        for _ in range(5):
+            reader.feed_data(b'C' * 10)
+            await eventloop.asyncio.sleep(0)
+        reader.feed_data(b'\nend\n')
+        reader.feed_eof()
+        await task
+        return lines
+    lines = eventloop.get_loop().run(read(), timeout=5)
+    assert lines[-1] == b'end\n'
+    assert b''.join(lines[:-1]).rstrip(b'\n') == b'C' * 50
+    assert b'\n' not in lines
@@ -0,0 +1,43 @@
+"""Planning failures and setting their parameters on a vehicle"""
+
+import pytest
+
+from modules import eventloop
+from modules import failures
+
+PARAMS = {'SIM_GPS_DISABLE': 0.0, 'SIM_ARSPD_FAIL': 0.0}
+
+
+def injector(link):
+    injector = failures.Injector(0, [])
+    injector._connection = link
+    return injector
+
+
+def test_set_parameter(fake_link):
+    link = fake_link(PARAMS)
+    value = eventloop.get_loop().run(
+        injector(link)._param('SIM_GPS_DISABLE', 1), timeout=10)
+    assert value == 1.0
+    assert link.params['SIM_GPS_DISABLE'] == 1.0
+
+
+def test_refused_value_is_an_error(fake_link):
+    link = fake_link(PARAMS, refuse=['SIM_ARSPD_FAIL'])
+    with pytest.raises(failures.FailureError, match='not set'):
+        eventloop.get_loop().run(
+            injector(link)._param('SIM_ARSPD_FAIL', 1), timeout=10)
+
+
+def test_plan_is_repeatable():
+    names = list(failures.FAILURES)
+    first = failures.plan('123456/0', names, 2, 60, 300, 30)
+    assert first == failures.plan('123456/0', names, 2, 60, 300, 30)
+    assert [action for _, action, _ in first].count('inject') == 2
+
+
+def test_engine_overheat_needs_the_efi_script():
+    names = list(failures.FAILURES)
+    assert 'Engine overheat' not in failures.available(
+        names, lambda path: False)
+    assert failures.available(names, lambda path: True) == names
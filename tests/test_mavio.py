@@ -0,0 +1,65 @@
+"""Connecting MAVLink streams from tasks on the event loop"""
+
+import socket
+import threading
+
+from modules import eventloop
+from modules import mavio
+
+
+class Connect(eventloop.LoopTask):
+    def __init__(self, port, heartbeat_timeout=None):
+        super().__init__()
+        self.port = port
+        self.heartbeat_timeout = heartbeat_timeout
+        self.connection = None
+
+    async def run(self):
+        self.connection = await mavio.connect(
+            '127.0.0.1', self.port, self, self.heartbeat_timeout)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_stop_while_nothing_listens():
+    task = Connect(free_port())
+    retried = threading.Event()
+    sleep = task.sleep
+
+    async def sleep_between_attempts(seconds=None):
+        retried.set()
+        return await sleep(seconds)
+    task.sleep = sleep_between_attempts
+    task.start()
+    # Still trying after the first attempt failed
+    assert retried.wait(5)
+    assert not task.done.is_set()
+    task.stop()
+    assert task.done.wait(5)
+    assert task.connection is None
+
+
+def test_target_from_heartbeat():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def vehicle():
+        conn, _ = listener.accept()
+        mav = mavio.ardupilotmega.MAVLink(conn.makefile('wb', buffering=0),
+                                          srcSystem=7, srcComponent=1)
+        mav.heartbeat_send(1, 3, 0, 0, 0)
+        conn.recv(1)
+        conn.close()
+
+    threading.Thread(target=vehicle, daemon=True).start()
+    task = Connect(listener.getsockname()[1], heartbeat_timeout=2)
+    task.start()
+    assert task.done.wait(5)
+    assert task.connection.target == (7, 1)
+    task.event_loop.call(task.connection.close)
+    listener.close()
@@ -0,0 +1,109 @@
+"""
+min_params.py against the mavparm based script it replaced, on files with
+the lines mavparm treats specially
+"""
+
+import fnmatch
+import os
+import subprocess
+import sys
+
+import pytest
+
+from modules import params
+
+MIN_PARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                          'tools', 'min_params.py')
+
+DEFAULTS = """\
+# defaults
+Q_ENABLE,1
+RLL_P,0.5
+SERVO1_MIN,1100
+ARSPD_OFFSET,0
+CMD_TOTAL,0
+FORMAT_VERSION,13
+STAT_RUNTIME,0
+THR_MAX,100
+"""
+
+PARAMS = """\
+Q_ENABLE,1
+RLL_P,0.7   # tuned in flight
+SERVO1_MIN 0x20
+ARSPD_OFFSET,2.5
+CMD_TOTAL,12
+FORMAT_VERSION,16
+STAT_RUNTIME,3600
+THR_MAX,100
+"""
+
+
+def old_min_params(defaults_path, params_path):
+    """The lines printed by the mavparm based min_params.py"""
+    mavparm = pytest.importorskip('pymavlink.mavparm')
+    p1 = mavparm.MAVParmDict()
+    p2 = mavparm.MAVParmDict()
+    p1.load(defaults_path)
+    p2.load(params_path)
+    include_list = params.INCLUDE_PARAMS
+    exclude_list = params.EXCLUDE_PARAMS + params.CALIBRATION_PARAMS
+
+    def in_list(p, lst):
+        return any(fnmatch.fnmatch(p, e) for e in lst)
+
+    lines = []
+    for p in p2:
+        if in_list(p, exclude_list) and not in_list(p, include_list):
+            continue
+        if p not in p1:
+            continue
+        if p1[p] == p2[p] and not in_list(p, include_list):
+            continue
+        lines.append("%s,%s" % (p, params.format_value(p2[p])))
+    return lines
+
+
+def new_min_params(defaults_path, params_path):
+    output = subprocess.run(
+        [sys.executable, MIN_PARAMS,
+         defaults_path, params_path],
+        check=True, capture_output=True, text=True)
+    assert 'WARNING' not in output.stderr
+    return output.stdout.splitlines()
+
+
+def write(path, text):
+    path.write_text(text, encoding='UTF-8')
+    return str(path)
+
+
+def test_same_output_as_mavparm(tmp_path):
+    defaults = write(tmp_path / 'defaults.param', DEFAULTS)
+    vehicle = write(tmp_path / 'vehicle.param', PARAMS)
+    expected = old_min_params(defaults, vehicle)
+    assert expected == ['Q_ENABLE,1', 'RLL_P,0.7', 'SERVO1_MIN,32']
+    assert new_min_params(defaults, vehicle) == expected
+
+
+def test_qgc_params_file(tmp_path):
+    defaults = write(tmp_path / 'defaults.param', DEFAULTS)
+    vehicle = write(tmp_path / 'vehicle.params', """\
+# Onboard parameters for Vehicle 1
+#
+# Vehicle-Id Component-Id Name Value Type
+1\t1\tQ_ENABLE\t1\t2
+1\t1\tRLL_P\t0.699999988079071\t9
+1\t1\tTHR_MAX\t100\t2
+""")
+    assert new_min_params(defaults, vehicle) == [
+        'Q_ENABLE,1', 'RLL_P,0.699999988079071']
+
+
+def test_invalid_value_is_reported(tmp_path):
+    defaults = write(tmp_path / 'defaults.param', DEFAULTS)
+    vehicle = write(tmp_path / 'vehicle.param', 'RLL_P,fast\n')
+    output = subprocess.run(
+        [sys.executable, MIN_PARAMS,
+         defaults, vehicle], check=True, capture_output=True, text=True)
+    assert 'invalid value fast for RLL_P' in output.stderr
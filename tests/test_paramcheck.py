@@ -0,0 +1,37 @@
+"""Fetching and checking the parameters of a vehicle"""
+
+from modules import eventloop
+from modules import paramcheck
+
+PARAMS = {'P_{:02d}'.format(index): float(index) for index in range(20)}
+
+
+def read_requests(link):
+    return sorted(msg.param_index for msg in link.received
+                  if msg.get_type() == 'PARAM_REQUEST_READ')
+
+
+def test_missing_indices_are_requested_again(fake_link):
+    link = fake_link(PARAMS, drop=[3, 7])
+    values, missing = eventloop.get_loop().run(
+        paramcheck.fetch_params(link, link.target), timeout=10)
+    assert values == PARAMS
+    assert missing == []
+    assert read_requests(link) == [3, 7]
+
+
+def test_indices_never_sent_are_missing(fake_link):
+    link = fake_link(PARAMS, lost=[5])
+    values, missing = eventloop.get_loop().run(
+        paramcheck.fetch_params(link, link.target), timeout=10)
+    assert missing == [5]
+    assert 'P_05' not in values
+    # Asked for once per retry before giving up
+    assert read_requests(link) == [5] * paramcheck.RETRIES
+
+
+def test_fetch_named_gets_the_names_that_exist(fake_link):
+    link = fake_link(PARAMS)
+    values = eventloop.get_loop().run(paramcheck.fetch_named(
+        link, link.target, ['P_01', 'NOT_THERE']), timeout=10)
+    assert values == {'P_01': 1.0}
@@ -0,0 +1,36 @@
+"""Runs of the headless scenario matrix"""
+
+import os
+
+import run_matrix
+from modules import sitl
+
+
+def test_variants_do_not_share_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_matrix, 'MATRIX_RUN_DIR', str(tmp_path))
+    seen = []
+
+    def prepare(self, warm=False):
+        # What the run finds, then what SITL leaves behind when it saves
+        # its parameters and writes a log
+        seen.append(sorted(os.listdir(self.cwd)) if os.path.isdir(self.cwd)
+                    else [])
+        os.makedirs(os.path.join(self.cwd, 'logs'), exist_ok=True)
+        with open(os.path.join(self.cwd, 'eeprom.bin'), 'wb') as f:
+            f.write(b'saved by ' + str(self.param_overrides).encode())
+        with open(os.path.join(self.cwd, 'defaults.param'), 'w') as f:
+            f.write('')
+
+    def start(self):
+        raise OSError('not started')
+
+    monkeypatch.setattr(sitl.SitlInstance, 'prepare', prepare)
+    monkeypatch.setattr(sitl.SitlInstance, 'start', start)
+    run = {'aircraft': 'Plane', 'key': 'plane', 'version': '4.3.1',
+           'airport': 'Field', 'location': '0,0,0,0'}
+    for value in (1, 2):
+        result = run_matrix.run_one(dict(run, params={'Q_ENABLE': value}), 0,
+                                    10, None, run_matrix.DEFAULT_READY, 0,
+                                    str(tmp_path))
+        assert result['status'] == 'error'
+    assert seen == [[], ['defaults.param']]
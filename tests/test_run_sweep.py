@@ -0,0 +1,38 @@
+"""Parameter sweeps over headless SITL runs"""
+
+import os
+
+import run_matrix
+import run_sweep
+from modules import sitl
+
+BASE = {'aircraft': 'Plane', 'key': 'plane', 'version': '4.3.1',
+        'airport': 'Field', 'location': '0,0,0,0'}
+
+
+def prepare(self, warm=False):
+    os.makedirs(self.cwd, exist_ok=True)
+
+
+def start(self):
+    # Report what the run found, then save parameters like SITL does
+    found = sorted(os.listdir(self.cwd))
+    with open(os.path.join(self.cwd, 'eeprom.bin'), 'wb') as f:
+        f.write(repr(self.param_overrides).encode())
+    raise OSError(repr(found))
+
+
+def test_every_variant_starts_from_clean_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_matrix, 'MATRIX_RUN_DIR', str(tmp_path))
+    monkeypatch.setattr(sitl.SitlInstance, 'prepare', prepare)
+    monkeypatch.setattr(sitl.SitlInstance, 'start', start)
+    runs = [dict(BASE, params=values)
+            for values in run_sweep.variants({'Q_ENABLE': [0, 1]})]
+    # A second sweep reuses the instance numbers, and so the working
+    # copies, of the first
+    for _ in range(2):
+        for run in runs:
+            result = run_matrix.run_one(run, 0, 10, None,
+                                        run_matrix.DEFAULT_READY, 0,
+                                        str(tmp_path))
+            assert result['error'] == '[]'
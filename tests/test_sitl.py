@@ -0,0 +1,26 @@
+"""Starting and stopping SITL instances from background threads"""
+
+from modules import sitl
+
+
+def test_closed_instance_is_not_started(tmp_path, monkeypatch):
+    def spawn(*args, **kwargs):
+        raise AssertionError('spawned after close')
+    monkeypatch.setattr(sitl.eventloop, 'spawn', spawn)
+    monkeypatch.chdir(tmp_path)
+    instance = sitl.SitlInstance(0, 'plane', '4.3.1', '0,0,0,0', True)
+    instance.close()
+    instance.prepare()
+    instance.start()
+    assert instance.process is None
+
+
+def test_trace_waits_while_starting(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    instance = sitl.SitlInstance(0, 'plane', '4.3.1', '0,0,0,0', True)
+    trace = instance.begin_trace('launch')
+    instance.starting = True
+    assert instance.check_trace() is None
+    instance.starting = False
+    assert instance.check_trace() is trace
+    assert trace.info['status'] == 'exited'
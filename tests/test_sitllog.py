@@ -0,0 +1,24 @@
+"""Classifying SITL output lines"""
+
+from modules import sitllog
+
+
+def test_one_subsystem():
+    assert sitllog.classify('EKF3 IMU0 initialised') == (None, 'ekf')
+    assert sitllog.classify('GPS 1: detected as u-blox') == (None, 'gps')
+    assert sitllog.classify('Lua: State memory usage') == (None, 'script')
+    assert sitllog.classify('Init ArduPlane V4.3.1') == (None, None)
+
+
+def test_first_pattern_wins_not_first_in_line():
+    # The GPS comes first in the text, but it is a pre-arm message
+    assert sitllog.classify('GPS 1: PreArm: Bad GPS Position') \
+        == ('warning', 'prearm')
+    # And the EKF starting to use the GPS is an EKF message
+    assert sitllog.classify('GPS origin set, EKF3 IMU0 is using GPS') \
+        == (None, 'ekf')
+
+
+def test_error_wins_over_warning():
+    assert sitllog.classify('Warning: compass calibration failed') \
+        == ('error', None)
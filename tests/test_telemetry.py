@@ -0,0 +1,47 @@
+"""Columnar telemetry recordings"""
+
+import math
+from array import array
+from types import SimpleNamespace
+
+from modules import telemetry
+
+MESSAGES = {'ATTITUDE': ['roll', 'pitch']}
+
+
+def test_buffer_flushes_and_reads_back(tmp_path):
+    tap = telemetry.TelemetryTap(0, str(tmp_path), messages=MESSAGES)
+    # Fewer rows than written, so the buffer flushes while recording
+    buffer = telemetry.ColumnBuffer(MESSAGES['ATTITUDE'],
+                                    str(tmp_path / 'ATTITUDE.bin'), rows=4)
+    for row in range(10):
+        buffer.append(100.0 + row, SimpleNamespace(roll=row * 0.1,
+                                                   pitch=-row))
+    assert buffer.written == 8
+    buffer.close()
+    tap._write_index({'ATTITUDE': buffer})
+
+    log = telemetry.TelemetryLog(str(tmp_path))
+    try:
+        assert log.messages == ['ATTITUDE']
+        assert log.fields('ATTITUDE') == ['time', 'roll', 'pitch']
+        assert list(log.column('ATTITUDE', 'time')) == [
+            100.0 + row for row in range(10)]
+        assert list(log.column('ATTITUDE', 'pitch')) == [
+            float(-row) for row in range(10)]
+        # Rows from 102 to 104 seconds
+        assert list(log.column('ATTITUDE', 'roll', 102, 104)) == [
+            row * 0.1 for row in range(2, 5)]
+    finally:
+        log.close()
+
+
+def test_missing_field_is_nan(tmp_path):
+    buffer = telemetry.ColumnBuffer(['alt'], str(tmp_path / 'VFR_HUD.bin'))
+    buffer.append(1.0, SimpleNamespace())
+    buffer.close()
+    rows = array('d')
+    with open(str(tmp_path / 'VFR_HUD.bin'), 'rb') as f:
+        rows.fromfile(f, 2)
+    assert rows[0] == 1.0
+    assert math.isnan(rows[1])
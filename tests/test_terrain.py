@@ -0,0 +1,63 @@
+"""The shared terrain tile cache"""
+
+import os
+
+from modules import terrain
+
+# A location whose tiles are all N51W001 and N51E000
+LOCATION = '51.47,-0.1,25,270'
+
+
+def write_tile(folder, name, blocks):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(bytes(terrain.BLOCK_SIZE * blocks))
+    return path
+
+
+def test_stage_copies_the_tiles_around_the_airport(tmp_path):
+    cache = terrain.TerrainCache(str(tmp_path / 'cache'))
+    write_tile(cache.cache_dir, 'N51W001.DAT', 2)
+    write_tile(cache.cache_dir, 'N10E010.DAT', 2)
+    work_dir = str(tmp_path / 'work')
+    # A tile of another site left in the working copy
+    write_tile(os.path.join(work_dir, terrain.TERRAIN_DIR), 'N40W080.DAT', 1)
+
+    staged, missing = cache.stage(LOCATION, work_dir)
+    assert staged == ['N51W001.DAT']
+    assert missing == ['N51E000.DAT']
+    assert sorted(os.listdir(os.path.join(work_dir, terrain.TERRAIN_DIR))) \
+        == ['N51W001.DAT']
+    # The other site was taken into the cache before it was removed
+    assert os.path.isfile(cache.path('N40W080.DAT'))
+
+
+def test_harvest_keeps_the_most_complete_tile(tmp_path):
+    cache = terrain.TerrainCache(str(tmp_path / 'cache'))
+    write_tile(cache.cache_dir, 'N51W001.DAT', 2)
+    terrain_dir = str(tmp_path / 'work' / terrain.TERRAIN_DIR)
+    write_tile(terrain_dir, 'N51W001.DAT', 1)
+    write_tile(terrain_dir, 'N51E000.DAT', 3)
+    # Not a whole number of blocks, so partly written
+    with open(os.path.join(terrain_dir, 'N52E000.DAT'), 'wb') as f:
+        f.write(b'x')
+
+    assert cache.harvest(str(tmp_path / 'work')) == 1
+    assert os.path.getsize(cache.path('N51W001.DAT')) == 2 * terrain.BLOCK_SIZE
+    assert os.path.getsize(cache.path('N51E000.DAT')) == 3 * terrain.BLOCK_SIZE
+    assert not os.path.exists(cache.path('N52E000.DAT'))
+
+
+def test_evict_least_recently_used_first(tmp_path):
+    cache = terrain.TerrainCache(str(tmp_path / 'cache'))
+    for age, name in enumerate(['N03E000.DAT', 'N02E000.DAT',
+                                'N01E000.DAT', 'N00E000.DAT']):
+        path = write_tile(cache.cache_dir, name, 1)
+        # Older the later it comes in the list
+        os.utime(path, (1000 - age * 10, 1000 - age * 10))
+
+    removed = cache.evict(max_bytes=2 * terrain.BLOCK_SIZE,
+                          keep=['N00E000.DAT'])
+    assert removed == ['N01E000.DAT', 'N02E000.DAT']
+    assert cache.usage() == (2, 2 * terrain.BLOCK_SIZE)
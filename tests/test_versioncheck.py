@@ -0,0 +1,32 @@
+"""The release check and its cache"""
+
+import json
+
+import requests
+
+from modules import versioncheck
+
+URL = 'https://api.github.com/repos/owner/repo/releases/latest'
+
+
+def offline(*args, **kwargs):
+    raise requests.exceptions.ConnectionError('offline')
+
+
+def test_stale_cache_is_used_when_offline(tmp_path, monkeypatch):
+    cache_file = str(tmp_path / 'cache.json')
+    with open(cache_file, 'w') as f:
+        json.dump({'url': URL, 'tag_name': 'v1.2', 'etag': 'x',
+                   'checked': 0}, f)
+    monkeypatch.setattr(requests, 'get', offline)
+    assert versioncheck.fetch_latest_version(
+        'owner', 'repo', cache_file=cache_file) == 'v1.2'
+    # Still stale, so the next check asks GitHub again
+    with open(cache_file) as f:
+        assert json.load(f)['checked'] == 0
+
+
+def test_nothing_cached_when_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr(requests, 'get', offline)
+    assert versioncheck.fetch_latest_version(
+        'owner', 'repo', cache_file=str(tmp_path / 'cache.json')) is None
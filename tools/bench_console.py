@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+'''
+benchmark the console view by replaying a recorded SITL session, or a
+synthetic one, through the output pipeline one frame at a time
+
+Sessions are the .log segments in logs/sessions (or any text files). With
+--view text the old approach of inserting every line into a Text widget is
+measured instead, for comparison. --view model measures the pipeline and
+view model without Tk, for machines with no display.
+'''
+
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import console
+
+# A rough mix of SITL output for synthetic sessions
+SYNTHETIC_LINES = [
+    'Init ArduPlane V4.3.1 (a74b7d4b)',
+    'EKF3 IMU0 initialised',
+    'EKF3 IMU0 is using GPS',
+    'GPS 1: detected as u-blox at 230400 baud',
+    'PreArm: Airspeed 1 not healthy',
+    'Lua: State memory usage: 4824 + 5152',
+    'EFI: SITL loaded',
+    'QASSIST',
+    'Mode QLOITER',
+    'Throttle armed',
+    'validate_structures:528: Validating structures',
+    'bind port 5760 for SERIAL0',
+    'Waiting for connection ....',
+    'Internal Error: bad argument',
+    'Failsafe. Short event on: type=1/reason=3',
+]
+
+
+def read_session(paths):
+    """Yield the lines of session segments or text files, in order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.log')))
+        else:
+            files += sorted(glob.glob(path)) or [path]
+    for name in files:
+        with open(name, 'r', encoding='UTF-8', errors='replace') as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+
+def synthetic_session(hours, rate):
+    """Yield the lines of a session of hours at rate lines per second"""
+    lines = itertools.cycle(SYNTHETIC_LINES)
+    for number in range(int(hours * 3600 * rate)):
+        yield '{:.3f} {}'.format(number / rate, next(lines))
+
+
+class TextView:
+    """The previous console, a Text holding every stored line"""
+    def __init__(self, root, max_lines):
+        import tkinter as tk
+        self.text = tk.Text(root, wrap='none', state='disabled')
+        self.text.pack(fill='both', expand=True)
+        self.max_lines = max_lines
+
+    def show(self, batch):
+        if not batch:
+            return
+        self.text.config(state='normal')
+        self.text.insert('end', '\n'.join(batch) + '\n')
+        excess = int(self.text.index('end-1c').split('.')[0]) - 1
+        excess -= self.max_lines
+        if excess > 0:
+            self.text.delete('1.0', '{}.0'.format(excess + 1))
+        self.text.see('end')
+        self.text.config(state='disabled')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(lines, view='virtual', per_frame=1000, max_lines=console.MAX_LINES):
+    """
+    Replay lines in frames of per_frame lines, timing the drain and redraw
+    of every frame. Returns a dict of results.
+    """
+    output = console.OutputPipeline(max_lines)
+    root = None
+    if view == 'virtual':
+        import tkinter as tk
+        from modules import consoleview
+        root = tk.Tk()
+        widget = consoleview.VirtualConsole(root, output.store)
+        widget.pack(fill='both', expand=True)
+        show = lambda batch: widget.refresh()
+    elif view == 'text':
+        import tkinter as tk
+        root = tk.Tk()
+        widget = TextView(root, max_lines)
+        show = widget.show
+    else:
+        from modules import consoleview
+        model = consoleview.ConsoleModel(output.store)
+        show = lambda batch: (model.update(), model.window(50))
+    if root is not None:
+        root.geometry('1000x700')
+        root.update()
+
+    frame_times = []
+    total = 0
+    start = time.perf_counter()
+    lines = iter(lines)
+    while True:
+        frame = list(itertools.islice(lines, per_frame))
+        if not frame:
+            break
+        for line in frame:
+            output.put(line)
+        frame_start = time.perf_counter()
+        show(output.drain())
+        if root is not None:
+            root.update()
+        frame_times.append(time.perf_counter() - frame_start)
+        total += len(frame)
+    duration = time.perf_counter() - start
+
+    result = {
+        'view': view,
+        'lines': total,
+        'frames': len(frame_times),
+        'lines_per_sec': total / duration if duration else 0.0,
+        'frame_p50_ms': percentile(frame_times, 0.5) * 1000,
+        'frame_p99_ms': percentile(frame_times, 0.99) * 1000,
+        'frame_max_ms': max(frame_times) * 1000,
+        # Late frames against the first and last tenth show if the cost of a
+        # frame grows with the lines received
+        'first_tenth_ms': sum(frame_times[:len(frame_times) // 10 or 1]) /
+                          (len(frame_times) // 10 or 1) * 1000,
+        'last_tenth_ms': sum(frame_times[-(len(frame_times) // 10 or 1):]) /
+                         (len(frame_times) // 10 or 1) * 1000,
+    }
+    # Memory is only reported with psutil installed
+    try:
+        import psutil
+        result['rss_mb'] = psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    if root is not None:
+        root.destroy()
+    return result
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("sessions", nargs='*',
+                        help="session folders, segments or text files")
+    parser.add_argument("--hours", type=float, default=3,
+                        help="length of the synthetic session")
+    parser.add_argument("--rate", type=float, default=50,
+                        help="lines per second of the synthetic session")
+    parser.add_argument("--view", choices=['virtual', 'text', 'model'],
+                        default='virtual')
+    parser.add_argument("--per-frame", type=int, default=1000,
+                        help="lines replayed per frame")
+    parser.add_argument("--max-lines", type=int, default=console.MAX_LINES,
+                        help="lines kept by the pipeline")
+    parser.add_argument("--json", action='store_true', help="print JSON")
+    args = parser.parse_args()
+
+    if args.sessions:
+        lines = read_session(args.sessions)
+    else:
+        lines = synthetic_session(args.hours, args.rate)
+    result = run(lines, args.view, args.per_frame, args.max_lines)
+    if args.json:
+        print(json.dumps(result))
+        return
+    print("%s view: %d lines, %.0f lines/s" % (
+        result['view'], result['lines'], result['lines_per_sec']))
+    print("Frame: p50 %.2f ms, p99 %.2f ms, max %.2f ms, "
+          "first tenth %.2f ms, last tenth %.2f ms" % (
+              result['frame_p50_ms'], result['frame_p99_ms'],
+              result['frame_max_ms'], result['first_tenth_ms'],
+              result['last_tenth_ms']))
+    if 'rss_mb' in result:
+        print("Memory: RSS %.1f MB" % result['rss_mb'])
+
+
+if __name__ == '__main__':
+    main()
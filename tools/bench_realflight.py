@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+'''
+benchmark the RealFlight SOAP client against the local FlightAxis stand-in
+'''
+
+import json
+import os
+import sys
+import time
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import realflight
+from modules.flightaxis_sim import FlightAxisServer
+
+
+def bench_exchange(client, count):
+    """Send count ExchangeData messages back to back"""
+    stream = realflight.ExchangeDataStream(client, window=count)
+    servos = [0.5] * realflight.NUM_CHANNELS
+    for _ in range(count):
+        stream.exchange(servos)
+    return stream.stats
+
+
+def bench_reset(client, count):
+    """Time count full reset sequences, returning the mean in seconds"""
+    start = time.perf_counter()
+    for _ in range(count):
+        realflight.reset_aircraft(client)
+    return (time.perf_counter() - start) / count
+
+
+def run(messages=5000, resets=100, port=None, close_after_reply=False):
+    """Run the benchmark, against the stand-in unless a port is given"""
+    server = None
+    if port is None:
+        server = FlightAxisServer(port=0, close_after_reply=close_after_reply)
+        server.start()
+        port = server.address[1]
+    try:
+        with realflight.FlightAxisClient(port=port) as client:
+            realflight.reset_aircraft(client)
+            stats = bench_exchange(client, messages)
+            # The rate is measured up to when it is read, so read it before
+            # the resets run
+            rate = stats.rate
+            reset_time = bench_reset(client, resets)
+    finally:
+        if server is not None:
+            server.stop()
+    return {
+        'messages': stats.count,
+        'messages_per_sec': round(rate, 1),
+        'p50_ms': round(stats.percentile(50) * 1000, 3),
+        'p99_ms': round(stats.percentile(99) * 1000, 3),
+        'reset_ms': round(reset_time * 1000, 3),
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000,
+                        help="number of ExchangeData messages")
+    parser.add_argument("--resets", type=int, default=100,
+                        help="number of reset sequences")
+    parser.add_argument("--port", type=int, default=None,
+                        help="benchmark a running server on this port")
+    parser.add_argument("--close", action='store_true',
+                        help="stand-in closes the connection after every reply")
+    parser.add_argument("--json", action='store_true', help="print JSON")
+    args = parser.parse_args()
+
+    result = run(args.messages, args.resets, args.port, args.close)
+    if args.json:
+        print(json.dumps(result))
+        return
+    print("ExchangeData: %d msgs, %.0f msgs/s, p50 %.3f ms, p99 %.3f ms" % (
+        result['messages'], result['messages_per_sec'], result['p50_ms'],
+        result['p99_ms']))
+    print("Reset sequence: %.3f ms" % result['reset_ms'])
+
+
+if __name__ == '__main__':
+    main()
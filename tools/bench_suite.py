@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+'''
+benchmark the launcher's hot paths without ArduPilot or RealFlight, and
+compare the results against a saved baseline
+
+The console benchmark replays a synthetic SITL session (or recorded session
+files) through the output pipeline and view model, the catalog benchmark
+scans a synthetic config.ini with many aircraft and airports, the params
+benchmark parses, factors and diffs large synthetic parameter files, the
+realflight benchmark runs the SOAP client against the local FlightAxis
+stand-in and the airports benchmark searches a synthetic airport database.
+
+Every run is appended to logs/benchmarks/history.jsonl. With --save the
+results become the baseline, otherwise they are compared with it and the
+exit code is 1 if any timing got worse by more than --tolerance.
+'''
+
+import configparser
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from argparse import ArgumentParser
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOLS_DIR, '..'))
+
+from modules import airports
+from modules import catalog
+from modules import params
+from modules import realflight
+from modules import sitl
+
+import bench_console
+import bench_realflight
+
+BENCH_DIR = os.path.join('logs', 'benchmarks')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+HISTORY_FILE = os.path.join(BENCH_DIR, 'history.jsonl')
+# Relative change of a timing reported as a regression
+TOLERANCE = 0.25
+# Timings are the best of at least this many runs, taking at least
+# MIN_TIME seconds, after one warm-up run. The best run is the least
+# disturbed by whatever else the machine is doing.
+REPEAT = 5
+MIN_TIME = 0.2
+
+
+def measure(function, repeat=REPEAT):
+    """Get the best time of function in milliseconds"""
+    function()
+    times = []
+    total = 0
+    # Like timeit, keep garbage collections of earlier work out of the runs
+    gc.collect()
+    gc.disable()
+    try:
+        while len(times) < repeat or total < MIN_TIME:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+            total += times[-1]
+    finally:
+        gc.enable()
+    return round(min(times) * 1000, 3)
+
+
+def bench_console_replay(args):
+    """Replay SITL output at args.rate lines per second of session time"""
+    if args.sessions:
+        lines = bench_console.read_session(args.sessions)
+    else:
+        lines = bench_console.synthetic_session(args.minutes / 60, args.rate)
+    # A frame holds the lines that arrive at rate between two GUI updates
+    per_frame = max(1, int(args.rate / bench_console.console.FRAME_RATE))
+    result = bench_console.run(lines, 'model', per_frame)
+    return OrderedDict(
+        (key, round(value, 3) if isinstance(value, float) else value)
+        for key, value in result.items() if key != 'view')
+
+
+def _write_config(path, aircraft_count, airport_count, versions):
+    config = configparser.ConfigParser()
+    for index in range(aircraft_count):
+        config['plane{}'.format(index)] = {
+            'type': 'aircraft',
+            'name': 'Plane {}'.format(index),
+            'versions': ', '.join(versions),
+        }
+    rng = random.Random(0)
+    for index in range(airport_count):
+        config['airport{}'.format(index)] = {
+            'type': 'airport',
+            'name': 'Airport {}'.format(index),
+            'location': airports.format_location(
+                rng.uniform(-60, 60), rng.uniform(-180, 180),
+                rng.uniform(0, 2000), rng.randrange(360)),
+        }
+    with open(path, 'w', encoding='UTF-8') as f:
+        config.write(f)
+
+
+def bench_catalog(args):
+    """Scan and reload the catalog of a large synthetic install"""
+    versions = ['4.1.7', '4.3.1', '4.4.1']
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        # The catalog works relative to the launcher folder
+        os.chdir(root)
+        try:
+            os.makedirs('config')
+            os.makedirs(sitl.BIN_DIR)
+            for version in versions:
+                open(os.path.join(sitl.BIN_DIR, sitl.exe_name(version)),
+                     'w').close()
+            for index in range(args.aircraft):
+                key_dir = os.path.join(params.PARAMS_DIR,
+                                       'plane{}'.format(index))
+                os.makedirs(key_dir)
+                for version in versions:
+                    for headless in (True, False):
+                        name = params.layer_names(version, headless)[-1]
+                        with open(os.path.join(key_dir, name), 'w') as f:
+                            f.write('SIM_SPEEDUP,1\n')
+            _write_config(catalog.CONFIG_FILE, args.aircraft, args.airports,
+                          versions)
+
+            parser = configparser.ConfigParser()
+            result = OrderedDict()
+            result['aircraft'] = args.aircraft
+            result['airports'] = args.airports
+            result['config_parse_ms'] = measure(
+                lambda: parser.read(catalog.CONFIG_FILE))
+            result['scan_ms'] = measure(catalog.scan)
+            catalog.Catalog.load()
+            # Startup reads the index while nothing changed
+            result['load_ms'] = measure(catalog.Catalog.load)
+        finally:
+            os.chdir(cwd)
+    return result
+
+
+def _param_files(count, variants):
+    """Generate count parameters for each variant, mostly shared"""
+    rng = random.Random(0)
+    names = ['PARAM_{:05d}'.format(index) for index in range(count)]
+    base = {name: rng.choice(['0', '1', '{:.4f}'.format(rng.uniform(-100, 100))])
+            for name in names}
+    files = {}
+    for variant in variants:
+        values = dict(base)
+        for name in rng.sample(names, count // 20):
+            values[name] = '{:.4f}'.format(rng.uniform(-100, 100))
+        files[variant] = '\n'.join(
+            '{},{}'.format(name, value) for name, value in values.items())
+    return files
+
+
+def bench_params(args):
+    """Parse, factor and diff large synthetic parameter files"""
+    variants = [(version, headless) for version in ('4.3.1', '4.4.1')
+                for headless in (True, False)]
+    texts = _param_files(args.params, variants)
+    parsed = {variant: params.parse_text(text)
+              for variant, text in texts.items()}
+    first = parsed[variants[0]]
+    defaults = params.as_values(first)
+    values = params.as_values(parsed[variants[-1]])
+
+    result = OrderedDict()
+    result['params'] = args.params
+    result['parse_ms'] = measure(lambda: params.parse_text(texts[variants[0]]))
+    result['render_ms'] = measure(first.render)
+    result['factor_ms'] = measure(lambda: params.factor(parsed))
+    result['non_defaults_ms'] = measure(
+        lambda: params.non_defaults(defaults, values))
+    return result
+
+
+def bench_soap(args):
+    """Run the SOAP client against the FlightAxis stand-in"""
+    # Baselines saved while the rate still counted the reset phase have it
+    # as messages_per_sec, so it is renamed to leave those uncompared
+    result = OrderedDict(
+        ('exchange_per_sec' if metric == 'messages_per_sec' else metric, value)
+        for metric, value in bench_realflight.run(args.messages,
+                                                  args.resets).items())
+    template = realflight.ExchangeDataTemplate()
+    servos = [0.5] * realflight.NUM_CHANNELS
+    count = 10000
+    result['template_encode_us'] = round(measure(
+        lambda: [template.encode(servos) for _ in range(count)]) / count * 1000, 3)
+    result['encode_request_us'] = round(measure(
+        lambda: [realflight.encode_request('RestoreOriginalControllerDevice',
+                                           realflight.RESTORE_BODY)
+                 for _ in range(count)]) / count * 1000, 3)
+    return result
+
+
+def bench_airports(args):
+    """Build and search a synthetic airport database"""
+    rng = random.Random(0)
+    rows = [('Field {} ({})'.format(index, 'K{:05d}'.format(index)),
+             'K{:05d}'.format(index), rng.uniform(-60, 60),
+             rng.uniform(-180, 180), rng.uniform(0, 2000), rng.randrange(360))
+            for index in range(args.airport_db)]
+    with tempfile.TemporaryDirectory() as root:
+        db_file = os.path.join(root, 'airports.sqlite')
+        result = OrderedDict()
+        result['airports'] = args.airport_db
+        result['build_ms'] = measure(lambda: airports.build(rows, db_file), 1)
+        db = airports.AirportDB(db_file)
+        try:
+            result['open_ms'] = measure(lambda: airports.AirportDB(db_file))
+            result['prefix_search_ms'] = measure(lambda: db.search('field 12'))
+            result['word_search_ms'] = measure(lambda: db.search('k0001'))
+            result['lookup_ms'] = measure(
+                lambda: db.location('Field 7 (K00007)'))
+        finally:
+            db.close()
+    return result
+
+
+def _reference_work():
+    total = 0
+    for number in range(200000):
+        total += number * number % 7
+    return total
+
+
+def calibrate():
+    """
+    Time a fixed piece of pure Python work. Timings are compared relative
+    to it, so a machine that is busier or clocked lower than when the
+    baseline was saved does not show up as a regression of everything.
+    """
+    return measure(_reference_work)
+
+
+BENCHMARKS = OrderedDict([
+    ('console', bench_console_replay),
+    ('catalog', bench_catalog),
+    ('params', bench_params),
+    ('realflight', bench_soap),
+    ('airports', bench_airports),
+])
+
+
+def direction(metric):
+    """
+    1 if a metric is better higher, -1 if better lower, 0 if it is not
+    compared. Maximums and 99th percentiles are reported but left out, as
+    they are too noisy to compare.
+    """
+    if 'max' in metric or 'p99' in metric:
+        return 0
+    if metric.endswith('_per_sec'):
+        return 1
+    if metric.endswith(('_ms', '_us')):
+        return -1
+    return 0
+
+
+def compare(baseline, results, tolerance=TOLERANCE, scale=1.0):
+    """
+    Compare results with a baseline, both dictionaries of benchmark name to
+    metrics. New timings are divided by scale, the calibration time of the
+    run relative to that of the baseline. Returns a list of (benchmark,
+    metric, old, new, change) of every compared metric, and the list of
+    those that regressed.
+    """
+    changes = []
+    regressions = []
+    for name, metrics in results.items():
+        old_metrics = baseline.get(name, {})
+        for metric, new in metrics.items():
+            sign = direction(metric)
+            old = old_metrics.get(metric)
+            if not sign or not old:
+                continue
+            adjusted = new * scale if sign > 0 else new / scale
+            change = (adjusted - old) / old
+            changes.append((name, metric, old, new, change))
+            if -sign * change > tolerance:
+                regressions.append((name, metric, old, new, change))
+    return changes, regressions
+
+
+def environment():
+    return OrderedDict([
+        ('time', datetime.datetime.now().isoformat(timespec='seconds')),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('machine', platform.node()),
+    ])
+
+
+def main():
+    # String hashing is randomized per process, which changes the order of
+    # sets and so the timings of some benchmarks from run to run
+    if os.environ.get('PYTHONHASHSEED') is None:
+        env = dict(os.environ, PYTHONHASHSEED='0')
+        sys.exit(subprocess.call([sys.executable] + sys.argv, env=env))
+
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs='*',
+                        help="benchmarks to run, all by default: %s" % ', '.join(
+                            BENCHMARKS))
+    parser.add_argument("--quick", action='store_true',
+                        help="smaller sizes, for a quick check")
+    parser.add_argument("--sessions", nargs='*', default=[],
+                        help="session folders or files to replay")
+    parser.add_argument("--rate", type=float, default=200,
+                        help="SITL output lines per second")
+    parser.add_argument("--minutes", type=float, default=30,
+                        help="length of the synthetic session")
+    parser.add_argument("--aircraft", type=int, default=200,
+                        help="aircraft in the synthetic config.ini")
+    parser.add_argument("--airports", type=int, default=500,
+                        help="airports in the synthetic config.ini")
+    parser.add_argument("--params", type=int, default=5000,
+                        help="parameters per synthetic parameter file")
+    parser.add_argument("--messages", type=int, default=5000,
+                        help="ExchangeData messages")
+    parser.add_argument("--resets", type=int, default=100,
+                        help="reset sequences")
+    parser.add_argument("--airport-db", type=int, default=50000,
+                        help="airports in the synthetic airport database")
+    parser.add_argument("--baseline", default=BASELINE_FILE,
+                        help="baseline to compare with or save to")
+    parser.add_argument("--save", action='store_true',
+                        help="save the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--json", action='store_true', help="print JSON")
+    args = parser.parse_args()
+    if args.quick:
+        args.minutes = min(args.minutes, 3)
+        args.aircraft = min(args.aircraft, 20)
+        args.airports = min(args.airports, 50)
+        args.params = min(args.params, 1000)
+        args.messages = min(args.messages, 500)
+        args.resets = min(args.resets, 10)
+        args.airport_db = min(args.airport_db, 5000)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: %s" % name)
+
+    calibration = calibrate()
+    results = OrderedDict()
+    for name in args.benchmarks or BENCHMARKS:
+        if not args.json:
+            print("Running %s..." % name, flush=True)
+        results[name] = BENCHMARKS[name](args)
+    calibration = min(calibration, calibrate())
+
+    run = environment()
+    run['quick'] = args.quick
+    run['calibration_ms'] = calibration
+    run['results'] = results
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(HISTORY_FILE, 'a', encoding='UTF-8') as f:
+        f.write(json.dumps(run) + '\n')
+
+    baseline = None
+    if not args.save and os.path.isfile(args.baseline):
+        with open(args.baseline, 'r', encoding='UTF-8') as f:
+            baseline = json.load(f)
+        if baseline.get('quick') != args.quick:
+            print("WARNING: baseline was run %s --quick" % (
+                'with' if baseline.get('quick') else 'without'))
+    scale = 1.0
+    if baseline and baseline.get('calibration_ms'):
+        scale = calibration / baseline['calibration_ms']
+    changes, regressions = compare(
+        baseline['results'] if baseline else {}, results, args.tolerance,
+        scale)
+
+    if args.json:
+        print(json.dumps({'run': run, 'regressions': regressions}))
+    else:
+        for name, metrics in results.items():
+            print("%s:" % name)
+            for metric, value in metrics.items():
+                print("  %-22s %s" % (metric, value))
+        if baseline:
+            print("Compared with %s from %s, machine %.2fx as slow:" % (
+                args.baseline, baseline.get('time'), scale))
+            for name, metric, old, new, change in changes:
+                flag = ' REGRESSION' if (name, metric, old, new, change) \
+                    in regressions else ''
+                print("  %-10s %-22s %10.3f -> %10.3f %+6.1f%%%s" % (
+                    name, metric, old, new, change * 100, flag))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='UTF-8') as f:
+            json.dump(run, f, indent=1)
+        if not args.json:
+            print("Saved baseline %s" % args.baseline)
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+'''
+import airports from CSV files into the airport database searched by the
+airport selector
+
+Accepts OurAirports airports.csv (with --runways runways.csv for the heading
+of the longest runway) or plain CSV files with name, lat, lon, alt (metres)
+and heading columns. Later files win over earlier ones for the same name.
+'''
+
+import os
+import sys
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import airports
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("csv", nargs='+', help="airport CSV files")
+parser.add_argument("--runways", help="OurAirports runways.csv")
+parser.add_argument("--db", default=airports.DB_FILE, help="database to write")
+parser.add_argument("--show-rejected", action='store_true',
+                    help="list every rejected row")
+args = parser.parse_args()
+
+rows = []
+for path in args.csv:
+    imported, rejected = airports.read_csv(path, args.runways)
+    rows += imported
+    print("%s: %d airports, %d rejected" % (path, len(imported), len(rejected)))
+    if args.show_rejected:
+        for problem in rejected:
+            print("  %s" % problem)
+
+if not rows:
+    sys.exit("ERROR: no airports to import")
+count = airports.build(rows, args.db)
+print("%d airports written to %s" % (count, args.db))
@@ -1,64 +1,124 @@
 #!/usr/bin/env python
 '''
 extract non-default parameters for publishing
+
+With --batch, params may be any number of files, directories or globs (for
+example a folder of vehicle dumps), which are processed in parallel against
+the same defaults.
 '''
 
-from pymavlink import mavparm
-import fnmatch
+import glob
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 from argparse import ArgumentParser
-parser = ArgumentParser(description=__doc__)
-parser.add_argument("defaults", metavar="defaults")
-parser.add_argument("params", metavar="params")
-
-args = parser.parse_args()
-
-p1 = mavparm.MAVParmDict()
-p2 = mavparm.MAVParmDict()
-p1.load(args.defaults)
-p2.load(args.params)
-
-include_list = ['Q_ENABLE', 'Q_FRAME*', 'AFS_*']
-exclude_list = ['AHRS_TRIM_?',
-                '*GND_PRESS',
-                'COMPASS_EXTERN*',
-                'COMPASS_DEC',
-                'COMPASS_DIA*',
-                'COMPASS_ODI*',
-                '*_ABS_PRESS',
-                'SR?_*',
-                'STAT_*',
-                'SYS_NUM_RESETS',
-                '*_DEV_ID',
-                '*_DEVID', ]
-
-# For physical aircraft, we don't want to publish compass or accel calibrations
-if "SIM_OPOS_LAT" not in p2:
-    exclude_list.extend(['COMPASS_OFS*', '', 'INS_*OFFS_?', 'INS_*SCAL_?'])
-
-def in_list(p, lst):
-    for e in lst:
-        if fnmatch.fnmatch(p, e):
-            return True
-    return False
-
-def vstring(v):
-    s = str(v)
-    if s.find('.'):
-        while s[-1] == '0':
-            s = s[:-1]
-    if s[-1] == '.':
-        s = s[:-1]
-    return s
-
-for p in p2:
-    if in_list(p, exclude_list) and not in_list(p, include_list):
-        continue
-    if not p in p1:
-        sys.stderr.write("WARNING: {} not found in defaults\n".format(p))
-        continue
-    if (p1[p] == p2[p] and not in_list(p, include_list)):
-        continue
-
-    print("%s,%s" % (p, vstring(p2[p])))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import params
+
+PARAM_EXTENSIONS = ('.param', '.parm', '.params')
+
+# Defaults loaded once by every worker process
+_defaults = None
+
+
+def load_values(path):
+    """Load a parameter file as a dictionary of name to value"""
+    param_file = params.load(path)
+    values = params.as_values(param_file)
+    for name, param in param_file.items():
+        if name not in values and name not in params.EXCLUDE_LOAD:
+            sys.stderr.write("WARNING: {}: invalid value {} for {}\n".format(
+                path, param.value, name))
+    return values
+
+
+def _init_worker(defaults_path):
+    global _defaults
+    _defaults = load_values(defaults_path)
+
+
+def extract(path):
+    """Get the non-default parameters of one file"""
+    changed, missing = params.non_defaults(_defaults, load_values(path))
+    return path, changed, missing
+
+
+def find_files(sources):
+    """Expand files, directories and globs into a sorted list of files"""
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, names in os.walk(source):
+                files.update(os.path.join(root, name) for name in names
+                             if name.endswith(PARAM_EXTENSIONS))
+        else:
+            files.update(glob.glob(source, recursive=True) or [source])
+    return sorted(files)
+
+
+def run_batch(defaults, sources, out_dir=None, jobs=None):
+    """
+    Extract the non-default parameters of every file in parallel. Writes one
+    minimal file per input into out_dir, or a single report to stdout.
+    """
+    files = find_files(sources)
+    if not files:
+        return 0
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        # Keep names unique when dumps in different folders share a name
+        prefix = os.path.commonpath([os.path.abspath(path) for path in files]) \
+            if len(files) > 1 else os.path.dirname(os.path.abspath(files[0]))
+    else:
+        print("file,param,value")
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(defaults,)) as pool:
+        for path, changed, missing in pool.map(extract, files, chunksize=4):
+            for name in missing:
+                sys.stderr.write("WARNING: {}: {} not found in defaults\n".format(
+                    path, name))
+            if out_dir is None:
+                for name, value in changed:
+                    print("%s,%s,%s" % (path, name, params.format_value(value)))
+                continue
+            rel = os.path.relpath(os.path.abspath(path), prefix)
+            out_path = os.path.join(out_dir, rel.replace(os.sep, '_'))
+            with open(out_path, 'w', encoding='UTF-8', newline='\n') as f:
+                for name, value in changed:
+                    f.write("%s,%s\n" % (name, params.format_value(value)))
+    return len(files)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("defaults", metavar="defaults")
+    parser.add_argument("params", metavar="params", nargs='+')
+    parser.add_argument("--batch", action='store_true',
+                        help="process many files, directories or globs in parallel")
+    parser.add_argument("--out", default=None,
+                        help="batch: write one minimal param file per input here")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="batch: number of worker processes (default all cores)")
+    args = parser.parse_args()
+
+    if args.batch:
+        count = run_batch(args.defaults, args.params, args.out, args.jobs)
+        sys.stderr.write("Processed {} files\n".format(count))
+        return
+
+    if len(args.params) != 1:
+        parser.error("only one params file without --batch")
+    changed, missing = params.non_defaults(
+        load_values(args.defaults), load_values(args.params[0]))
+    for name in missing:
+        sys.stderr.write("WARNING: {} not found in defaults\n".format(name))
+    for name, value in changed:
+        print("%s,%s" % (name, params.format_value(value)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+'''
+move the files of the variant folders in bin/ into the content-addressed
+asset store, writing one manifest per folder
+'''
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import assets
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--bin", default="bin", help="folder with the variant folders")
+parser.add_argument("--out", default=assets.ASSETS_DIR, help="asset store folder")
+parser.add_argument("--remove", action='store_true',
+                    help="delete the variant folders once stored")
+parser.add_argument("--prune", action='store_true',
+                    help="delete stored files no manifest uses")
+args = parser.parse_args()
+
+total = 0
+for folder in sorted(glob.glob(os.path.join(args.bin, '*_*_*'))):
+    if not os.path.isdir(folder):
+        continue
+    name = os.path.basename(folder)
+    manifest = assets.pack(folder, name, args.out)
+    total += len(manifest)
+
+    # Check the folder assembles back to the same files
+    with tempfile.TemporaryDirectory() as check_dir:
+        assets.assemble(name, check_dir, args.out)
+        for rel, digest in manifest.items():
+            if assets.file_hash(os.path.join(check_dir, *rel.split('/'))) != digest:
+                sys.exit("ERROR: {} does not assemble back to {}".format(
+                    name, folder))
+    print("%s: %d files" % (name, len(manifest)))
+
+    if args.remove:
+        shutil.rmtree(folder)
+
+if args.prune:
+    for path in assets.unused_objects(args.out):
+        os.chmod(path, 0o644)
+        os.remove(path)
+        print("pruned %s" % path)
+
+objects = [path for path in glob.glob(os.path.join(args.out, assets.OBJECTS, '*', '*'))]
+print("%d files stored as %d objects" % (total, len(objects)))
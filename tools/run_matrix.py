@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+'''
+run a matrix of aircraft x version x airport headless SITL instances without
+the GUI and write a JSON summary of every run
+'''
+
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from argparse import ArgumentParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from modules import catalog
+from modules import sitl
+
+DEFAULT_READY = sitl.READY_PATTERN
+MATRIX_RUN_DIR = os.path.join(sitl.RUN_DIR, 'matrix')
+# Lines of output kept in the summary of each run
+TAIL_LINES = 20
+
+
+def build_matrix(cat, aircraft=None, versions=None, airports=None):
+    """
+    Get the runs of every available headless aircraft, version and airport,
+    optionally filtered by aircraft names or keys, versions and airports
+    """
+    runs = []
+    for name in cat.aircraft_list:
+        key = cat.aircraft_keys[name]
+        if aircraft and name not in aircraft and key not in aircraft:
+            continue
+        for version in cat.versions[name]:
+            if versions and version not in versions:
+                continue
+            if not cat.available(name, version, True):
+                continue
+            for airport in cat.airport_list:
+                if airports and airport not in airports:
+                    continue
+                runs.append({'aircraft': name, 'key': key, 'version': version,
+                             'airport': airport,
+                             'location': cat.locations[airport]})
+    return runs
+
+
+def run_one(run, instance, timeout, speedup, ready, hold, log_dir,
+            record_telemetry=False):
+    """
+    Launch one instance and wait until its output matches ready, it exits or
+    timeout seconds pass. Parameter overrides are taken from run['params']
+    if present. Every run starts from clean storage, as parameters saved to
+    the eeprom by an earlier run would override them. Returns the run with
+    its results added.
+    """
+    result = dict(run, instance=instance)
+    sitl_instance = sitl.SitlInstance(
+        instance, run['key'], run['version'], run['location'], True,
+        run_dir=MATRIX_RUN_DIR, speedup=speedup,
+        record_telemetry=record_telemetry,
+        param_overrides=run.get('params'))
+    ready_re = re.compile(ready)
+    lines = []
+
+    start = time.monotonic()
+    try:
+        sitl_instance.clear_storage()
+        sitl_instance.prepare()
+        sitl_instance.start()
+    except OSError as err:
+        result.update(status='error', error=str(err), returncode=None,
+                      time_to_ready=None, duration=0.0)
+        return result
+
+    status = 'timeout'
+    time_to_ready = None
+    deadline = start + timeout
+    while time.monotonic() < deadline:
+        for line in sitl_instance.output.drain():
+            lines.append(line)
+            if time_to_ready is None and ready_re.search(line):
+                time_to_ready = time.monotonic() - start
+                status = 'ready'
+                # Keep running a little longer if asked, to catch later errors
+                deadline = min(deadline, time.monotonic() + hold)
+        if not sitl_instance.running:
+            # A crash while holding after ready is still a failure
+            if status != 'ready' or sitl_instance.process.returncode:
+                status = 'exited'
+            break
+        time.sleep(0.05)
+
+    returncode = sitl_instance.process.poll()
+    # Stopping closes the recording
+    telemetry_path = sitl_instance.tap.path if sitl_instance.tap else None
+    sitl_instance.stop()
+    lines.extend(sitl_instance.output.drain())
+
+    log_path = os.path.join(log_dir, '{}_{}_{}.log'.format(
+        sitl_instance.folder, re.sub(r'\W+', '_', run['airport']), instance))
+    with open(log_path, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    result.update(status=status, returncode=returncode,
+                  time_to_ready=time_to_ready,
+                  duration=time.monotonic() - start,
+                  log=log_path, tail=lines[-TAIL_LINES:],
+                  telemetry=telemetry_path)
+    return result
+
+
+def run_matrix(runs, jobs=None, timeout=120, speedup=None, ready=DEFAULT_READY,
+               hold=0, log_dir='matrix_logs', record_telemetry=False):
+    """Run the matrix in a process pool, yielding results in run order"""
+    os.makedirs(log_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Every run gets its own instance number, so concurrent runs never
+        # share ports or working directories
+        futures = [pool.submit(run_one, run, instance, timeout, speedup, ready,
+                               hold, log_dir, record_telemetry)
+                   for instance, run in enumerate(runs)]
+        for future in futures:
+            yield future.result()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--aircraft", nargs='*', help="aircraft names or keys")
+    parser.add_argument("--version", nargs='*', help="ArduPilot versions")
+    parser.add_argument("--airport", nargs='*', help="airport names")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="concurrent instances (default all cores)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="wall-clock seconds allowed per run")
+    parser.add_argument("--speedup", type=float, default=None,
+                        help="SITL speedup factor")
+    parser.add_argument("--ready", default=DEFAULT_READY,
+                        help="regex on SITL output that marks the run ready")
+    parser.add_argument("--hold", type=float, default=0,
+                        help="seconds to keep running after ready")
+    parser.add_argument("--logs", default='matrix_logs', help="log folder")
+    parser.add_argument("--out", default=None,
+                        help="summary file (default stdout)")
+    args = parser.parse_args()
+
+    # Output paths are relative to where we were started, everything else
+    # to the launcher folder
+    log_dir = os.path.abspath(args.logs)
+    out = os.path.abspath(args.out) if args.out else None
+    os.chdir(ROOT)
+
+    runs = build_matrix(catalog.Catalog.load(), args.aircraft, args.version,
+                        args.airport)
+    if not runs:
+        sys.exit("ERROR: nothing to run")
+
+    start = time.monotonic()
+    results = []
+    for result in run_matrix(runs, args.jobs, args.timeout, args.speedup,
+                             args.ready, args.hold, log_dir):
+        results.append(result)
+        sys.stderr.write("%-7s %s %s @ %s\n" % (
+            result['status'], result['aircraft'], result['version'],
+            result['airport']))
+
+    summary = {
+        'runs': results,
+        'passed': sum(result['status'] == 'ready' for result in results),
+        'failed': sum(result['status'] != 'ready' for result in results),
+        'duration': time.monotonic() - start,
+    }
+    if out:
+        with open(out, 'w', encoding='UTF-8') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
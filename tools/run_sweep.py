@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+'''
+sweep parameter overrides of one aircraft version over many headless SITL
+runs in parallel, writing one row of outcome metrics per run to a CSV table
+
+Parameters are given as NAME=1,2,3 for a list of values, NAME=lo:hi:n for n
+evenly spaced values or NAME=lo:hi for a uniform random range (needs
+--sample). Without --sample every combination is run, with it a random
+sample of them. Every run gets its own working copy with the overrides
+written over its composed defaults.param, and starts with no eeprom or
+logs, so no variant loads the parameters an earlier run saved.
+
+Each row holds the overrides, the status and time to ready of the run, the
+errors, warnings and pre-arm failures in its output, any --metric regexes
+(the last number captured, or the number of matching lines) and, with
+--telemetry, any --telemetry-metric statistics of the recorded telemetry.
+'''
+
+import csv
+import itertools
+import math
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from argparse import ArgumentParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from modules import catalog
+from modules import params
+from modules import sitllog
+from modules import telemetry
+
+import run_matrix
+
+STATS = {
+    'min': min,
+    'max': max,
+    'mean': lambda values: sum(values) / len(values),
+    'last': lambda values: values[-1],
+}
+
+
+def parse_param(spec):
+    """
+    Get the name and values of a NAME=1,2,3 or NAME=lo:hi:n parameter, or
+    the name and (lo, hi) range of a NAME=lo:hi one
+    """
+    name, _, values = spec.partition('=')
+    if not name or not values:
+        raise ValueError('expected NAME=values: {}'.format(spec))
+    if ':' in values:
+        bounds = [float(value) for value in values.split(':')]
+        if len(bounds) == 2:
+            return name, tuple(bounds)
+        if len(bounds) != 3 or bounds[2] < 1:
+            raise ValueError('expected NAME=lo:hi or lo:hi:n: {}'.format(spec))
+        low, high, count = bounds[0], bounds[1], int(bounds[2])
+        if count == 1:
+            return name, [low]
+        step = (high - low) / (count - 1)
+        return name, [low + step * index for index in range(count)]
+    return name, [float(value) for value in values.split(',')]
+
+
+def variants(sweep, sample=None, seed=None):
+    """
+    Get the list of override dictionaries of a sweep, every combination of
+    the listed values or a random sample of them. Ranges are drawn from
+    uniformly and need a sample size.
+    """
+    rng = random.Random(seed)
+    names = list(sweep)
+    ranged = [name for name in names if isinstance(sweep[name], tuple)]
+    if ranged:
+        if not sample:
+            raise ValueError('ranges need --sample: {}'.format(', '.join(ranged)))
+        return [OrderedDict(
+            (name, rng.uniform(*sweep[name]) if name in ranged
+             else rng.choice(sweep[name])) for name in names)
+            for _ in range(sample)]
+    grid = list(itertools.product(*(sweep[name] for name in names)))
+    if sample and sample < len(grid):
+        grid = rng.sample(grid, sample)
+    return [OrderedDict(zip(names, values)) for values in grid]
+
+
+def parse_metric(spec):
+    name, _, regex = spec.partition('=')
+    if not name or not regex:
+        raise ValueError('expected NAME=regex: {}'.format(spec))
+    return name, re.compile(regex)
+
+
+def parse_telemetry_metric(spec):
+    """Get the name, message, field and statistic of NAME=MSG.field:stat"""
+    match = re.match(r'(\w+)=(\w+)\.(\w+):(\w+)$', spec)
+    if not match or match.group(4) not in STATS:
+        raise ValueError('expected NAME=MESSAGE.field:{}: {}'.format(
+            '|'.join(STATS), spec))
+    return match.group(1), match.groups()[1:]
+
+
+def output_metrics(log_path, metrics):
+    """Count the errors, warnings and pre-arm failures and apply the regexes"""
+    counts = Counter()
+    values = OrderedDict((name, None) for name, _ in metrics)
+    try:
+        if not log_path:
+            raise OSError('no log')
+        with open(log_path, 'r', encoding='UTF-8', errors='replace') as f:
+            for line in f:
+                severity, subsystem = sitllog.classify(line)
+                counts[severity] += 1
+                counts[subsystem] += 1
+                for name, regex in metrics:
+                    match = regex.search(line)
+                    if match is None:
+                        continue
+                    if regex.groups:
+                        try:
+                            values[name] = float(match.group(1))
+                        except (TypeError, ValueError):
+                            pass
+                    else:
+                        values[name] = (values[name] or 0) + 1
+    except OSError:
+        pass
+    result = OrderedDict([('errors', counts['error']),
+                          ('warnings', counts['warning']),
+                          ('prearm', counts['prearm'])])
+    result.update(values)
+    return result
+
+
+def telemetry_metrics(path, metrics):
+    """Compute statistics of recorded telemetry fields"""
+    values = OrderedDict((name, None) for name, _ in metrics)
+    if not path or not os.path.isdir(path):
+        return values
+    try:
+        with telemetry.TelemetryLog(path) as log:
+            for name, (message, field, stat) in metrics:
+                if message not in log.messages or field not in log.fields(message):
+                    continue
+                column = log.column(message, field)
+                if len(column):
+                    values[name] = STATS[stat](column)
+    except (OSError, ValueError):
+        pass
+    return values
+
+
+def check_names(run, names):
+    """Warn about overridden parameters missing from the composed defaults"""
+    try:
+        defaults = params.compose(run['key'], run['version'], True)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name not in defaults:
+            sys.stderr.write("WARNING: {} is not in the defaults of {} {}\n".format(
+                name, run['aircraft'], run['version']))
+
+
+def format_cell(value):
+    if isinstance(value, float):
+        return '' if math.isnan(value) else '%.6g' % value
+    return '' if value is None else value
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--aircraft", required=True, help="aircraft name or key")
+    parser.add_argument("--version", required=True, help="ArduPilot version")
+    parser.add_argument("--airport", default=None,
+                        help="airport name (default the first)")
+    parser.add_argument("--param", nargs='+', required=True,
+                        help="NAME=1,2,3, NAME=lo:hi:n or NAME=lo:hi")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="number of random variants to run")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random sample")
+    parser.add_argument("--metric", nargs='*', default=[],
+                        help="NAME=regex on the output")
+    parser.add_argument("--telemetry", action='store_true',
+                        help="record telemetry of every run")
+    parser.add_argument("--telemetry-metric", nargs='*', default=[],
+                        help="NAME=MESSAGE.field:%s" % '|'.join(STATS))
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="concurrent instances (default all cores)")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="wall-clock seconds allowed per run")
+    parser.add_argument("--speedup", type=float, default=None,
+                        help="SITL speedup factor")
+    parser.add_argument("--ready", default=run_matrix.DEFAULT_READY,
+                        help="regex on SITL output that marks the run ready")
+    parser.add_argument("--hold", type=float, default=60,
+                        help="seconds to keep running after ready")
+    parser.add_argument("--logs", default='sweep_logs', help="log folder")
+    parser.add_argument("--out", default='sweep_results.csv',
+                        help="results table")
+    parser.add_argument("--dry-run", action='store_true',
+                        help="only list the variants")
+    args = parser.parse_args()
+
+    try:
+        sweep = OrderedDict(parse_param(spec) for spec in args.param)
+        overrides = variants(sweep, args.sample, args.seed)
+        metrics = [parse_metric(spec) for spec in args.metric]
+        telemetry_specs = [parse_telemetry_metric(spec)
+                           for spec in args.telemetry_metric]
+    except ValueError as err:
+        parser.error(str(err))
+    if telemetry_specs and not args.telemetry:
+        parser.error("--telemetry-metric needs --telemetry")
+
+    # Output paths are relative to where we were started, everything else
+    # to the launcher folder
+    log_dir = os.path.abspath(args.logs)
+    out = os.path.abspath(args.out)
+    os.chdir(ROOT)
+
+    cat = catalog.Catalog.load()
+    airport = args.airport or (cat.airport_list or [None])[0]
+    base = run_matrix.build_matrix(cat, [args.aircraft], [args.version],
+                                   [airport])
+    if not base:
+        sys.exit("ERROR: {} {} is not available headless at {}".format(
+            args.aircraft, args.version, airport))
+    check_names(base[0], sweep)
+    runs = [dict(base[0], params=values) for values in overrides]
+
+    if args.dry_run:
+        for number, values in enumerate(overrides):
+            print("%d: %s" % (number, ', '.join(
+                '%s=%s' % (name, params.format_value(value))
+                for name, value in values.items())))
+        return
+
+    columns = (['run', 'status', 'time_to_ready', 'duration', 'returncode']
+               + list(sweep) + ['errors', 'warnings', 'prearm']
+               + [name for name, _ in metrics]
+               + [name for name, _ in telemetry_specs] + ['log', 'telemetry'])
+    start = time.monotonic()
+    failed = 0
+    # Rows are written as soon as they are known, so a stopped sweep keeps
+    # the results so far
+    with open(out, 'w', encoding='UTF-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        results = run_matrix.run_matrix(
+            runs, args.jobs, args.timeout, args.speedup, args.ready,
+            args.hold, log_dir, args.telemetry)
+        for number, result in enumerate(results):
+            row = OrderedDict([
+                ('run', number), ('status', result['status']),
+                ('time_to_ready', result['time_to_ready']),
+                ('duration', result['duration']),
+                ('returncode', result['returncode'])])
+            row.update(result['params'])
+            row.update(output_metrics(result.get('log'), metrics))
+            row.update(telemetry_metrics(result.get('telemetry'),
+                                         telemetry_specs))
+            row['log'] = result.get('log')
+            row['telemetry'] = result.get('telemetry')
+            writer.writerow([format_cell(row[column]) for column in columns])
+            f.flush()
+            failed += result['status'] != 'ready'
+            sys.stderr.write("%d/%d %-7s %s\n" % (
+                number + 1, len(runs), result['status'], ', '.join(
+                    '%s=%s' % (name, params.format_value(value))
+                    for name, value in result['params'].items())))
+
+    sys.stderr.write("%d runs, %d failed, %.0f s, results in %s\n" % (
+        len(runs), failed, time.monotonic() - start, out))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+'''
+split the defaults.param files in bin/ into layered overlays in params/
+'''
+
+import glob
+import os
+import sys
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules import params
+
+LAYER_COMMENTS = {
+    'base.param': 'Parameters shared by every version and mode',
+    'hl.param': 'Parameters shared by every headless version',
+    'rf.param': 'Parameters shared by every RealFlight version',
+}
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("--bin", default="bin", help="folder with the variant folders")
+parser.add_argument("--out", default=params.PARAMS_DIR, help="overlay folder")
+parser.add_argument("--remove", action='store_true',
+                    help="delete the defaults.param files once split")
+args = parser.parse_args()
+
+# Group the variant folders by aircraft: aircraft_version_type
+aircraft = {}
+for path in sorted(glob.glob(os.path.join(args.bin, '*', params.DEFAULTS_FILE))):
+    folder = os.path.basename(os.path.dirname(path))
+    key, version, mode = folder.rsplit('_', 2)
+    aircraft.setdefault(key, {})[version, mode == 'hl'] = path
+
+for key, variants in sorted(aircraft.items()):
+    files = {variant: params.load(path) for variant, path in variants.items()}
+    layers = params.factor(files)
+
+    out_dir = os.path.join(args.out, key)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, layer in sorted(layers.items()):
+        if not layer.comments:
+            layer.comments = [LAYER_COMMENTS.get(
+                name, 'Parameters shared by both modes of ' + name[:-6])]
+        with open(os.path.join(out_dir, name), 'w', encoding='UTF-8',
+                  newline='\n') as f:
+            f.write(layer.render())
+
+    # Check every variant composes back to the original
+    for (version, headless), param_file in files.items():
+        composed = params.compose(key, version, headless, args.out)
+        if composed.params != param_file.params:
+            sys.exit("ERROR: {} {} does not compose back to {}".format(
+                key, version, variants[version, headless]))
+    print("%s: %d variants -> %s" % (key, len(files), ', '.join(sorted(layers))))
+
+    if args.remove:
+        for path in variants.values():
+            os.remove(path)
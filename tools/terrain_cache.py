@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+'''
+manage the shared terrain tile cache
+
+status lists the cached tiles and, for every airport in config.ini, which of
+its tiles are cached. prewarm fills the cache with the tiles of the airports
+from folders of .DAT tiles (for example a ground station terrain folder or
+the output of ArduPilot's Tools/scripts/terrain/create_terrain.py for local
+DEM files) and from the working copies of earlier runs. evict trims the
+cache to a size.
+'''
+
+import glob
+import os
+import sys
+
+from argparse import ArgumentParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from modules import catalog
+from modules import sitl
+from modules import terrain
+
+
+def airport_tiles(cat, names=None):
+    """Get the tiles of every airport, or of the named ones"""
+    tiles = {}
+    for name in names or cat.airport_list:
+        location = cat.location(name)
+        if location is None:
+            sys.exit("ERROR: unknown airport: {}".format(name))
+        tiles[name] = terrain.location_tiles(location)
+    return tiles
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=['status', 'prewarm', 'evict'])
+    parser.add_argument("--airport", nargs='*',
+                        help="airports (default every airport in config.ini)")
+    parser.add_argument("--from", dest='sources', nargs='*', default=[],
+                        help="folders of .DAT tiles to prewarm from")
+    parser.add_argument("--all", action='store_true',
+                        help="prewarm every tile in the folders, not only "
+                             "those of the airports")
+    parser.add_argument("--max-mb", type=float, default=None,
+                        help="cache size limit (default %d MB)" % (
+                            terrain.MAX_BYTES // 2**20))
+    parser.add_argument("--cache", default=None, help="cache folder")
+    args = parser.parse_args()
+
+    # Source folders are relative to where we were started, everything else
+    # to the launcher folder
+    sources = [os.path.abspath(source) for source in args.sources]
+    cache_dir = os.path.abspath(args.cache) if args.cache else None
+    os.chdir(ROOT)
+
+    max_bytes = (terrain.MAX_BYTES if args.max_mb is None
+                 else int(args.max_mb * 2**20))
+    cache = terrain.TerrainCache(cache_dir or terrain.CACHE_DIR, max_bytes)
+    tiles = airport_tiles(catalog.Catalog.load(), args.airport)
+    wanted = sorted({name for names in tiles.values() for name in names})
+
+    if args.command == 'prewarm':
+        added = 0
+        for source in sources:
+            if not os.path.isdir(source):
+                sys.exit("ERROR: not a folder: {}".format(source))
+            added += cache.add_folder(source, None if args.all else wanted)
+        # Tiles completed by earlier runs
+        for work_dir in glob.glob(os.path.join(sitl.RUN_DIR, '**', terrain.TERRAIN_DIR),
+                                  recursive=True):
+            added += cache.add_folder(work_dir, None if args.all else wanted)
+        print("Added %d tiles" % added)
+        removed = cache.evict(keep=wanted)
+        if removed:
+            print("Evicted %d tiles: %s" % (len(removed), ', '.join(removed)))
+    elif args.command == 'evict':
+        removed = cache.evict()
+        print("Evicted %d tiles" % len(removed))
+
+    cached = {name for name, _, _ in cache.tiles()}
+    for airport, names in sorted(tiles.items()):
+        missing = [name for name in names if name not in cached]
+        print("%-30s %d/%d tiles%s" % (
+            airport, len(names) - len(missing), len(names),
+            ', missing ' + ', '.join(missing) if missing else ''))
+    count, size = cache.usage()
+    print("Cache %s: %d tiles, %.1f of %.0f MB" % (
+        cache.cache_dir, count, size / 2**20, cache.max_bytes / 2**20))
+
+
+if __name__ == '__main__':
+    main()